@@ -1,11 +1,50 @@
 import streamlit as st
+import g1
 from g1 import generate_response
+from context_window import ContextCompactor
+from self_consistency import generate_self_consistent
+from step_renderer import StepRenderer
+from model_router import describe_models
+from telemetry import tracer_from_env
 import json
+import os
+import uuid
+
+def render_step(step):
+    # Draws one step into the active container; StepRenderer calls it only when the step changed
+    title, content, thinking_time, first_token_time = step
+    # Ensure content is a string
+    if not isinstance(content, str):
+        content = json.dumps(content)
+    if title.startswith("Final Answer"):
+        st.markdown(f"### {title}")
+        if '```' in content:
+            parts = content.split('```')
+            for index, part in enumerate(parts):
+                if index % 2 == 0:
+                    st.markdown(part)
+                else:
+                    if '\n' in part:
+                        lang_line, code = part.split('\n', 1)
+                        lang = lang_line.strip()
+                    else:
+                        lang = ''
+                        code = part
+                    st.code(part, language=lang)
+        else:
+            st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
+    else:
+        with st.expander(title, expanded=True):
+            st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
+    if first_token_time is not None:
+        st.markdown(f"*Time to first token: {first_token_time:.2f} seconds*")
 
 def main():
+    g1.tracer = tracer_from_env()  # set G1_TRACE_FILE, G1_METRICS_FILE or G1_METRICS_PORT to enable
     st.set_page_config(page_title="g1 prototype", page_icon="🧠", layout="wide")
     
-    st.title("g1: Using Llama-3.1 70b on Groq to create o1-like reasoning chains")
+    st.title("g1: Using Llama-3.1 on Groq to create o1-like reasoning chains")
+    st.caption(describe_models(g1.router, g1.MODEL))
     
     st.markdown("""
     This is an early prototype of using prompting to create o1-like reasoning chains to improve output accuracy. It is not perfect and accuracy has yet to be formally evaluated. It is powered by Groq so that the reasoning step is fast!
@@ -15,45 +54,60 @@ def main():
     
     # Text input for user query
     user_query = st.text_input("Enter your query:", placeholder="e.g., How many 'R's are in the word strawberry?")
-    
-    if user_query:
+
+    # Self-consistency: several chains reason in parallel and vote on the final answer
+    num_chains = st.sidebar.number_input("Parallel reasoning chains", min_value=1, max_value=9, value=1)
+    stop_on_majority = st.sidebar.checkbox("Stop once a majority agrees", value=True)
+
+    # Context compaction collapses earlier steps into a digest once the prompt outgrows the budget.
+    # Off by default so the model sees its whole chain; G1_CONTEXT_BUDGET turns it on with that budget
+    context_budget = os.environ.get("G1_CONTEXT_BUDGET")
+    compact = st.sidebar.checkbox("Compact long reasoning chains", value=bool(context_budget))
+    if compact:
+        token_budget = st.sidebar.number_input("Context budget (tokens)", min_value=1000, step=1000,
+                                               value=int(context_budget or 4000))
+
+    if user_query and num_chains > 1:
+        st.write(f"Generating {num_chains} reasoning chains in parallel...")
+        progress_container = st.empty()
+        quorum = num_chains // 2 + 1 if stop_on_majority else None
+        for chains, result, total_time in generate_self_consistent(user_query, n=num_chains, quorum=quorum):
+            with progress_container.container():
+                for chain in chains:
+                    label = f"Chain {chain.index + 1} (temperature {chain.sampling['temperature']}): {chain.status}, {len(chain.steps)} steps"
+                    st.progress(1.0 if chain.status != "running" else min(len(chain.steps) / 10, 0.95), text=label)
+            if result is not None:
+                st.markdown("### Final Answer")
+                st.markdown(str(result["answer"]).replace('\n', '<br>'), unsafe_allow_html=True)
+                st.markdown(f"**Agreement: {result['agreement']:.0%} of {sum(result['votes'].values())} answers** "
+                            f"(total time: {total_time:.2f} seconds)")
+                for chain in chains:
+                    with st.expander(f"Chain {chain.index + 1}: {chain.status}, answer: {chain.vote}"):
+                        for title, content, thinking_time in chain.steps:
+                            st.markdown(f"**{title}**")
+                            st.markdown(str(content).replace('\n', '<br>'), unsafe_allow_html=True)
+    elif user_query:
         st.write("Generating response...")
         
-        # Create empty elements to hold the generated text and total time
-        response_container = st.empty()
+        # Each step is drawn into its own placeholder; only steps that change are redrawn
+        response_container = st.container()
+        renderer = StepRenderer(response_container, render_step)
         time_container = st.empty()
+        compactor = ContextCompactor(token_budget=token_budget) if compact else None
         
         # Generate and display the response
-        for steps, total_thinking_time in generate_response(user_query):
-            with response_container.container():
-                for i, (title, content, thinking_time) in enumerate(steps):
-                    # Ensure content is a string
-                    if not isinstance(content, str):
-                        content = json.dumps(content)
-                    if title.startswith("Final Answer"):
-                        st.markdown(f"### {title}")
-                        if '```' in content:
-                            parts = content.split('```')
-                            for index, part in enumerate(parts):
-                                if index % 2 == 0:
-                                    st.markdown(part)
-                                else:
-                                    if '\n' in part:
-                                        lang_line, code = part.split('\n', 1)
-                                        lang = lang_line.strip()
-                                    else:
-                                        lang = ''
-                                        code = part
-                                    st.code(part, language=lang)
-                        else:
-                            st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
-                    else:
-                        with st.expander(title, expanded=True):
-                            st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
+        # The app shares one API key, so answers are only reused within a browser session
+        query_scope = st.session_state.setdefault("query_scope", uuid.uuid4().hex)
+        for steps, total_thinking_time in generate_response(user_query, stream=True, compactor=compactor,
+                                                            query_scope=query_scope):
+            renderer.update(steps)
             
             # Only show total time when it's available at the end
             if total_thinking_time is not None:
                 time_container.markdown(f"**Total thinking time: {total_thinking_time:.2f} seconds**")
+                saved = compactor.stats()["saved_prompt_tokens"] if compactor else 0
+                if saved:
+                    st.markdown(f"*Prompt tokens saved by context compaction: ~{saved}*")
 
 if __name__ == "__main__":
     main()
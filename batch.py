@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError
+
+# Headless batch runner. Streams prompts from a JSONL file (or stdin), runs them as concurrent
+# reasoning chains on one event loop and appends one JSONL record per finished chain to the
+# output file as soon as it completes. Re-running with the same output file skips every ID that
+# already has a successful record, so an interrupted run resumes where it stopped.
+#
+#   python batch.py prompts.jsonl -o results.jsonl --concurrency 16
+#
+# Input lines are objects with a "prompt" (or "query"/"question") and an optional "id"; lines that
+# are not JSON objects are taken as the prompt itself. Without an id, the prompt's hash is used.
+# Ctrl-C stops reading input and lets running chains finish; a second Ctrl-C cancels them too
+# (they are not written, so the next run picks them up again). With checkpoints enabled (see
+# checkpoint.py), a resumed run also continues those chains from their last completed step.
+
+os.environ.setdefault("GROQ_API_KEY", "")  # g1 builds its default clients at import time
+
+import g1
+from checkpoint import chain_key
+from step_controller import StepController
+
+def parse_line(line, index):
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        item = json.loads(line)
+    except ValueError:
+        item = line
+    if not isinstance(item, dict):
+        item = {"prompt": str(item)}
+    prompt = item.get("prompt") or item.get("query") or item.get("question")
+    if not prompt:
+        raise ValueError(f"line {index + 1}: no prompt")
+    item_id = item.get("id")
+    if item_id is None:
+        item_id = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+    return {"id": str(item_id), "index": index, "prompt": prompt}
+
+def completed_ids(output_path):
+    # IDs with a successful record in an existing output file; failed chains are retried
+    done = set()
+    if not output_path or not os.path.exists(output_path):
+        return done
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if not record.get("error"):
+                done.add(str(record.get("id")))
+    return done
+
+class BatchRunner:
+    def __init__(self, output, concurrency=8, client=None, controller_options=None, done_ids=None, log=sys.stderr,
+                 chain_scope=None):
+        # chain_scope: checkpoint chains under IDs scoped to this value (the output file) and each
+        # record's id, so rerunning the batch resumes them; None runs every chain from scratch
+        self.output = output
+        self.chain_scope = chain_scope
+        self.concurrency = concurrency
+        self.client = client
+        self.controller_options = controller_options or {}
+        self.done_ids = done_ids or set()
+        self.log = log
+        self.started = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.draining = False
+        self._controllers = set()
+        self._producer = None
+
+    async def run(self, lines):
+        # lines: any iterable of input lines, read lazily so huge files are never loaded at once
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self.worker(queue)) for _ in range(self.concurrency)]
+        self._producer = asyncio.create_task(self.produce(lines, queue))
+        try:
+            await self._producer
+        except asyncio.CancelledError:
+            pass  # interrupted: stop reading input
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        self.report(final=True)
+
+    async def produce(self, lines, queue):
+        # Input is read on a daemon thread with backpressure, so a slow or idle stdin pipe never
+        # blocks the event loop and never holds up shutdown
+        loop = asyncio.get_running_loop()
+        raw = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        def read():
+            try:
+                for line in lines:
+                    asyncio.run_coroutine_threadsafe(raw.put(line), loop).result()
+                asyncio.run_coroutine_threadsafe(raw.put(None), loop).result()
+            except (RuntimeError, CancelledError):
+                pass  # the loop stopped after an interrupt
+
+        threading.Thread(target=read, name="g1-batch-input", daemon=True).start()
+        index = 0
+        while True:
+            line = await raw.get()
+            if line is None:
+                break
+            item = parse_line(line, index)
+            index += 1
+            if item is None:
+                continue
+            if item["id"] in self.done_ids:
+                self.skipped += 1
+                continue
+            self.done_ids.add(item["id"])  # duplicate IDs in the input run once
+            await queue.put(item)
+
+    async def worker(self, queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if self.draining:
+                continue  # not started yet; left for the next run
+            record = await self.run_chain(item)
+            if record is not None:
+                self.write(record)
+
+    async def run_chain(self, item):
+        controller = StepController(**self.controller_options)
+        self._controllers.add(controller)
+        started = time.time()
+        steps, total_thinking_time, error = [], None, None
+        chain_id = chain_key(item["prompt"], batch=self.chain_scope, id=item["id"]) if self.chain_scope else None
+        try:
+            async for steps, total_thinking_time in g1.agenerate_response(item["prompt"], custom_client=self.client,
+                                                                          controller=controller, chain_id=chain_id):
+                pass
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            self._controllers.discard(controller)
+        if controller.cancelled:
+            return None
+        final_answer = steps[-1][1] if total_thinking_time is not None else None
+        if error is None and not isinstance(final_answer, str):
+            # make_api_call reports API failures as an {"title": "Error", ...} step
+            error = final_answer.get("content") if isinstance(final_answer, dict) else "no final answer"
+        return {
+            "id": item["id"],
+            "index": item["index"],
+            "prompt": item["prompt"],
+            "final_answer": final_answer if isinstance(final_answer, str) else None,
+            "steps": [{"title": title, "content": content, "thinking_time": thinking_time}
+                      for title, content, thinking_time in (steps[:-1] if total_thinking_time is not None else steps)],
+            "total_thinking_time": total_thinking_time,
+            "stop": controller.stop,
+            "tokens_used": controller.tokens_used,
+            "started_at": started,
+            "elapsed": time.time() - started,
+            "error": error,
+        }
+
+    def write(self, record):
+        # One line per record, flushed immediately so a crash loses at most the chains in flight
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output.flush()
+        if record["error"]:
+            self.failed += 1
+        else:
+            self.completed += 1
+        if (self.completed + self.failed) % 50 == 0:
+            self.report()
+
+    def report(self, final=False):
+        elapsed = time.monotonic() - self.started
+        done = self.completed + self.failed
+        rate = done / elapsed if elapsed else 0.0
+        prefix = "finished:" if final else "progress:"
+        print(f"{prefix} {self.completed} ok, {self.failed} failed, {self.skipped} skipped, "
+              f"{rate:.1f} chains/s", file=self.log, flush=True)
+
+    def interrupt(self):
+        if not self.draining:
+            self.draining = True
+            if self._producer is not None:
+                self._producer.cancel()
+            print("interrupted: finishing running chains (Ctrl-C again to stop now)", file=self.log, flush=True)
+        else:
+            for controller in list(self._controllers):
+                controller.cancel()
+            print("stopping: unfinished chains will be rerun on resume", file=self.log, flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run g1 reasoning chains over a JSONL file of prompts.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file of prompts, or - for stdin")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file the results are appended to")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="chains running at once")
+    parser.add_argument("--no-resume", action="store_true", help="rerun IDs already in the output file")
+    parser.add_argument("--deadline", type=float, help="wall-clock seconds per chain")
+    parser.add_argument("--token-budget", type=int, help="estimated tokens per chain")
+    parser.add_argument("--max-steps", type=int, default=25, help="reasoning steps per chain")
+    parser.add_argument("--fake", action="store_true", help="use a local fake client instead of the API")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="seconds per fake API call")
+    args = parser.parse_args(argv)
+
+    client = None
+    if args.fake:
+        from fake_client import FakeAsyncClient
+        client = FakeAsyncClient(latency=args.fake_latency)
+    elif not os.environ.get("GROQ_API_KEY"):
+        parser.error("GROQ_API_KEY is not set (use --fake for a dry run)")
+
+    controller_options = {"deadline": args.deadline, "token_budget": args.token_budget, "max_steps": args.max_steps}
+    done_ids = set() if args.no_resume else completed_ids(args.output)
+    lines = sys.stdin if args.input == "-" else open(args.input)
+    with open(args.output, "a") as output:
+        runner = BatchRunner(output, args.concurrency, client, controller_options, done_ids,
+                             chain_scope=None if args.no_resume else os.path.abspath(args.output))
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, runner.interrupt)
+                except (NotImplementedError, RuntimeError):
+                    pass  # Windows: Ctrl-C falls back to KeyboardInterrupt
+            await runner.run(lines)
+
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            runner.report(final=True)
+            return 130
+    if runner.draining:
+        return 130  # interrupted; rerun the same command to resume
+    return 0 if runner.failed == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+# Throughput of g1.agenerate_response against a fake async client as concurrency grows.
+# Run from the repository root: python benchmarks/async_throughput.py
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")  # g1 builds its default clients at import time
+
+import g1
+from fake_client import FakeAsyncClient
+
+async def run_chain(prompt, fake_client):
+    async for steps, total_thinking_time in g1.agenerate_response(prompt, custom_client=fake_client):
+        pass
+    return steps
+
+async def run(concurrency, latency, steps):
+    g1.cache = None  # measure the API path, not response cache hits or replayed checkpoints
+    g1.checkpoints = None
+    g1.query_cache = None
+    fake_client = FakeAsyncClient(latency=latency, steps=steps)
+    start = time.perf_counter()
+    await asyncio.gather(*(run_chain(f"Question {i}", fake_client) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return elapsed, fake_client.calls
+
+def main():
+    latency = 0.05
+    steps = 5
+    print(f"fake latency {latency * 1000:.0f} ms/call, {steps} steps + final answer per chain")
+    print(f"{'chains':>8} {'wall (s)':>10} {'calls':>8} {'chains/s':>10}")
+    for concurrency in (1, 10, 100, 500):
+        elapsed, calls = asyncio.run(run(concurrency, latency, steps))
+        print(f"{concurrency:>8} {elapsed:>10.3f} {calls:>8} {concurrency / elapsed:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# Compile and evaluation throughput of the calculator tool: plain eval() per call (the previous
+# implementation) vs the cached AST compiler, plus a range sweep as one vectorized call.
+# Run from the repository root: python benchmarks/calculator_throughput.py
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tool-use'))
+
+import calculator
+
+EXPRESSIONS = [
+    "math.sqrt(256) + math.sin(math.pi / 4)",
+    "(3 ** 7 - 12) / 5 + math.log(42)",
+    "math.factorial(12) // 7 % 1000",
+]
+
+def eval_path(expression):
+    return eval(expression, {"__builtins__": None}, {"math": math})
+
+def rate(fn, runs):
+    start = time.perf_counter()
+    for i in range(runs):
+        fn(EXPRESSIONS[i % len(EXPRESSIONS)])
+    return runs / (time.perf_counter() - start)
+
+def main():
+    runs = 100_000
+    print(f"eval() per call:              {rate(eval_path, runs):>12,.0f} calls/s")
+    calculator.compile_expression.cache_clear()
+    uncached = lambda e: calculator.compile_expression.__wrapped__(e)()
+    print(f"compile per call (no cache):  {rate(uncached, runs):>12,.0f} calls/s")
+    print(f"cached compile + eval:        {rate(calculator.calculate, runs):>12,.0f} calls/s")
+
+    n = 1_000_000
+    start = time.perf_counter()
+    loop_total = sum(calculator.calculate(f"{x} ** 2 + 1") for x in range(1, 10_001))
+    loop_time = (time.perf_counter() - start) * n / 10_000
+    start = time.perf_counter()
+    vector_total = calculator.calculate({"expression": "x ** 2 + 1", "range": [1, n], "reduce": "sum"})
+    vector_time = time.perf_counter() - start
+    print(f"x**2+1 for x in 1..10^6: one call per x ~{loop_time:.2f}s (extrapolated), one vectorized call {vector_time:.3f}s")
+    print(f"vectorized result: {vector_total}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Ingest and query latency of the uploaded-file index (file-or-image-context/file_index.py) for
+# log-like files of increasing size, and how many prompt characters each step sends compared
+# with pasting the whole file.
+# Run from the repository root: python benchmarks/file_retrieval.py
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'file-or-image-context'))
+
+from file_index import FileIndex, format_excerpts
+
+SERVICES = ["api", "billing", "search", "auth", "worker", "scheduler", "gateway"]
+EVENTS = ["request completed", "cache miss", "retrying upstream call", "connection reset by peer",
+          "slow query detected", "token refreshed", "queue depth high", "health check ok"]
+
+def make_log(target_chars, seed=0):
+    rng = random.Random(seed)
+    lines, size, i = [], 0, 0
+    while size < target_chars:
+        line = (f"2024-05-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:{(i * 7) % 60:02d}Z "
+                f"{rng.choice(['INFO', 'INFO', 'INFO', 'WARN', 'ERROR'])} {rng.choice(SERVICES)}-{rng.randint(1, 40)} "
+                f"{rng.choice(EVENTS)} request_id={rng.getrandbits(48):x} latency_ms={rng.randint(1, 5000)}\n")
+        lines.append(line)
+        size += len(line)
+        i += 1
+    return "".join(lines)
+
+QUERIES = [
+    "Why are billing requests failing with connection reset by peer?",
+    "Which worker logged slow query detected errors?",
+    "Is the scheduler queue depth high during retries of upstream calls?",
+    "Qué dice el archivo?",  # no term occurs in the log: the leading sections are sent
+]
+
+def main():
+    for size in (200_000, 2_000_000, 20_000_000):
+        text = make_log(size)
+        start = time.perf_counter()
+        index = FileIndex(text)
+        ingest = time.perf_counter() - start
+        runs = 50
+        sent = 0
+        start = time.perf_counter()
+        for i in range(runs):
+            results = index.search(QUERIES[i % len(QUERIES)], 4)
+            sent += len(format_excerpts(results, len(index.chunks)))
+        query = (time.perf_counter() - start) / runs
+        sent //= runs
+        print(f"{len(text) / 1e6:>6.1f} MB: {len(index.chunks):>6,} chunks, ingest {ingest * 1000:>8.1f} ms, "
+              f"query {query * 1000:>7.2f} ms, {sent:,} chars per step instead of {len(text):,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Tool calls that never return, and the chains that come after them. Each round, a chain makes a
+# step of tool calls that hang past their timeout, then another chain makes a step with one quick
+# call. A timed-out call cannot be stopped and keeps its worker, so without a bound the hung calls
+# fill the shared tool pool and the quick call times out waiting for a worker. Exits 1 if any quick
+# call fails.
+# Run from the repository root: python benchmarks/hung_tools.py
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tool-use'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+os.environ.setdefault("EXA_API_KEY", "benchmark")
+
+import g1_experimental
+
+HANG_TIMEOUT = 0.2
+ROUNDS = 6
+HUNG_PER_ROUND = 3
+
+def main():
+    release = threading.Event()
+    run_tool = g1_experimental.run_tool
+
+    def hanging_run_tool(call):
+        if call.get('tool') == 'hang':
+            release.wait()
+            return "released"
+        return run_tool(call)
+
+    g1_experimental.run_tool = hanging_run_tool
+    g1_experimental.TOOL_TIMEOUTS['hang'] = HANG_TIMEOUT
+    failed = 0
+    try:
+        for round in range(ROUNDS):
+            hung = g1_experimental.run_tools([{'tool': 'hang'}] * HUNG_PER_ROUND)
+            start = time.perf_counter()
+            result, = g1_experimental.run_tools([{'tool': 'calculator', 'tool_input': f"{round} + 1"}])
+            elapsed = time.perf_counter() - start
+            ok = str(result) == str(round + 1)
+            failed += not ok
+            print(f"round {round}: {sum(r.startswith('Error') for r in hung)} calls hung, "
+                  f"quick call {'ok' if ok else 'failed'} in {elapsed * 1000:.0f} ms: {result!r}")
+    finally:
+        release.set()
+        g1_experimental.run_tool = run_tool
+    print(f"{failed} of {ROUNDS} quick calls failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# API calls and prompt tokens spent by chains that stall, restating the same "re-examining"
+# step until the step cap, with and without the repetition detector. STALL_RATE of the fake
+# chains stall after a few genuine steps. A stalled chain that gets the steering message recovers
+# and answers with probability RECOVERY. The rest reason through GENUINE_STEPS distinct steps on
+# the same topic, and none of them should be cut short.
+# Run from the repository root: python benchmarks/loop_detection.py
+import json
+import os
+import random
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+import g1
+from fake_client import fake_response
+from repetition import STEERING_PROMPT, RepetitionDetector, repetition_stats
+from step_controller import StepController
+
+CHAINS = 200
+GENUINE_STEPS = 8
+STALL_RATE = 0.3
+RECOVERY = 0.5
+TOPIC = "The question asks how many times the letter r appears in the word strawberry."
+WORDS = ("count letters spelling position index character vowel consonant double pair check method "
+         "split word syllable straw berry compare total sum verify alternative approach list scan left "
+         "right first last middle sequence pattern result tally mark group repeat case upper lower").split()
+STALL_STEP = ("Re-examining the count once more: spelling strawberry letter by letter as s t r a w b e r r y "
+              "shows three r characters, one after t and two after e, so the total of three still holds.")
+
+class StallingClient:
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens, response_format=None, **kwargs):
+        self.calls += 1
+        if response_format is None:
+            content = "There are three Rs in strawberry."
+        else:
+            content = json.dumps(self.step(messages))
+        response = fake_response(content, messages)
+        self.prompt_tokens += response.usage.prompt_tokens
+        return response
+
+    def step(self, messages):
+        prompt = next(m["content"] for m in messages if m["role"] == "user")
+        chain = random.Random(prompt)  # the same chain makes the same choices on every call
+        stalls = chain.random() < STALL_RATE
+        stall_after = chain.randint(2, 4)
+        recovers = chain.random() < RECOVERY
+        step = sum(1 for m in messages[3:] if m["role"] == "assistant") + 1
+        steered = any(m["role"] == "user" and m["content"] == STEERING_PROMPT for m in messages)
+        if stalls and steered and recovers:
+            return {"title": "Answer", "content": "Counting again gives three, and a second method agrees.", "next_action": "final_answer"}
+        if stalls and step > stall_after:
+            words = STALL_STEP.split()
+            for _ in range(2):  # light paraphrase, as the model never repeats itself word for word
+                words[self.random.randrange(len(words))] = self.random.choice(WORDS)
+            return {"title": "Re-examining the count", "content": " ".join(words), "next_action": "continue"}
+        content = f"{TOPIC} " + " ".join(self.random.choice(WORDS) for _ in range(30)) + "."
+        return {"title": f"Step about {self.random.choice(WORDS)}", "content": content,
+                "next_action": "final_answer" if step >= GENUINE_STEPS else "continue"}
+
+def run(label, make_controller):
+    client = StallingClient()
+    cut_short = 0
+    stops = {}
+    before = repetition_stats.stats()
+    for i in range(CHAINS):
+        controller = make_controller()
+        for steps, _ in g1.generate_response(f"Question {i}", custom_client=client, controller=controller):
+            pass
+        stops[controller.stop] = stops.get(controller.stop, 0) + 1
+        prompt = f"Question {i}"
+        if random.Random(prompt).random() >= STALL_RATE and len(steps) - 1 < GENUINE_STEPS:
+            cut_short += 1
+    after = repetition_stats.stats()
+    saved = after["steps_saved"] - before["steps_saved"]
+    print(f"{label:<22} {client.calls / CHAINS:>6.2f} calls/chain  {client.prompt_tokens / CHAINS:>8.0f} prompt tokens/chain  "
+          f"{cut_short:>2} genuine chains cut short  steps saved {saved:>4}  stops {stops}")
+
+def main():
+    g1.cache = None
+    g1.checkpoints = None
+    g1.query_cache = None
+    g1.router = None
+    print(f"{CHAINS} chains, {STALL_RATE:.0%} of which stall until the 25-step cap")
+    run("no detection", lambda: StepController(repetition=False))
+    run("stop on stall", lambda: StepController(repetition=RepetitionDetector(action="final_answer")))
+    run("steer, then stop", lambda: StepController())
+
+if __name__ == "__main__":
+    main()
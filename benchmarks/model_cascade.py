@@ -0,0 +1,99 @@
+# Latency and cost of reasoning chains with every call on the large model vs the model router,
+# which sends steps to the small model and escalates the ones it fails or hedges on. The fake
+# models answer at Groq's published speeds for Llama 3.1 8B and 70B, with time scaled down by
+# TIME_SCALE. The small model hedges on HEDGE_RATE of its steps and returns unusable JSON on
+# BROKEN_RATE of them. Final answers are counted per model to show they never leave the large model.
+# Run from the repository root: python benchmarks/model_cascade.py
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+import g1
+from fake_client import fake_content, fake_response
+from model_router import LARGE_MODEL, SMALL_MODEL, ModelRouter, call_cost
+
+CHAINS = 200
+STEPS = 5
+CONCURRENCY = 16
+TIME_SCALE = 0.02  # one simulated second takes 20 ms
+SPEEDS = {  # model: (time to first token in seconds, completion tokens per second)
+    SMALL_MODEL: (0.15, 750.0),
+    LARGE_MODEL: (0.30, 250.0),
+}
+STEP_TEXT = "Working through this part of the problem carefully, checking each intermediate result. " * 6
+HEDGE_RATE = 0.10
+BROKEN_RATE = 0.03
+
+def roll(messages, salt):
+    # Deterministic per request, so a retried request fails the same way
+    digest = hashlib.sha256((salt + json.dumps(messages)).encode()).digest()
+    return int.from_bytes(digest[:4], "big") / 2 ** 32
+
+class CascadeClient:
+    def __init__(self):
+        self.usage = {}  # model: [calls, prompt tokens, completion tokens]
+        self.final_answers = {}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens, response_format=None, **kwargs):
+        content = fake_content(messages, response_format, STEPS)
+        if response_format is not None:
+            step = dict(json.loads(content), content=STEP_TEXT)
+            if model == SMALL_MODEL and roll(messages, "hedge") < HEDGE_RATE:
+                step["content"] = "I am not sure this approach is right. " + STEP_TEXT
+            content = json.dumps(step)
+            if model == SMALL_MODEL and roll(messages, "broken") < BROKEN_RATE:
+                content = "Sure! Let me think about that."
+        else:
+            self.final_answers[model] = self.final_answers.get(model, 0) + 1
+        response = fake_response(content, messages)
+        first_token, tokens_per_second = SPEEDS[model]
+        time.sleep((first_token + response.usage.completion_tokens / tokens_per_second) * TIME_SCALE)
+        usage = self.usage.setdefault(model, [0, 0, 0])
+        usage[0] += 1
+        usage[1] += response.usage.prompt_tokens
+        usage[2] += response.usage.completion_tokens
+        return response
+
+def run(label, router):
+    g1.router = router
+    client = CascadeClient()
+
+    def chain(i):
+        started = time.perf_counter()
+        for _ in g1.generate_response(f"Question {i}", custom_client=client):
+            pass
+        return (time.perf_counter() - started) / TIME_SCALE
+
+    with ThreadPoolExecutor(CONCURRENCY) as pool:
+        latencies = sorted(pool.map(chain, range(CHAINS)))
+    calls = sum(usage[0] for usage in client.usage.values())
+    cost = sum(call_cost(model, usage[1], usage[2]) for model, usage in client.usage.items())
+    print(f"{label:<12} {calls / CHAINS:>5.2f} calls/chain  {client.usage.get(SMALL_MODEL, [0])[0] / calls:>4.0%} small  "
+          f"chain p50 {latencies[len(latencies) // 2]:.2f} s  p90 {latencies[int(len(latencies) * 0.9)]:.2f} s  "
+          f"${cost / CHAINS * 1000:.3f} per 1000 chains  final answers {client.final_answers}")
+    return router
+
+def main():
+    g1.cache = None
+    g1.checkpoints = None
+    g1.query_cache = None
+    g1.scheduler.base_delay = 0.0
+    print(f"{CHAINS} chains of {STEPS} steps + final answer; small model hedges on {HEDGE_RATE:.0%} "
+          f"and breaks {BROKEN_RATE:.0%} of steps")
+    run("large only", None)
+    router = run("cascade", ModelRouter())
+    stats = router.stats()
+    print(f"routes {stats['routes']}  escalations {stats['escalations']}")
+    for model, model_stats in stats["models"].items():
+        print(f"  {model:<26} {model_stats['calls']:>5} calls  {model_stats['mean_latency'] / TIME_SCALE:.2f} s mean")
+
+if __name__ == "__main__":
+    main()
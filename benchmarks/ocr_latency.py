@@ -0,0 +1,58 @@
+# OCR latency on the bundled examples/*.png: pytesseract on the raw image (the previous
+# behaviour, repeated on every Streamlit rerun) vs the OcrService pipeline cold and on a cache
+# hit, plus a tall synthetic scan made by stacking the examples, to show tiling across processes.
+# Needs Pillow, pytesseract and the tesseract binary.
+# Run from the repository root: python benchmarks/ocr_latency.py
+import glob
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'file-or-image-context'))
+
+from PIL import Image
+import pytesseract
+
+from ocr import OcrService
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+def stacked_scan(paths, copies=3):
+    images = [Image.open(path).convert("RGB") for path in paths] * copies
+    width = max(image.width for image in images)
+    scan = Image.new("RGB", (width, sum(image.height for image in images)), "white")
+    top = 0
+    for image in images:
+        scan.paste(image, (0, top))
+        top += image.height
+    buffer = io.BytesIO()
+    scan.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def main():
+    paths = sorted(glob.glob(os.path.join(ROOT, 'examples', '*.png')))
+    samples = [(os.path.basename(path), open(path, 'rb').read()) for path in paths]
+    samples.append(("stacked scan", stacked_scan(paths)))
+
+    service = OcrService()
+    # Start the worker processes up front so the cold numbers measure OCR, not interpreter startup
+    blank = io.BytesIO()
+    Image.new("L", (64, 64), 255).save(blank, format="PNG")
+    service.image_to_string(blank.getvalue())
+
+    for name, data in samples:
+        size = Image.open(io.BytesIO(data)).size
+        raw_time, raw_text = timed(lambda: pytesseract.image_to_string(Image.open(io.BytesIO(data))))
+        cold_time, text = timed(lambda: service.image_to_string(data))
+        hit_time, _ = timed(lambda: service.image_to_string(data))
+        print(f"{name:<16} {size[0]}x{size[1]:<6} raw {raw_time * 1000:>8.0f} ms ({len(raw_text):>5} chars)  "
+              f"pipeline cold {cold_time * 1000:>8.0f} ms ({len(text):>5} chars)  cache hit {hit_time * 1000:>6.2f} ms")
+    print(service.stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# The Ollama call pattern before and after ollama_backend.py, against the local stand-in server
+# (ollama/fake_ollama.py) with a simulated model load time and token rate:
+#   - time to first visible token of a step, blocking call vs streamed
+#   - idle gaps longer than Ollama's default keep-alive (scaled down here), with and without an
+#     explicit keep_alive
+#   - the first query after page load, with and without the warm-up call
+#   - many concurrent chains against a server that runs 2 requests at once and queues 4 more
+# Run from the repository root: python benchmarks/ollama_backend.py
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ollama'))
+
+import ollama
+from fake_ollama import FakeOllama, serve
+from ollama_backend import OllamaBackend
+
+MODEL = "llama3.1:70b"
+LOAD_TIME = 1.0
+STEP = [{"role": "system", "content": "Reason step by step in JSON."}, {"role": "user", "content": "How many Rs are in strawberry?"}]
+OPTIONS = {"temperature": 0.2, "num_predict": 300}
+
+def start(**kwargs):
+    fake = FakeOllama(load_time=LOAD_TIME, **kwargs)
+    server = serve(fake, port=0)
+    return fake, f"http://127.0.0.1:{server.server_address[1]}"
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+def old_call(client):
+    # What ollama_app did before: blocking, no keep_alive
+    return json.loads(client.chat(model=MODEL, messages=STEP, options=OPTIONS, format="json")["message"]["content"])
+
+def first_token():
+    fake, host = start(token_time=0.01)
+    backend = OllamaBackend(host=host)
+    backend.warm_up()
+    blocking = timed(lambda: old_call(backend.client))
+    started = time.perf_counter()
+    for _ in backend.stream_chat(MODEL, STEP, OPTIONS, "json"):
+        streamed = time.perf_counter() - started
+        break
+    print(f"step reply visible after: blocking {blocking * 1000:.0f} ms, streamed {streamed * 1000:.0f} ms")
+
+def idle_gaps(queries=4, gap=0.6):
+    # The fake server's default keep-alive is scaled down to 0.3 s to stand in for Ollama's 5 minutes
+    for label, keep_alive in (("default keep-alive", None), ("keep_alive=30m", "30m")):
+        fake, host = start(default_keep_alive=0.3)
+        backend = OllamaBackend(host=host, keep_alive=keep_alive)
+        latencies = []
+        for _ in range(queries):
+            latencies.append(timed(lambda: "".join(backend.stream_chat(MODEL, STEP, OPTIONS, "json"))))
+            time.sleep(gap)
+        print(f"{queries} queries with idle gaps, {label:<18}: {fake.loads} model loads, "
+              f"mean latency {sum(latencies) / len(latencies) * 1000:.0f} ms")
+
+def warm_up(typing_time=1.5):
+    for label, warm in (("cold", False), ("warmed up at page load", True)):
+        fake, host = start()
+        backend = OllamaBackend(host=host)
+        if warm:
+            backend.start_warm_up()
+        time.sleep(typing_time)  # the user types the query
+        print(f"first query, {label:<22}: {timed(lambda: ''.join(backend.stream_chat(MODEL, STEP, OPTIONS, 'json'))) * 1000:.0f} ms")
+
+def concurrency(chains=16, steps=4):
+    for label, limited in (("unscheduled", False), ("backend, 2 slots", True)):
+        fake, host = start(num_parallel=2, max_queue=4)
+        backend = OllamaBackend(host=host, max_concurrent=2 if limited else chains)
+        backend.warm_up()
+
+        def chain(_):
+            failures = 0
+            for _ in range(steps):
+                try:
+                    "".join(backend.stream_chat(MODEL, STEP, OPTIONS, "json"))
+                except ollama.ResponseError:
+                    failures += 1
+            return failures
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(chains) as pool:
+            failures = sum(pool.map(chain, range(chains)))
+        elapsed = time.perf_counter() - started
+        print(f"{chains} chains x {steps} calls, {label:<16}: {failures:>3} rejected (503), {elapsed:.2f} s, "
+              f"server ran at most {fake.max_running} at once")
+
+def main():
+    print(f"fake Ollama: {LOAD_TIME:.1f} s model load")
+    first_token()
+    idle_gaps()
+    warm_up()
+    concurrency()
+
+if __name__ == "__main__":
+    main()
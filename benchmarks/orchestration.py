@@ -0,0 +1,281 @@
+# Orchestration overhead of the reasoning chain code, measured by replaying recorded API calls
+# with no latency, so what is left is g1's own work: building requests, parsing steps, the
+# controller, scheduler and telemetry hooks, the front-ends' rendering and transport. Covers
+# g1.generate_response (plain and streamed), g1.agenerate_response, the tool-use variant, the
+# batch runner, the HTTP server and the Streamlit app, as chain length and concurrency grow.
+#
+# Cassettes are recorded from the fake client at startup (replay_client.RecordingClient), so
+# the suite needs no API key. Each scenario reports microseconds of overhead per API call, the
+# median of --repeat runs after a warm-up, and two counts from one more run: API calls per chain
+# and calls of the repository's own Python functions per API call. Timings on a busy or
+# single-core machine move by tens of percent between runs, so they are shown for reference only.
+# The counts do not depend on the machine or its load, and they are what is compared with
+# benchmarks/baselines/orchestration.json: more API calls per chain, or more than --tolerance
+# more function calls per API call, is a regression.
+#
+#   python benchmarks/orchestration.py                     # run and compare with the baseline
+#   python benchmarks/orchestration.py --check             # exit 1 on a regression
+#   python benchmarks/orchestration.py --update-baseline   # store these numbers
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tool-use'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+os.environ.setdefault("EXA_API_KEY", "benchmark")
+
+import g1
+import g1_experimental
+from batch import BatchRunner
+from fake_client import FakeClient, FakeAsyncClient
+from replay_client import AsyncRecordingClient, AsyncReplayClient, Cassette, RecordingClient, ReplayClient, load_cassette
+from server import ChainServer
+from server_load import request_chain, start_server
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'orchestration.json')
+CHAIN_LENGTHS = (3, 10, 25)
+CONCURRENCY = (1, 8, 32)
+CALLS = 800  # API calls per measurement, so short chains are timed over as much work as long ones
+RECORDED_LATENCY = 0.02  # of the fake calls in the cassettes, for --latency-scale runs
+
+def prompt_for(steps):
+    return f"Benchmark question answered in {steps} steps"
+
+def record_cassettes(directory):
+    # One sync and one async cassette covering g1 and the tool-use variant at every chain length
+    sync_path, async_path = os.path.join(directory, 'sync.jsonl'), os.path.join(directory, 'async.jsonl')
+    for steps in CHAIN_LENGTHS:
+        recorder = RecordingClient(FakeClient(latency=RECORDED_LATENCY, steps=steps), sync_path)
+        for stream in (False, True):  # streamed steps are requested without JSON mode
+            for _ in g1.generate_response(prompt_for(steps), custom_client=recorder, stream=stream):
+                pass
+        for _ in g1_experimental.generate_response(prompt_for(steps), custom_client=recorder):
+            pass
+        async_recorder = AsyncRecordingClient(FakeAsyncClient(latency=RECORDED_LATENCY, steps=steps), async_path)
+
+        async def record():
+            async for _ in g1.agenerate_response(prompt_for(steps), custom_client=async_recorder):
+                pass
+
+        asyncio.run(record())
+    return Cassette(load_cassette(sync_path)), Cassette(load_cassette(async_path))
+
+def chains_for(steps):
+    return -(-CALLS // (steps + 1))
+
+def run_threads(chain, chains, concurrency):
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(lambda _: chain(), range(chains)))
+
+def g1_sync(cassettes, steps, concurrency, scale, stream=False):
+    client = ReplayClient(cassettes[0], scale)
+
+    def chain():
+        for _ in g1.generate_response(prompt_for(steps), custom_client=client, stream=stream):
+            pass
+
+    run_threads(chain, chains_for(steps), concurrency)
+    return client.calls, chains_for(steps)
+
+def g1_stream(cassettes, steps, concurrency, scale):
+    return g1_sync(cassettes, steps, concurrency, scale, stream=True)
+
+def tool_use(cassettes, steps, concurrency, scale):
+    client = ReplayClient(cassettes[0], scale)
+
+    def chain():
+        for _ in g1_experimental.generate_response(prompt_for(steps), custom_client=client):
+            pass
+
+    run_threads(chain, chains_for(steps), concurrency)
+    return client.calls, chains_for(steps)
+
+def g1_async(cassettes, steps, concurrency, scale):
+    client = AsyncReplayClient(cassettes[1], scale)
+
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def chain():
+            async with slots:
+                async for _ in g1.agenerate_response(prompt_for(steps), custom_client=client):
+                    pass
+
+        await asyncio.gather(*(chain() for _ in range(chains_for(steps))))
+
+    asyncio.run(main())
+    return client.calls, chains_for(steps)
+
+def batch(cassettes, steps, concurrency, scale):
+    client = AsyncReplayClient(cassettes[1], scale)
+    lines = [json.dumps({"id": str(i), "prompt": prompt_for(steps)}) for i in range(chains_for(steps))]
+    runner = BatchRunner(io.StringIO(), concurrency, client, log=io.StringIO())
+    asyncio.run(runner.run(lines))
+    return client.calls, chains_for(steps)
+
+def server(cassettes, steps, concurrency, scale):
+    client = AsyncReplayClient(cassettes[1], scale)
+    port = start_server(ChainServer(client, max_chains=1024, per_client=1024))
+
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def chain(i):
+            async with slots:
+                await request_chain(port, prompt_for(steps), "benchmark")
+
+        await asyncio.gather(*(chain(i) for i in range(chains_for(steps))))
+
+    asyncio.run(main())
+    return client.calls, chains_for(steps)
+
+def streamlit_app(cassettes, steps, concurrency, scale):
+    # One script run of app.py per chain, through Streamlit's own test runner
+    from streamlit.testing.v1 import AppTest
+    # Streamlit's loggers otherwise warn about the missing ScriptRunContext on every run
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+    client = ReplayClient(cassettes[0], scale)
+    default_client, g1.client = g1.client, client
+    try:
+        for _ in range(8):  # chains
+            app = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=60)
+            app.run()
+            app.text_input[0].input(prompt_for(steps)).run()
+            if app.exception:
+                raise RuntimeError(app.exception[0].message)
+    finally:
+        g1.client = default_client
+    return client.calls, 8
+
+SCENARIOS = {  # name: (function, concurrency levels)
+    "g1": (g1_sync, CONCURRENCY),
+    "g1-stream": (g1_stream, CONCURRENCY),
+    "g1-async": (g1_async, CONCURRENCY),
+    "tool-use": (tool_use, CONCURRENCY),
+    "batch": (batch, CONCURRENCY),
+    "server": (server, CONCURRENCY),
+    "streamlit": (streamlit_app, (1,)),
+}
+
+# Code whose function calls are counted: the repository, except the benchmarks and the fake and
+# replay clients standing in for the API
+COUNTED = os.path.realpath(ROOT) + os.sep
+NOT_COUNTED = tuple(os.path.realpath(os.path.join(ROOT, name)) for name in ('benchmarks', 'fake_client.py', 'replay_client.py'))
+
+def count_calls(fn, *args):
+    # Runs fn, profiling every thread it starts; returns its result and how many counted functions
+    # were called
+    counted = {}
+    calls = [0]
+    lock = threading.Lock()
+
+    def profile(frame, event, arg):
+        if event == 'call':
+            filename = frame.f_code.co_filename
+            if filename not in counted:
+                path = os.path.realpath(filename)
+                counted[filename] = path.startswith(COUNTED) and not path.startswith(NOT_COUNTED)
+            if counted[filename]:
+                with lock:
+                    calls[0] += 1
+
+    threading.setprofile(profile)
+    sys.setprofile(profile)
+    try:
+        result = fn(*args)
+    finally:
+        sys.setprofile(None)
+        threading.setprofile(None)
+    return result, calls[0]
+
+def measure(fn, cassettes, steps, concurrency, scale, repeat):
+    # Returns the median us per API call, API calls per chain and counted function calls per API call
+    fn(cassettes, steps, concurrency, scale)  # warm-up: imports, thread pools, worker processes
+    per_call = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        calls, _ = fn(cassettes, steps, concurrency, scale)
+        elapsed = time.perf_counter() - started
+        if any(cassette.misses for cassette in cassettes):
+            raise RuntimeError("requests missing from the cassette; the chain did not run as recorded")
+        per_call.append(elapsed / calls * 1e6)
+    (calls, chains), function_calls = count_calls(fn, cassettes, steps, concurrency, scale)
+    return statistics.median(per_call), calls / chains, function_calls / calls
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure orchestration overhead against replayed API calls.")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a scenario regressed")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed growth in function calls per API call (0.1 = 10%%)")
+    parser.add_argument("--repeat", type=int, default=9)
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="replay speed; baselines apply only at 0")
+    parser.add_argument("--only", help="comma-separated scenario names")
+    args = parser.parse_args(argv)
+
+    g1.cache = None  # every call should reach the replay client
+    g1.checkpoints = None
+    g1.query_cache = None
+    g1_experimental.cache = None
+    g1_experimental.checkpoints = None
+    with tempfile.TemporaryDirectory() as directory:
+        cassettes = record_cassettes(directory)
+    baseline = {"results": {}, "api_calls_per_chain": {}, "calls_per_api_call": {}}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline.update(json.load(f))
+
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    results, api_calls, function_calls, regressions = {}, {}, {}, []
+    print(f"{'scenario':<32} {'us/call':>9} {'baseline':>9} {'API calls/chain':>16} {'fn calls/API call':>18} {'change':>8}")
+    for name in names:
+        fn, levels = SCENARIOS[name]
+        for steps in CHAIN_LENGTHS:
+            for concurrency in levels:
+                key = f"{name}/steps={steps}/c={concurrency}"
+                timing, per_chain, per_call = measure(fn, cassettes, steps, concurrency, args.latency_scale, args.repeat)
+                results[key], api_calls[key], function_calls[key] = round(timing, 1), round(per_chain, 2), round(per_call, 1)
+                reference = baseline["results"].get(key) if args.latency_scale == 0 else None
+                reference_calls = baseline["api_calls_per_chain"].get(key)
+                reference_functions = baseline["calls_per_api_call"].get(key)
+                change = f"{function_calls[key] / reference_functions - 1:+.0%}" if reference_functions else ""
+                if (reference_calls is not None and api_calls[key] > reference_calls
+                        or reference_functions and function_calls[key] > reference_functions * (1 + args.tolerance)):
+                    regressions.append(key)
+                    change += " !"
+                print(f"{key:<32} {results[key]:>9.1f} {reference or '':>9} {api_calls[key]:>16} "
+                      f"{function_calls[key]:>18} {change:>8}", flush=True)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE), exist_ok=True)
+        with open(BASELINE, 'w') as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "results": dict(baseline["results"], **results),
+                       "api_calls_per_chain": dict(baseline["api_calls_per_chain"], **api_calls),
+                       "calls_per_api_call": dict(baseline["calls_per_api_call"], **function_calls)},
+                      f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {os.path.relpath(BASELINE)}")
+    if regressions:
+        print(f"{len(regressions)} scenario(s) making more API calls per chain, or more than {args.tolerance:.0%} more "
+              f"function calls per API call, than the baseline: {', '.join(regressions)}")
+        if args.check:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
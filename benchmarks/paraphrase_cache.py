@@ -0,0 +1,112 @@
+# API calls and latency for a stream of questions asked in several phrasings, with and without
+# the query cache, and how many served answers belonged to a different question. The question
+# set includes near misses that must not share answers (strawberry / raspberry, 17 * 23 / 17 * 24,
+# 10/2 / 10*2 / 10-2, miles to km / km to miles, r's / s's, a mammal / not a mammal), and the
+# questions are split between two users whose chains must not reach each other. Exits 1 if any
+# answer was wrong or crossed users.
+# The fake model takes STEPS steps per chain, or WARM_STEPS when the chain was given a warm start,
+# assuming the model can reuse most of the earlier reasoning.
+# Run from the repository root: python benchmarks/paraphrase_cache.py
+import json
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+import g1
+from fake_client import fake_response
+from query_cache import QueryCache
+
+STEPS = 6
+WARM_STEPS = 2
+LATENCY = 0.005
+ROUNDS = 4
+QUESTIONS = [  # each question in four phrasings
+    ["How many Rs are in strawberry?", "how many r's are in strawberry", "How many Rs are there in strawberry?",
+     "How many letter Rs are in the word strawberry?"],
+    ["How many Rs are in raspberry?", "how many r's are in raspberry", "How many Rs are there in raspberry?",
+     "How many letter Rs are in the word raspberry?"],
+    ["Which is larger, .9 or .11?", "Which is larger: .9 or .11?", "which is larger .9 or .11",
+     "Which number is larger, .9 or .11?"],
+    ["What is 17 * 23?", "what is 17*23", "What is 17 times 23?", "What's 17 * 23?"],
+    ["What is 17 * 24?", "what is 17*24", "What is 17 times 24?", "What's 17 * 24?"],
+    ["What is the capital of Australia?", "what's the capital of australia", "What is the capital city of Australia?",
+     "Capital of Australia?"],
+    ["Who wrote Pride and Prejudice?", "who wrote pride and prejudice", "Who is the author of Pride and Prejudice?",
+     "Who wrote the novel Pride and Prejudice?"],
+    ["Is 1001 a prime number?", "is 1001 prime", "Is 1001 a prime?", "Is the number 1001 prime?"],
+    ["What is 10/2?", "what is 10/2", "What is 10 / 2?", "What's 10/2?"],
+    ["What is 10*2?", "what is 10*2", "What is 10 * 2?", "What's 10*2?"],
+    ["What is 10-2?", "what is 10-2", "What is 10 - 2?", "What's 10-2?"],
+    ["Convert 5 miles to km", "convert 5 miles to km", "Convert 5 miles to km.", "How much is 5 miles in km?"],
+    ["Convert 5 km to miles", "convert 5 km to miles", "Convert 5 km to miles.", "How much is 5 km in miles?"],
+    ["How many s's are in strawberry?", "how many s's are in strawberry", "How many Ss are in strawberry?",
+     "How many letter Ss are in the word strawberry?"],
+    ["Is a whale a mammal?", "is a whale a mammal", "Is a whale a mammal or not?", "Is the whale a mammal?"],
+    ["Is a whale not a mammal?", "is a whale not a mammal", "Is it true that a whale is not a mammal?",
+     "Is the whale not a mammal?"],
+]
+USERS = ["alice", "bob"]
+
+ANGLES = ["the definitions involved", "a worked example", "an independent second method", "possible counterexamples",
+          "the limits of what an LLM can check", "a final consistency check"]
+
+class ParaphraseClient:
+    def __init__(self):
+        self.calls = 0
+        self.user = None
+        self.question = {phrasing: i for i, phrasings in enumerate(QUESTIONS) for phrasing in phrasings}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens, response_format=None, **kwargs):
+        self.calls += 1
+        time.sleep(LATENCY)
+        prompt = messages[1]["content"]
+        if response_format is None:
+            content = f"Answer to question {self.question[prompt]} for {self.user}"
+        else:
+            warm = any(m["role"] == "system" and m["content"].startswith("A similar question") for m in messages)
+            step = sum(1 for m in messages[3:] if m["role"] == "assistant") + 1
+            content = json.dumps({"title": ANGLES[step % len(ANGLES)].capitalize(),
+                                  "content": f"Looking at {prompt!r} through {ANGLES[step % len(ANGLES)]}.",
+                                  "next_action": "final_answer" if step >= (WARM_STEPS if warm else STEPS) else "continue"})
+        return fake_response(content, messages)
+
+def run(label, query_cache):
+    g1.query_cache = query_cache
+    client = ParaphraseClient()
+    rng = random.Random(0)
+    asked = [(i, phrasing, rng.choice(USERS)) for _ in range(ROUNDS) for i, phrasings in enumerate(QUESTIONS)
+             for phrasing in phrasings]
+    rng.shuffle(asked)
+    wrong = crossed = 0
+    started = time.perf_counter()
+    for i, phrasing, user in asked:
+        client.user = user
+        for steps, _ in g1.generate_response(phrasing, custom_client=client, query_scope=user):
+            pass
+        if not steps[-1][1].startswith(f"Answer to question {i} "):
+            wrong += 1
+        elif not steps[-1][1].endswith(f" for {user}"):
+            crossed += 1
+    elapsed = time.perf_counter() - started
+    print(f"{label:<14} {client.calls / len(asked):>5.2f} calls/query  {elapsed / len(asked) * 1000:>6.1f} ms/query  "
+          f"{wrong} wrong answers  {crossed} from the other user  {query_cache.stats() if query_cache else ''}")
+    return wrong + crossed
+
+def main():
+    g1.cache = None
+    g1.checkpoints = None  # which would replay exact repeats on their own
+    g1.router = None
+    print(f"{len(QUESTIONS)} questions x 4 phrasings x {ROUNDS} rounds, {STEPS}-step chains, {len(USERS)} users")
+    failed = run("no cache", None)
+    failed += run("hits only", QueryCache(warm_threshold=None))
+    failed += run("hits + warm", QueryCache())
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# Drives many concurrent chains through the shared scheduler against a local fake Groq endpoint
+# that injects 429s (with Retry-After), JSON mode's 400 json_validate_failed, and latency. Every
+# chain should finish without an error step. Run from the repository root:
+#   python benchmarks/rate_limit_harness.py --chains 20 --rate-limit 0.3 --json-errors 0.2 --latency 0.05
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")  # g1 builds its default clients at import time
+
+import groq
+import g1
+from checkpoint import is_error_step
+from scheduler import RetryScheduler
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    # OpenAI-compatible /openai/v1/chat/completions that fails a fraction of calls with 429, and a
+    # fraction of JSON-mode calls the way Groq rejects a generation that is not valid JSON
+    rate_limit = 0.0
+    json_errors = 0.0
+    latency = 0.0
+    retry_after = 0.2
+    steps = 3
+    counts = {"requests": 0, "rate_limited": 0, "json_validate_failed": 0}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.lock:
+            self.counts["requests"] += 1
+            limited = random.random() < self.rate_limit
+            invalid = not limited and 'response_format' in body and random.random() < self.json_errors
+            if limited:
+                self.counts["rate_limited"] += 1
+            if invalid:
+                self.counts["json_validate_failed"] += 1
+        time.sleep(self.latency)
+        if limited:
+            payload = json.dumps({"error": {"message": "Rate limit reached", "type": "tokens"}}).encode()
+            self.send_response(429)
+            self.send_header('Retry-After', str(self.retry_after))
+        elif invalid:
+            payload = json.dumps({"error": {
+                "message": "Failed to generate JSON. Please adjust your prompt. See 'failed_generation' for more details.",
+                "type": "invalid_request_error", "code": "json_validate_failed",
+                "failed_generation": "Let me think about this step by step",
+            }}).encode()
+            self.send_response(400)
+        else:
+            if 'response_format' in body:
+                step = sum(1 for m in body['messages'] if m['role'] == 'assistant')
+                content = json.dumps({
+                    "title": f"Fake step {step}",
+                    "content": "Reasoning about the problem.",
+                    "next_action": "final_answer" if step >= self.steps else "continue",
+                })
+            else:
+                content = "42"
+            payload = json.dumps({
+                "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": body['model'],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode()
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def run_chain(prompt, client):
+    for steps, total_thinking_time in g1.generate_response(prompt, custom_client=client):
+        pass
+    return steps
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chains', type=int, default=20)
+    parser.add_argument('--rate-limit', type=float, default=0.3, help="fraction of requests answered with 429")
+    parser.add_argument('--json-errors', type=float, default=0.2, help="fraction of step requests answered with json_validate_failed")
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--rpm', type=float, default=None, help="client-side requests/min limit")
+    parser.add_argument('--max-attempts', type=int, default=5)
+    args = parser.parse_args()
+
+    FakeGroqHandler.rate_limit = args.rate_limit
+    FakeGroqHandler.json_errors = args.json_errors
+    FakeGroqHandler.latency = args.latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGroqHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    g1.cache = None
+    g1.checkpoints = None
+    g1.query_cache = None
+    g1.scheduler = RetryScheduler(requests_per_minute=args.rpm, max_attempts=args.max_attempts, base_delay=0.1)
+    client = groq.Groq(api_key="fake", base_url=f"http://127.0.0.1:{server.server_address[1]}", max_retries=0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.chains) as pool:
+        results = list(pool.map(lambda i: run_chain(f"Question {i}", client), range(args.chains)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    failed = sum(1 for steps in results if any(is_error_step(content) for _, content, *_ in steps))
+    print(f"chains: {args.chains}, failed: {failed}, wall: {elapsed:.2f}s")
+    print(f"server: {FakeGroqHandler.counts}")
+    print(f"scheduler: {g1.scheduler.stats()}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# Render cost of one 25-step chain in the Streamlit app: rebuilding every step on every yield
+# (the previous behaviour) vs StepRenderer's append-only updates. Streamlit is replaced by a
+# recorder that serializes each element the way a script run queues deltas for the browser, so
+# the numbers count real element updates without a browser attached.
+# Run from the repository root: python benchmarks/render_steps.py
+import json
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+class Recorder:
+    def __init__(self):
+        self.elements = 0
+        self.bytes = 0
+
+    def element(self, kind, body=""):
+        payload = json.dumps({"type": kind, "body": str(body)})
+        self.elements += 1
+        self.bytes += len(payload)
+
+recorder = Recorder()
+
+class Block:
+    def __init__(self, kind="block", label=""):
+        recorder.element(kind, label)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def empty(self):
+        return Block("empty")
+
+    def container(self):
+        return Block("container")
+
+fake_streamlit = types.ModuleType("streamlit")
+fake_streamlit.markdown = lambda body, **kwargs: recorder.element("markdown", body)
+fake_streamlit.write = lambda body, **kwargs: recorder.element("markdown", body)
+fake_streamlit.code = lambda body, **kwargs: recorder.element("code", body)
+fake_streamlit.error = lambda body, **kwargs: recorder.element("error", body)
+fake_streamlit.expander = lambda label, **kwargs: Block("expander", label)
+fake_streamlit.container = lambda: Block("container")
+fake_streamlit.empty = lambda: Block("empty")
+sys.modules.setdefault("streamlit", fake_streamlit)
+
+import app
+from step_renderer import StepRenderer
+
+def chain_updates(num_steps=25, step_chars=600, chunk_chars=20):
+    # The (steps, total_thinking_time) sequence a streamed chain yields
+    steps = []
+    for n in range(1, num_steps + 2):
+        title = "Final Answer" if n > num_steps else f"Step {n}: Examining the problem"
+        text = ("Reasoning about the problem in detail. " * 20)[:step_chars]
+        for end in range(chunk_chars, step_chars + 1, chunk_chars):
+            yield steps + [(title, text[:end], 0.01 * end, 0.05)], None
+        steps.append((title, text, 1.5, 0.05))
+        yield list(steps), None if n <= num_steps else 40.0
+
+def rebuild(updates):
+    container = Block("empty")
+    for steps, _ in updates:
+        with container.container():
+            for step in steps:
+                app.render_step(step)
+
+def append_only(updates):
+    renderer = StepRenderer(Block("container"), app.render_step)
+    for steps, _ in updates:
+        renderer.update(steps)
+
+def measure(name, render, updates):
+    recorder.elements = recorder.bytes = 0
+    start = time.perf_counter()
+    render(updates)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {elapsed * 1000:>9.1f} ms/chain {recorder.elements:>9,} elements {recorder.bytes / 1e6:>8.1f} MB")
+
+def main():
+    for label, chunk in (("per-step yields", 600), ("streamed, 20-char chunks", 20)):
+        updates = list(chain_updates(chunk_chars=chunk))
+        print(f"25 steps + final answer, {label} ({len(updates)} yields)")
+        measure("  rebuild every yield", rebuild, updates)
+        measure("  append-only StepRenderer", append_only, updates)
+
+if __name__ == "__main__":
+    main()
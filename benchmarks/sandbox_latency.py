@@ -0,0 +1,45 @@
+# Per-call latency of execute_code: spawn-per-call interpreter vs the warm SandboxPool.
+# Run from the repository root: python benchmarks/sandbox_latency.py
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tool-use'))
+
+from sandbox_pool import SandboxPool
+
+SNIPPETS = {
+    "print": "print(sum(range(1000)))",
+    "fractions": "from fractions import Fraction\nprint(Fraction(1, 3) + Fraction(1, 6))",
+    "numpy": "import numpy as np\nprint(np.arange(10).sum())",
+}
+
+def spawn_per_call(code):
+    result = subprocess.run(['python3', '-c', code], capture_output=True, text=True, timeout=30,
+                            env={"PYTHONPATH": os.getcwd()})
+    return result.stdout
+
+def measure(fn, code, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(code)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, max(timings) * 1000
+
+def main():
+    runs = 20
+    start = time.perf_counter()
+    pool = SandboxPool(size=2)
+    print(f"pool start-up (2 workers): {(time.perf_counter() - start) * 1000:.0f} ms")
+    print(f"{'snippet':>10} {'spawn p50':>10} {'pool p50':>10} {'spawn max':>10} {'pool max':>10}  (ms)")
+    for name, code in SNIPPETS.items():
+        spawn_p50, spawn_max = measure(spawn_per_call, code, runs)
+        pool_p50, pool_max = measure(lambda c: pool.execute(c, timeout=30), code, runs)
+        print(f"{name:>10} {spawn_p50:>10.1f} {pool_p50:>10.1f} {spawn_max:>10.1f} {pool_max:>10.1f}")
+    pool.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# API calls made by self-consistency runs after the vote is decided. Five chains run against a
+# fake model whose calls take LATENCY seconds. Three of them agree within a few steps; the other
+# two are slow, their calls failing with 503 so they sit in retry backoff, and the run stops at a
+# quorum of 3. A call a losing chain starts after the quorum (a retry, an escalation, the final
+# answer) is work for nothing. Exits 1 if any was started.
+# Run from the repository root: python benchmarks/self_consistency_cancel.py
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+import g1
+from fake_client import fake_content, fake_response
+from self_consistency import generate_self_consistent
+
+LATENCY = 0.05
+FAST_STEPS = 2
+
+class Overloaded(Exception):
+    status_code = 503
+
+class SplitClient:
+    # Chains with seed 0-2 finish in FAST_STEPS steps with the same final answer; every call of
+    # the others fails
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens, response_format=None, seed=0, stream=False, **kwargs):
+        with self._lock:
+            self.calls.append((time.perf_counter(), seed))
+        time.sleep(LATENCY)
+        if seed >= 3:
+            raise Overloaded("Service unavailable")
+        content = fake_content(messages, response_format, FAST_STEPS)
+        if stream:
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])])
+        return fake_response(content, messages)
+
+def main():
+    g1.cache = None
+    g1.checkpoints = None
+    g1.query_cache = None
+    g1.router = None
+    client = SplitClient()
+    for chains, result, total_time in generate_self_consistent("Question", n=5, quorum=3, custom_client=client):
+        if result is not None:
+            decided = time.perf_counter()
+    time.sleep(3.0)  # longer than the backoff the losing chains are in
+    late = [seed for started, seed in client.calls if started > decided]
+    print(f"{len(client.calls)} API calls, {len(late)} started after the quorum was reached "
+          f"({time.perf_counter() - decided:.2f} s after it)")
+    print(f"chains: {[(chain.index, chain.status, len(chain.steps)) for chain in chains]}")
+    return 1 if late else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# Load test of server.py against a local fake LLM: end-to-end latency percentiles of SSE chains
+# as concurrency grows, the per-client limit, and cancellation when clients disconnect early.
+# Run from the repository root: python benchmarks/server_load.py
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+import g1
+from fake_client import FakeAsyncClient
+from server import ChainServer
+
+LATENCY = 0.05
+STEPS = 3
+
+def start_server(chain_server):
+    # The server gets its own thread and event loop, like a separate process would
+    ready = threading.Event()
+    state = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        state["server"] = loop.run_until_complete(chain_server.start("127.0.0.1", 0))
+        state["loop"] = loop
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return state["server"].sockets[0].getsockname()[1]
+
+async def request_chain(port, prompt, client_id, disconnect_after_first_step=False):
+    # Returns (status, seconds to first step, seconds to final event)
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = ('{"prompt": "%s"}' % prompt).encode()
+    writer.write(b"POST /v1/chains HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 b"X-Client-Id: " + client_id.encode() + b"\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    first_step = final = None
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if line.startswith(b"event: step") and first_step is None:
+            first_step = time.perf_counter() - start
+            if disconnect_after_first_step:
+                break
+        elif line.startswith(b"event: final"):
+            final = time.perf_counter() - start
+    writer.close()
+    return status, first_step, final
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))] if values else float("nan")
+
+async def load(port, concurrency, total):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            return await request_chain(port, f"Question {i}", f"client-{i}")
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    finals = [final for status, _, final in results if status == 200 and final is not None]
+    firsts = [first for status, first, _ in results if first is not None]
+    print(f"{concurrency:>6} {total:>6} {total / elapsed:>9.1f} {percentile(firsts, 50) * 1000:>9.0f} "
+          f"{percentile(finals, 50) * 1000:>8.0f} {percentile(finals, 95) * 1000:>8.0f} {percentile(finals, 99) * 1000:>8.0f} "
+          f"{total - len(finals):>7}")
+
+async def per_client_limit(port, per_client):
+    results = await asyncio.gather(*(request_chain(port, f"Same client {i}", "one-client") for i in range(per_client * 3)))
+    statuses = [status for status, _, _ in results]
+    print(f"one client, {len(statuses)} concurrent requests: {statuses.count(200)} served, {statuses.count(429)} rejected with 429")
+
+async def disconnects(port, fake_client, chain_server, count=50):
+    calls_before = fake_client.calls
+    await asyncio.gather(*(request_chain(port, f"Abandoned {i}", f"gone-{i}", disconnect_after_first_step=True) for i in range(count)))
+    await asyncio.sleep(LATENCY * (STEPS + 2))
+    calls = fake_client.calls - calls_before
+    print(f"{count} clients disconnecting after their first step: {chain_server.stats['cancelled']} chains cancelled, "
+          f"{calls / count:.1f} API calls per chain instead of {STEPS + 1}")
+
+def main():
+    g1.cache = None  # every request should reach the (fake) API
+    g1.checkpoints = None
+    g1.query_cache = None
+    fake_client = FakeAsyncClient(latency=LATENCY, steps=STEPS)
+    # Every simulated client connects from localhost, so treat it as a proxy passing X-Client-Id
+    chain_server = ChainServer(fake_client, max_chains=1024, per_client=4, trusted_proxies={"127.0.0.1"})
+    port = start_server(chain_server)
+    print(f"fake LLM: {LATENCY * 1000:.0f} ms per call, {STEPS} steps + final answer per chain "
+          f"(ideal chain latency {(STEPS + 1) * LATENCY * 1000:.0f} ms)")
+    print(f"{'conc':>6} {'total':>6} {'chains/s':>9} {'p50 1st':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'failed':>7}")
+    for concurrency in (1, 10, 100, 500):
+        asyncio.run(load(port, concurrency, max(50, concurrency * 4)))
+    asyncio.run(per_client_limit(port, chain_server.per_client))
+    asyncio.run(disconnects(port, fake_client, chain_server))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# API calls spent per chain when some step replies are malformed, with the old strict json.loads
+# handling vs the tolerant step parser. The fake model answers with a fixed mix of reply faults
+# (truncated at max_tokens, fenced, wrapped in prose, missing keys, unusable text), and rejects
+# some with JSON mode's 400 json_validate_failed, whose failed_generation holds the broken reply.
+# Run from the repository root: python benchmarks/step_repair.py
+import json
+import os
+import random
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+import g1
+from fake_client import fake_content, fake_response
+from step_parser import parse_stats
+
+class JsonValidateFailed(Exception):
+    # What groq.BadRequestError carries when JSON mode rejects a generation
+    status_code = 400
+
+    def __init__(self, generation):
+        super().__init__("Error code: 400 - json_validate_failed")
+        self.body = {"error": {"message": "Failed to generate JSON.", "type": "invalid_request_error",
+                               "code": "json_validate_failed", "failed_generation": generation}}
+
+def reject(text):
+    raise JsonValidateFailed(text)
+
+CHAINS = 300
+STEPS = 4
+FAULTS = [  # (share of step replies, how the reply is damaged)
+    (0.06, "truncated", lambda text: text[:int(len(text) * 0.7)]),
+    (0.03, "fenced", lambda text: f"```json\n{text}\n```"),
+    (0.02, "prose", lambda text: f"Here is the next step:\n{text}"),
+    (0.03, "no next_action", lambda text: json.dumps({k: v for k, v in json.loads(text).items() if k != "next_action"})),
+    (0.01, "no title", lambda text: json.dumps({k: v for k, v in json.loads(text).items() if k != "title"})),
+    (0.02, "unusable", lambda text: "I'm sorry, I can't continue."),
+    (0.04, "json_validate_failed", lambda text: reject(text[:int(len(text) * 0.7)])),
+]
+
+class FaultyClient:
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.faults = {}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens, response_format=None, **kwargs):
+        self.calls += 1
+        content = fake_content(messages, response_format, STEPS)
+        if response_format is not None:
+            roll = self.random.random()
+            for share, name, damage in FAULTS:
+                if roll < share:
+                    self.faults[name] = self.faults.get(name, 0) + 1
+                    content = damage(content)
+                    break
+                roll -= share
+        return fake_response(content, messages)
+
+def strict_load_step(text, span=None):
+    # The handling before the tolerant parser: any invalid JSON means another API call
+    return json.loads(text), text
+
+def run(label, load_step, recover_step):
+    g1.load_step = load_step
+    g1.recover_step = recover_step
+    client = FaultyClient()
+    crashed = 0
+    for i in range(CHAINS):
+        try:
+            for _ in g1.generate_response(f"Question {i}", custom_client=client):
+                pass
+        except KeyError:
+            crashed += 1  # generate_response indexed a key the model left out
+    print(f"{label:<16} {client.calls / CHAINS:>6.2f} calls/chain  {client.calls - CHAINS * (STEPS + 1):>5} extra calls  "
+          f"{crashed:>3} chains crashed  faults {client.faults}")
+
+def main():
+    g1.cache = None
+    g1.checkpoints = None
+    g1.query_cache = None
+    g1.scheduler.base_delay = 0.0  # count calls, not backoff sleeps
+    tolerant, recover = g1.load_step, g1.recover_step
+    print(f"{CHAINS} chains of {STEPS} steps + final answer; {sum(f[0] for f in FAULTS):.0%} of step replies damaged")
+    run("strict json", strict_load_step, lambda exc, span=None: None)
+    run("tolerant parser", tolerant, recover)
+    print(parse_stats.stats())
+
+if __name__ == "__main__":
+    main()
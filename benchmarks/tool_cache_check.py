@@ -0,0 +1,143 @@
+# Checks the tool result cache end to end with local stand-ins for Exa and Wolfram Alpha: hits and
+# misses per tool, TTL expiry (on a fake clock), coalescing of identical concurrent calls into one
+# upstream request, and error results staying uncached. Exits 1 if any check fails.
+# Run from the repository root: python benchmarks/tool_cache_check.py
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tool-use'))
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+os.environ.setdefault("EXA_API_KEY", "benchmark")
+os.environ.setdefault("WOLFRAM_APP_ID", "benchmark")
+
+import requests
+
+import g1_experimental
+import tool_cache as tool_cache_module
+from tool_cache import tool_cache
+
+LATENCY = 0.2
+CONCURRENCY = 8
+
+class FakeClock:
+    def __init__(self):
+        self.offset = 0.0
+
+    def monotonic(self):
+        return time.monotonic() + self.offset
+
+class StandInExa:
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(LATENCY)
+        if self.fail:
+            raise ConnectionError("stand-in Exa is down")
+
+    def search_and_contents(self, query, num_results=5, **kwargs):
+        self._call()
+        return SimpleNamespace(results=[
+            SimpleNamespace(id=f"{query}-{i}", title=f"Result {i} for {query}", text="Snippet", url=f"https://example.com/{i}")
+            for i in range(num_results)
+        ])
+
+    def get_contents(self, ids, text=True):
+        self._call()
+        return SimpleNamespace(results=[SimpleNamespace(title=f"Page {id}", text="Page text") for id in ids])
+
+class StandInWolfram:
+    Timeout = requests.Timeout
+
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        time.sleep(LATENCY)
+        pods = [{"subpods": [{"plaintext": f"answer to {params['input']}"}]}]
+        return SimpleNamespace(json=lambda: {"queryresult": {"success": True, "pods": pods}})
+
+failures = []
+
+def check(name, condition, detail=""):
+    print(f"{'ok' if condition else 'FAIL':<5} {name}{f'  ({detail})' if detail else ''}")
+    if not condition:
+        failures.append(name)
+
+def concurrently(fn, n):
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def run(i):
+        barrier.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def main():
+    clock = FakeClock()
+    tool_cache_module.time = clock
+    exa = g1_experimental.exa = StandInExa()
+    wolfram = g1_experimental.requests = StandInWolfram()
+    tool_cache.clear()
+
+    first = g1_experimental.web_search("groq lpu", num_results=2)
+    second = g1_experimental.web_search("groq lpu", num_results=2)
+    g1_experimental.web_search("groq lpu", num_results=3)
+    stats = tool_cache.stats()["web_search"]
+    check("repeat web_search is a hit", second == first and exa.calls == 2, f"{exa.calls} upstream calls")
+    check("web_search counters", (stats["hits"], stats["misses"], stats["calls"]) == (1, 2, 2),
+          f"hits {stats['hits']}, misses {stats['misses']}, calls {stats['calls']}")
+
+    clock.offset += 599
+    g1_experimental.web_search("groq lpu", num_results=2)
+    check("web_search served before its 600 s TTL", exa.calls == 2, f"{exa.calls} upstream calls")
+    clock.offset += 2
+    g1_experimental.web_search("groq lpu", num_results=2)
+    check("web_search refetched after its TTL", exa.calls == 3, f"{exa.calls} upstream calls")
+
+    start = time.perf_counter()
+    pages = concurrently(lambda: g1_experimental.fetch_page_content(["a", "b"]), CONCURRENCY)
+    elapsed = time.perf_counter() - start
+    stats = tool_cache.stats()["fetch_page_content"]
+    check("concurrent identical calls coalesce into one request", exa.calls == 4 and len(set(pages)) == 1,
+          f"{exa.calls - 3} upstream calls for {CONCURRENCY} callers in {elapsed:.2f} s")
+    check("coalesced counter", (stats["misses"], stats["coalesced"]) == (1, CONCURRENCY - 1),
+          f"misses {stats['misses']}, coalesced {stats['coalesced']}")
+
+    answers = concurrently(lambda: g1_experimental.wolfram_alpha_calculate("2+2"), CONCURRENCY)
+    clock.offset += 24 * 3600 - 10
+    g1_experimental.wolfram_alpha_calculate("2+2")
+    check("wolfram_alpha coalesced and cached for a day", wolfram.calls == 1 and answers[0] == "answer to 2+2",
+          f"{wolfram.calls} upstream calls")
+    clock.offset += 20
+    g1_experimental.wolfram_alpha_calculate("2+2")
+    check("wolfram_alpha refetched after its TTL", wolfram.calls == 2, f"{wolfram.calls} upstream calls")
+
+    exa.fail = True
+    errors = [g1_experimental.web_search("outage") for _ in range(2)]
+    exa.fail = False
+    recovered = g1_experimental.web_search("outage")
+    check("error results are not cached", exa.calls == 7 and errors[0].startswith("An error occurred")
+          and recovered.startswith("Result 1"), f"{exa.calls - 4} upstream calls for 3 lookups")
+
+    hit_rate = tool_cache.stats()["fetch_page_content"]["hit_rate"]
+    check("hit rate counts coalesced callers", abs(hit_rate - (CONCURRENCY - 1) / CONCURRENCY) < 1e-9, f"{hit_rate:.3f}")
+    print(f"{len(failures)} check(s) failed" if failures else "all checks passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from response_cache import request_key
+
+# Checkpoints of reasoning chains in progress. After every completed step a chain saves its
+# messages (tool results included), steps and timings under its chain ID, so a chain cut short by
+# an exception, a timeout, a cancellation or a lost session resumes from its last completed step
+# instead of paying for every step again. Each chain is one row, replaced on every save, so the
+# store never holds more than the latest state of a chain. Finished chains are kept and replayed
+# without any API calls; checkpoints older than `ttl` or beyond `max_chains` are dropped.
+# Only chains run with an explicit chain ID are checkpointed. The ID is the caller's to scope: two
+# users or two concurrent runs of the same prompt must not share one, or they resume and overwrite
+# each other's chains.
+
+STAGES = ("steps", "final_answer", "done")
+
+def chain_key(prompt, **params):
+    # Stable chain ID from the prompt and whatever scopes it to the caller, e.g.
+    # chain_key(prompt, user=user_id, session=session_id)
+    return request_key(prompt=prompt, **params)[:32]
+
+def is_error_step(step_data):
+    # make_api_call reports a failed call as an {"title": "Error", ...} step; never checkpoint those
+    return isinstance(step_data, dict) and step_data.get('title') == "Error"
+
+class CheckpointStore:
+    def __init__(self, db_path=None, ttl=24 * 3600, max_chains=1000):
+        # db_path: None keeps checkpoints in memory for the life of the process
+        self.ttl = ttl
+        self.max_chains = max_chains
+        self.saves = 0
+        self.resumes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        if db_path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "chain_id TEXT PRIMARY KEY, stage TEXT NOT NULL, state TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS checkpoints_updated ON checkpoints (updated)")
+        self._db.commit()
+        self.gc()
+
+    def save(self, chain_id, stage, messages, steps, step_count, total_thinking_time, controller=None):
+        # stage: "steps" (step_count is the next step to take), "final_answer" (only the final
+        # answer is left) or "done" (steps ends with the final answer)
+        if stage not in STAGES:
+            raise ValueError(f"unknown checkpoint stage: {stage}")
+        state = json.dumps({
+            "messages": messages,
+            "steps": steps,
+            "step_count": step_count,
+            "total_thinking_time": total_thinking_time,
+            "tokens_used": controller.tokens_used if controller is not None else 0,
+            "stop": controller.stop if controller is not None else None,
+        }, ensure_ascii=False, default=str)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints (chain_id, stage, state, updated) VALUES (?, ?, ?, ?)",
+                (chain_id, stage, state, time.time()),
+            )
+            self.saves += 1
+            self._evict()
+            self._db.commit()
+
+    def load(self, chain_id):
+        # The saved state as a dict with its "stage", or None
+        with self._lock:
+            row = self._db.execute("SELECT stage, state, updated FROM checkpoints WHERE chain_id = ?", (chain_id,)).fetchone()
+            if row is None:
+                return None
+            stage, state, updated = row
+            if self.ttl is not None and time.time() - updated > self.ttl:
+                self._db.execute("DELETE FROM checkpoints WHERE chain_id = ?", (chain_id,))
+                self._db.commit()
+                self.evictions += 1
+                return None
+        return dict(json.loads(state), stage=stage)
+
+    def resume(self, chain_id, width, stream=False, controller=None):
+        # Returns (messages, steps, step_count, total_thinking_time, stage) for a saved chain, or
+        # None. Steps are cut to their first `width` elements (3 for g1, 6 for tool-use) plus a
+        # None time-to-first-token when streaming, and the controller is charged for the tokens
+        # the chain already spent.
+        state = self.load(chain_id)
+        if state is None:
+            return None
+        with self._lock:
+            self.resumes += 1
+        if controller is not None:
+            controller.tokens_used = state["tokens_used"]
+            controller.stop = state["stop"]
+        steps = [tuple(step[:width]) + ((None,) if stream else ()) for step in state["steps"]]
+        return state["messages"], steps, state["step_count"], state["total_thinking_time"], state["stage"]
+
+    def delete(self, chain_id):
+        with self._lock:
+            self._db.execute("DELETE FROM checkpoints WHERE chain_id = ?", (chain_id,))
+            self._db.commit()
+
+    def gc(self):
+        # Drops expired checkpoints and the oldest beyond max_chains; returns how many went
+        with self._lock:
+            removed = self._evict()
+            self._db.commit()
+            return removed
+
+    def compact(self):
+        # gc() plus returning the freed pages of a checkpoint file to the filesystem
+        removed = self.gc()
+        with self._lock:
+            self._db.execute("VACUUM")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            rows = dict(self._db.execute("SELECT stage, COUNT(*) FROM checkpoints GROUP BY stage").fetchall())
+            return {
+                "saves": self.saves,
+                "resumes": self.resumes,
+                "evictions": self.evictions,
+                "chains": sum(rows.values()),
+                "in_progress": rows.get("steps", 0) + rows.get("final_answer", 0),
+                "done": rows.get("done", 0),
+            }
+
+    def _evict(self):
+        removed = 0
+        if self.ttl is not None:
+            removed += max(self._db.execute("DELETE FROM checkpoints WHERE updated < ?", (time.time() - self.ttl,)).rowcount, 0)
+        count = self._db.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+        if count > self.max_chains:
+            excess = count - self.max_chains
+            self._db.execute(
+                "DELETE FROM checkpoints WHERE chain_id IN (SELECT chain_id FROM checkpoints ORDER BY updated LIMIT ?)",
+                (excess,),
+            )
+            removed += excess
+        self.evictions += removed
+        return removed
+
+def default_checkpoints():
+    # Off by default. G1_CHECKPOINTS=on keeps checkpoints in memory for the life of the process;
+    # G1_CHECKPOINT_DB set to a file path also keeps them across restarts
+    db_path = os.environ.get("G1_CHECKPOINT_DB")
+    if not db_path and os.environ.get("G1_CHECKPOINTS", "off").lower() not in ("on", "1", "true"):
+        return None
+    return CheckpointStore(db_path=db_path)
@@ -0,0 +1,88 @@
+import json
+
+# Bounded-context mode for reasoning chains. The full history stays in `messages`; compact()
+# returns the view actually sent to the model, keeping it under a token budget by shortening
+# tool results the model has already used and collapsing middle steps into a short digest.
+
+def count_tokens(messages):
+    # ~4 characters per token is close enough for budgeting and reporting
+    return sum(len(str(m.get('content', ''))) for m in messages) // 4 + 4 * len(messages)
+
+def step_gist(message, max_chars=120):
+    try:
+        step = json.loads(message['content'])
+        title = step.get('title', '')
+        content = str(step.get('content', ''))
+    except (ValueError, AttributeError):
+        title, content = '', str(message['content'])
+    gist = content.split('. ')[0]
+    if len(gist) > max_chars:
+        gist = gist[:max_chars].rstrip() + '...'
+    return f"{title}: {gist}" if title else gist
+
+class ContextCompactor:
+    def __init__(self, token_budget=4000, keep_first=2, keep_last=4, tool_result_chars=300):
+        self.token_budget = token_budget
+        self.keep_first = keep_first
+        self.keep_last = keep_last
+        self.tool_result_chars = tool_result_chars
+        self.calls = 0
+        self.full_tokens = 0
+        self.sent_tokens = 0
+
+    def compact(self, messages, header_len):
+        # messages[:header_len] (system prompt, query, context) are always sent verbatim
+        full = count_tokens(messages)
+        view = messages
+        if full > self.token_budget:
+            header, units = messages[:header_len], self._units(messages[header_len:])
+            units = self._shorten_tool_results(units)
+            view = header + [m for unit in units for m in unit]
+            keep_last = self.keep_last
+            while count_tokens(view) > self.token_budget and keep_last >= 1 and len(units) > self.keep_first + keep_last:
+                view = header + self._collapse(units, keep_last)
+                keep_last -= 1
+        self.calls += 1
+        self.full_tokens += full
+        self.sent_tokens += count_tokens(view)
+        return view
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "full_prompt_tokens": self.full_tokens,
+            "sent_prompt_tokens": self.sent_tokens,
+            "saved_prompt_tokens": self.full_tokens - self.sent_tokens,
+        }
+
+    def _units(self, messages):
+        # One unit per assistant step, together with the tool results and prompts that follow it
+        units = []
+        for message in messages:
+            if message['role'] == 'assistant' or not units:
+                units.append([message])
+            else:
+                units[-1].append(message)
+        return units
+
+    def _shorten_tool_results(self, units):
+        # Tool results before the latest step have already been read and reasoned over
+        shortened = []
+        for unit in units[:-1]:
+            unit = [
+                {**m, "content": m['content'][:self.tool_result_chars] + ' [truncated]'}
+                if m['role'] == 'system' and len(m['content']) > self.tool_result_chars else m
+                for m in unit
+            ]
+            shortened.append(unit)
+        return shortened + units[-1:]
+
+    def _collapse(self, units, keep_last):
+        first, middle, last = units[:self.keep_first], units[self.keep_first:-keep_last], units[-keep_last:]
+        start = self.keep_first + 1
+        digest = "\n".join(f"- {step_gist(unit[0])}" for unit in middle if unit[0]['role'] == 'assistant')
+        summary = {
+            "role": "system",
+            "content": f"Earlier steps {start}-{start + len(middle) - 1} condensed to save context:\n{digest}",
+        }
+        return [m for unit in first for m in unit] + [summary] + [m for unit in last for m in unit]
@@ -0,0 +1,58 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+# Stand-ins for groq.Groq / groq.AsyncGroq that answer instantly (or after a fixed latency) with
+# well-formed steps, for dry runs, benchmarks and end-to-end checks of the batch runner without
+# an API key. Every chain takes `steps` steps and its final answer echoes the query.
+
+def is_final_request(messages, response_format):
+    # Streamed steps are requested without JSON mode, so the final-answer prompt is what tells
+    # the final answer apart
+    last = messages[-1]
+    return response_format is None and last["role"] == "user" and last["content"].startswith("Please provide the final answer")
+
+def fake_content(messages, response_format, steps):
+    if is_final_request(messages, response_format):
+        query = next((m["content"] for m in messages if m["role"] == "user"), "")
+        return f"Fake final answer for: {query[:80]}"
+    step = sum(1 for m in messages if m["role"] == "assistant")
+    return json.dumps({
+        "title": f"Fake step {step}",
+        "content": "Reasoning about the problem.",
+        "next_action": "final_answer" if step >= steps else "continue",
+    })
+
+def fake_response(content, messages):
+    usage = SimpleNamespace(prompt_tokens=sum(len(str(m["content"])) for m in messages) // 4,
+                            completion_tokens=len(content) // 4)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+class FakeClient:
+    def __init__(self, latency=0.0, steps=3):
+        self.latency = latency
+        self.steps = steps
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, max_tokens, response_format=None, stream=False, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        content = fake_content(messages, response_format, self.steps)
+        if stream:
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])])
+        return fake_response(content, messages)
+
+class FakeAsyncClient:
+    def __init__(self, latency=0.0, steps=3):
+        self.latency = latency
+        self.steps = steps
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, max_tokens, response_format=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return fake_response(fake_content(messages, response_format, self.steps), messages)
@@ -1,12 +1,42 @@
 import streamlit as st
-from g1 import generate_response
+import g1
+from g1 import generate_response, MAX_INLINE_FILE_CHARS
+from file_index import index_cache
+from ocr import ocr_service
+from telemetry import tracer_from_env
+from step_renderer import StepRenderer
 import json
 from io import StringIO
-from PIL import Image
-import pytesseract
-import io
+
+def render_step(step):
+    # Draws one step into the active container; StepRenderer calls it only when the step changed
+    title, content, thinking_time = step
+    # Ensure content is a string
+    if not isinstance(content, str):
+        content = json.dumps(content)
+    if title.startswith("Final Answer"):
+        st.markdown(f"### {title}")
+        if '```' in content:
+            parts = content.split('```')
+            for index, part in enumerate(parts):
+                if index % 2 == 0:
+                    st.markdown(part)
+                else:
+                    if '\n' in part:
+                        lang_line, code = part.split('\n', 1)
+                        lang = lang_line.strip()
+                    else:
+                        lang = ''
+                        code = part
+                    st.code(part, language=lang)
+        else:
+            st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
+    else:
+        with st.expander(title, expanded=True):
+            st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
 
 def main():
+    g1.tracer = tracer_from_env()  # set G1_TRACE_FILE, G1_METRICS_FILE or G1_METRICS_PORT to enable
     st.set_page_config(page_title="g1 prototype", page_icon="🧠", layout="wide")
     
     st.title("g1: Using Llama-3.1 70b on Groq to create o1-like reasoning chains")
@@ -22,21 +52,31 @@ def main():
     
     file_content = None
     image_content = None
+    ocr_job = None
     
     if uploaded_file is not None:
         file_extension = uploaded_file.name.split('.')[-1].lower()
         st.write(f"Uploaded file extension: {file_extension}")
         
         if file_extension in image_accepted_types:
-            image = Image.open(io.BytesIO(uploaded_file.getvalue()))
-            image_content = pytesseract.image_to_string(image)
-            st.success(f"Image '{uploaded_file.name}' uploaded and processed successfully!")
-            st.image(image, caption="Uploaded Image", width=500)
+            # OCR runs in background processes and is cached by content hash, so reruns (e.g. typing
+            # in the query box) never redo it; the text is only awaited once there is a query
+            ocr_job = ocr_service.submit(uploaded_file.getvalue())
+            if ocr_job.done():
+                st.success(f"Image '{uploaded_file.name}' uploaded and processed successfully!")
+            else:
+                st.success(f"Image '{uploaded_file.name}' uploaded; extracting its text in the background.")
+            st.image(uploaded_file.getvalue(), caption="Uploaded Image", width=500)
         else:
             try:
                 stringio = StringIO(uploaded_file.getvalue().decode("utf-8"))
                 file_content = stringio.read()
                 st.success(f"File '{uploaded_file.name}' uploaded and read as text successfully!")
+                if len(file_content) > MAX_INLINE_FILE_CHARS:
+                    # Large files are indexed once (cached by content hash) and queried per step
+                    stats = index_cache.get(file_content).stats()
+                    st.caption(f"Indexed {stats['chunks']} sections ({stats['chars']:,} characters) in {stats['ingest_time'] * 1000:.0f} ms; "
+                               "only the most relevant sections are sent with each step.")
             except UnicodeDecodeError:
                 st.error("Unable to read the file as text. Please upload a text-based file or an image.")
 
@@ -46,43 +86,29 @@ def main():
     user_query = st.text_input("Enter your query:", placeholder="e.g., How many 'R's are in the word strawberry?")
     
     if user_query:
+        if ocr_job is not None:
+            with st.spinner("Extracting text from the image..."):
+                try:
+                    image_content = ocr_job.result()
+                except Exception as e:
+                    st.error(f"Unable to read text from the image. Error: {str(e)}")
         st.write("Generating response...")
         
-        # Create empty elements to hold the generated text and total time
-        response_container = st.empty()
+        # Each step is drawn into its own placeholder; only steps that change are redrawn
+        response_container = st.container()
+        renderer = StepRenderer(response_container, render_step)
         time_container = st.empty()
         
         # Generate and display the response
         for steps, total_thinking_time in generate_response(user_query, file_content=file_content, image_content=image_content):
-            with response_container.container():
-                for i, (title, content, thinking_time) in enumerate(steps):
-                    # Ensure content is a string
-                    if not isinstance(content, str):
-                        content = json.dumps(content)
-                    if title.startswith("Final Answer"):
-                        st.markdown(f"### {title}")
-                        if '```' in content:
-                            parts = content.split('```')
-                            for index, part in enumerate(parts):
-                                if index % 2 == 0:
-                                    st.markdown(part)
-                                else:
-                                    if '\n' in part:
-                                        lang_line, code = part.split('\n', 1)
-                                        lang = lang_line.strip()
-                                    else:
-                                        lang = ''
-                                        code = part
-                                    st.code(part, language=lang)
-                        else:
-                            st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
-                    else:
-                        with st.expander(title, expanded=True):
-                            st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
+            renderer.update(steps)
             
             # Only show total time when it's available at the end
             if total_thinking_time is not None:
                 time_container.markdown(f"**Total thinking time: {total_thinking_time:.2f} seconds**")
+                if file_content and len(file_content) > MAX_INLINE_FILE_CHARS:
+                    stats = index_cache.get(file_content).stats()
+                    st.caption(f"File retrieval: {stats['avg_query_time'] * 1000:.1f} ms per query over {stats['queries']} queries")
 
 if __name__ == "__main__":
     main()
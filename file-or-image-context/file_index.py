@@ -0,0 +1,127 @@
+import hashlib
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Retrieval over uploaded files. Instead of pasting a whole file into the prompt (and resending
+# it on every step), the file is split into overlapping line-aligned chunks and indexed with
+# BM25; each step then gets only the chunks most relevant to the query and the latest step.
+# Indexes are cached by the file's content hash, so Streamlit reruns never re-index a file.
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+def chunk_text(text, chunk_chars=1200, overlap_chars=200):
+    # Yields (start_line, end_line, text) chunks of about chunk_chars, split on line boundaries and
+    # overlapping by about overlap_chars so an answer spanning a boundary is still found whole
+    lines = []
+    for line in text.splitlines(keepends=True):
+        # Very long lines (minified files, single-line JSON) are split so no chunk grows unbounded
+        while len(line) > chunk_chars:
+            lines.append(line[:chunk_chars])
+            line = line[chunk_chars:]
+        lines.append(line)
+
+    start = 0
+    while start < len(lines):
+        end, size = start, 0
+        while end < len(lines) and (size == 0 or size + len(lines[end]) <= chunk_chars):
+            size += len(lines[end])
+            end += 1
+        yield start + 1, end, "".join(lines[start:end])
+        if end >= len(lines):
+            break
+        # Step back over the last overlap_chars of this chunk, always moving forward at least one line
+        back, carried = end, 0
+        while back - 1 > start and carried + len(lines[back - 1]) <= overlap_chars:
+            back -= 1
+            carried += len(lines[back])
+        start = back
+
+class FileIndex:
+    def __init__(self, text, chunk_chars=1200, overlap_chars=200, k1=1.5, b=0.75):
+        started = time.perf_counter()
+        self.k1 = k1
+        self.chunks = list(chunk_text(text, chunk_chars, overlap_chars))
+        self.postings = {}
+        lengths = []
+        for chunk_id, (_, _, chunk) in enumerate(self.chunks):
+            counts = Counter(tokenize(chunk))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((chunk_id, tf))
+        average = sum(lengths) / len(lengths) if lengths else 0
+        # Per-chunk BM25 length normalization, precomputed so a query only walks postings
+        self.norms = [k1 * (1 - b + b * length / average) if average else k1 for length in lengths]
+        self.idf = {term: math.log(1 + (len(self.chunks) - len(posts) + 0.5) / (len(posts) + 0.5))
+                    for term, posts in self.postings.items()}
+        self.chars = len(text)
+        self.ingest_time = time.perf_counter() - started
+        self.queries = 0
+        self.query_time = 0.0
+
+    def search(self, query, k=4):
+        # Returns up to k (score, start_line, end_line, text) tuples, best first. When no term of
+        # the query occurs in the file, the leading k chunks are returned with a score of 0
+        started = time.perf_counter()
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for chunk_id, tf in self.postings[term]:
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.norms[chunk_id])
+        if scores:
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        else:
+            best = [(chunk_id, 0.0) for chunk_id in range(min(k, len(self.chunks)))]
+        self.queries += 1
+        self.query_time += time.perf_counter() - started
+        return [(score, *self.chunks[chunk_id]) for chunk_id, score in best]
+
+    def stats(self):
+        return {
+            "chars": self.chars,
+            "chunks": len(self.chunks),
+            "terms": len(self.postings),
+            "ingest_time": self.ingest_time,
+            "queries": self.queries,
+            "avg_query_time": self.query_time / self.queries if self.queries else 0.0,
+        }
+
+class IndexCache:
+    # Small LRU of FileIndex objects keyed by the sha256 of the file's content
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        # Index outside the lock; two threads racing on the same new file just both build it
+        index = FileIndex(text)
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+        return index
+
+index_cache = IndexCache()
+
+def format_excerpts(results, total_chunks):
+    sections = [f"[Lines {start}-{end}]\n{text.rstrip()}" for _, start, end, text in sorted(results, key=lambda r: r[1])]
+    if results and not any(score for score, *_ in results):
+        return (f"The file is too large to include in full. None of its {total_chunks} sections matched the query "
+                f"and the latest reasoning step; these are the first {len(results)}:\n\n" + "\n\n".join(sections))
+    return (f"The file is too large to include in full. These are the {len(results)} of its {total_chunks} "
+            "sections most relevant to the query and the latest reasoning step:\n\n" + "\n\n".join(sections))
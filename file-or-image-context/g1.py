@@ -1,42 +1,85 @@
 import groq
 import time
 import json
+import os
+import sys
 
-client = groq.Groq()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from step_parser import load_step, recover_step
+from response_cache import default_cache, request_key
+from scheduler import scheduler, estimate_tokens
+from telemetry import NULL_SPAN, response_usage
+from step_controller import StepController
+from file_index import index_cache, format_excerpts
 
-def make_api_call(messages, max_tokens, is_final_answer=False, custom_client=None):
-    global client
-    if custom_client != None:
-        client = custom_client
-    
-    for attempt in range(3):
+client = groq.Groq(max_retries=0)  # retries and backoff are handled by the shared scheduler
+
+# Shared response cache consulted by every API call; set to None to always hit the API
+cache = default_cache()
+
+# Optional telemetry.Tracer; when set, every chain records spans for its steps, API attempts and retries
+tracer = None
+
+def build_request(messages, max_tokens, is_final_answer=False):
+    request = {"model": "llama-3.1-70b-versatile", "messages": messages, "max_tokens": max_tokens, "temperature": 0.2}
+    if not is_final_answer:
+        request["response_format"] = {"type": "json_object"}
+    return request
+
+def make_api_call(messages, max_tokens, is_final_answer=False, custom_client=None, span=NULL_SPAN):
+    api_client = custom_client if custom_client is not None else client  # not the global, which concurrent chains share
+
+    request = build_request(messages, max_tokens, is_final_answer)
+    key = request_key(**request) if cache is not None else None
+    cached = cache.get(key) if key else None
+    if cached is not None:
+        span.set(cache_hit=True)
+        return cached if is_final_answer else json.loads(cached)
+
+    tokens = estimate_tokens(messages, max_tokens)
+    for attempt in range(scheduler.max_attempts):
+        queue_time = scheduler.acquire(tokens)
+        attempt_span = span.child("api_attempt", model=request["model"], attempt=attempt, queue_time=queue_time)
         try:
+            response = api_client.chat.completions.create(**request)
+            content = response.choices[0].message.content
             if is_final_answer:
-                response = client.chat.completions.create(
-                    model="llama-3.1-70b-versatile",
-                    messages=messages,
-                    max_tokens=max_tokens,
-                    temperature=0.2,
-            ) 
-                return response.choices[0].message.content
+                result = content
             else:
-                response = client.chat.completions.create(
-                    model="llama-3.1-70b-versatile",
-                    messages=messages,
-                    max_tokens=max_tokens,
-                    temperature=0.2,
-                    response_format={"type": "json_object"}
-                )
-                return json.loads(response.choices[0].message.content)
+                result, content = load_step(content, attempt_span)
+            attempt_span.end(status="ok", **response_usage(response))
+            if key:
+                cache.put(key, content)
+            return result
         except Exception as e:
-            if attempt == 2:
+            # JSON mode rejects a malformed step with the model's text attached; repair it if possible
+            recovered = None if is_final_answer else recover_step(e, attempt_span)
+            if recovered is not None:
+                result, content = recovered
+                attempt_span.end(status="repaired")
+                if key:
+                    cache.put(key, content)
+                return result
+            attempt_span.end(status="error", error=str(e))
+            try:
+                scheduler.backoff(attempt, e)
+            except Exception:
                 if is_final_answer:
-                    return {"title": "Error", "content": f"Failed to generate final answer after 3 attempts. Error: {str(e)}"}
+                    return {"title": "Error", "content": f"Failed to generate final answer after {attempt + 1} attempts. Error: {str(e)}"}
                 else:
-                    return {"title": "Error", "content": f"Failed to generate step after 3 attempts. Error: {str(e)}", "next_action": "final_answer"}
-            time.sleep(1)  # Wait for 1 second before retrying
+                    return {"title": "Error", "content": f"Failed to generate step after {attempt + 1} attempts. Error: {str(e)}", "next_action": "final_answer"}
+
+# Files up to this size are included in full; larger ones are indexed and only the most relevant
+# sections are sent, refreshed for each step from the query and the previous step
+MAX_INLINE_FILE_CHARS = 12000
+RETRIEVED_CHUNKS = 4
 
-def generate_response(prompt, custom_client=None, file_content=None, image_content=None):
+def file_context(file_index, prompt, step_data=None):
+    query = prompt if step_data is None else f"{prompt}\n{step_data.get('title', '')}\n{step_data.get('content', '')}"
+    excerpts = format_excerpts(file_index.search(query, RETRIEVED_CHUNKS), len(file_index.chunks))
+    return f"Here's some additional context from an uploaded file:\n\n{excerpts}\n\nPlease consider this information when answering the query."
+
+def generate_response(prompt, custom_client=None, file_content=None, image_content=None, controller=None):
     messages = [
         {"role": "system", "content": """You are an expert AI assistant that explains your reasoning step by step. For each step, provide a title that describes what you're doing in that step, along with the content. Decide if you need another step or if you're ready to give the final answer. Respond in JSON format with 'title', 'content', and 'next_action' (either 'continue' or 'final_answer') keys. USE AS MANY REASONING STEPS AS POSSIBLE. AT LEAST 3. BE AWARE OF YOUR LIMITATIONS AS AN LLM AND WHAT YOU CAN AND CANNOT DO. IN YOUR REASONING, INCLUDE EXPLORATION OF ALTERNATIVE ANSWERS. CONSIDER YOU MAY BE WRONG, AND IF YOU ARE WRONG IN YOUR REASONING, WHERE IT WOULD BE. FULLY TEST ALL OTHER POSSIBILITIES. YOU CAN BE WRONG. WHEN YOU SAY YOU ARE RE-EXAMINING, ACTUALLY RE-EXAMINE, AND USE ANOTHER APPROACH TO DO SO. DO NOT JUST SAY YOU ARE RE-EXAMINING. USE AT LEAST 3 METHODS TO DERIVE THE ANSWER. USE BEST PRACTICES.
 
@@ -52,30 +95,52 @@ Example of a valid JSON response:
         {"role": "assistant", "content": "Thank you! I will now think step by step following my instructions, starting at the beginning after decomposing the problem."}
     ]
 
-    if file_content:
+    file_index = None
+    if file_content and len(file_content) > MAX_INLINE_FILE_CHARS:
+        file_index = index_cache.get(file_content)
+        file_message = {"role": "user", "content": file_context(file_index, prompt)}
+        messages.append(file_message)
+    elif file_content:
         messages.append({"role": "user", "content": f"Here's some additional context from an uploaded file:\n\n{file_content}\n\nPlease consider this information when answering the query."})
     if image_content:
         messages.append({"role": "user", "content": f"Here's some additional context from an uploaded image:\n\n{image_content}\n\nPlease consider this information when answering the query."})
 
     
+    chain_span = tracer.start("chain", prompt_chars=len(prompt)) if tracer else NULL_SPAN
     steps = []
     step_count = 1
     total_thinking_time = 0
+    controller = controller or StepController()
     
     while True:
         start_time = time.time()
-        step_data = make_api_call(messages, 300, custom_client=custom_client)
+        if file_index is not None and step_count > 1:
+            file_message["content"] = file_context(file_index, prompt, step_data)
+        step_span = chain_span.child("step", step=step_count)
+        step_data = make_api_call(messages, controller.step_max_tokens(messages), custom_client=custom_client, span=step_span)
         end_time = time.time()
         thinking_time = end_time - start_time
         total_thinking_time += thinking_time
+        if controller.cancelled:
+            step_span.end(cancelled=True)
+            chain_span.end(steps=step_count, stop="cancelled")
+            return
         
         steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time))
         
         messages.append({"role": "assistant", "content": json.dumps(step_data)})
+        step_span.end(title=step_data['title'])
+        controller.record(messages[:-1], messages[-1]['content'], thinking_time)
         
-        if step_data['next_action'] == 'final_answer' or step_count > 25: # Maximum of 25 steps to prevent infinite thinking time. Can be adjusted.
+        # Stop when the model is done, or at the step cap, deadline or token budget (see StepController)
+        if controller.should_stop(step_count, step_data, messages):
             break
         
+        # Nudge a chain that keeps repeating itself (see repetition.py)
+        steering = controller.steering_message()
+        if steering:
+            messages.append(steering)
+
         step_count += 1
 
         # Yield after each step for Streamlit to update
@@ -85,11 +150,17 @@ Example of a valid JSON response:
     messages.append({"role": "user", "content": "Please provide the final answer based solely on your reasoning above. Do not use JSON formatting. Only provide the text response without any titles or preambles. Retain any formatting as instructed by the original prompt, such as exact formatting for free response or multiple choice."})
     
     start_time = time.time()
-    final_data = make_api_call(messages, 1200, is_final_answer=True, custom_client=custom_client)
+    if file_index is not None:
+        file_message["content"] = file_context(file_index, prompt, step_data)
+    final_span = chain_span.child("final_answer")
+    final_data = make_api_call(messages, controller.final_max_tokens(messages), is_final_answer=True, custom_client=custom_client, span=final_span)
     end_time = time.time()
     thinking_time = end_time - start_time
     total_thinking_time += thinking_time
     
     steps.append(("Final Answer", final_data, thinking_time))
+    final_span.end()
+    controller.record(messages, steps[-1][1])
+    chain_span.end(steps=step_count, total_thinking_time=total_thinking_time, stop=controller.stop, tokens_used=controller.tokens_used)
 
     yield steps, total_thinking_time
@@ -0,0 +1,119 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+import pytesseract
+
+# OCR for uploaded images, off the Streamlit script thread. Results are cached by the hash of the
+# image bytes (as Futures, so a rerun while OCR is still running waits on the same job), images
+# are converted to grayscale and downscaled before Tesseract sees them, and tall scans are cut
+# into bands at blank rows so the bands can be recognized in parallel worker processes.
+
+MAX_SIDE = 3000
+TILE_HEIGHT = 1600
+
+def preprocess(image, max_side=MAX_SIDE, grayscale=True):
+    image = ImageOps.exif_transpose(image)
+    if grayscale:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if max_side and max(image.size) > max_side:
+        # Tesseract gains nothing from more than ~300 DPI; huge photos only make it slower
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image
+
+def cut_rows(image, tile_height=TILE_HEIGHT, search=200):
+    # Row offsets that split the image into bands of about tile_height, each cut placed on the
+    # lightest row near the target so it falls between text lines rather than through them
+    width, height = image.size
+    if not tile_height or height <= tile_height * 1.5:
+        return [0, height]
+    brightness = list(image.convert("L").resize((1, height), Image.BOX).getdata())
+    cuts = [0]
+    while height - cuts[-1] > tile_height * 1.5:
+        target = cuts[-1] + tile_height
+        window = range(max(cuts[-1] + 1, target - search), min(height - 1, target + search))
+        cuts.append(max(window, key=lambda row: brightness[row]))
+    cuts.append(height)
+    return cuts
+
+def tesseract_image(png):
+    # Runs in a worker process; takes and returns plain bytes/str so nothing heavy is pickled
+    return pytesseract.image_to_string(Image.open(io.BytesIO(png)))
+
+def encode_png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+class OcrService:
+    def __init__(self, max_entries=32, workers=None, max_side=MAX_SIDE, tile_height=TILE_HEIGHT, grayscale=True):
+        self.max_entries = max_entries
+        self.workers = workers or max(1, min(4, os.cpu_count() or 1))
+        self.max_side = max_side
+        self.tile_height = tile_height
+        self.grayscale = grayscale
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+        # Preprocessing and tile fan-out happen here, so submit() always returns immediately
+        self._dispatcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="g1-ocr")
+
+    def pool(self):
+        # Created on first use. Spawned rather than forked, because forking a threaded Streamlit
+        # server can deadlock the children.
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def submit(self, data):
+        # Returns a Future for the text of the image in `data` (the uploaded file's bytes)
+        key = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            future = self._results.get(key)
+            if future is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return future
+            self.misses += 1
+            future = Future()
+            self._results[key] = future
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        self._dispatcher.submit(self._run, key, data, future)
+        return future
+
+    def image_to_string(self, data, timeout=None):
+        return self.submit(data).result(timeout)
+
+    def _run(self, key, data, future):
+        try:
+            image = preprocess(Image.open(io.BytesIO(data)), self.max_side, self.grayscale)
+            cuts = cut_rows(image, self.tile_height)
+            bands = [encode_png(image.crop((0, top, image.width, bottom))) for top, bottom in zip(cuts, cuts[1:])]
+            if len(bands) == 1:
+                text = self.pool().submit(tesseract_image, bands[0]).result()
+            else:
+                text = "\n".join(part.rstrip("\n") for part in self.pool().map(tesseract_image, bands))
+            future.set_result(text)
+        except Exception as e:
+            # Failures are not cached, so the next rerun tries again
+            with self._lock:
+                if self._results.get(key) is future:
+                    del self._results[key]
+            future.set_exception(e)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._results), "workers": self.workers}
+
+ocr_service = OcrService()
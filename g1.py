@@ -1,45 +1,42 @@
 import groq
+import asyncio
 import time
 import os
 import json
+from step_stream import StepStreamParser, iter_chunk_text
+from step_parser import load_step, recover_step
+from response_cache import default_cache, request_key
+from scheduler import scheduler, estimate_tokens
+from telemetry import NULL_SPAN, response_usage
+from step_controller import StepController
+from checkpoint import default_checkpoints, is_error_step
+from model_router import FixedRoute, LARGE_MODEL, default_router
+from query_cache import default_query_cache, warm_start_message
 
-client = groq.Groq()
+client = groq.Groq(max_retries=0)  # retries and backoff are handled by the shared scheduler
+async_client = groq.AsyncGroq(max_retries=0)
 
-def make_api_call(messages, max_tokens, is_final_answer=False, custom_client=None):
-    global client
-    if custom_client != None:
-        client = custom_client
-    
-    for attempt in range(3):
-        try:
-            if is_final_answer:
-                response = client.chat.completions.create(
-                    model="llama-3.1-70b-versatile",
-                    messages=messages,
-                    max_tokens=max_tokens,
-                    temperature=0.2,
-            ) 
-                return response.choices[0].message.content
-            else:
-                response = client.chat.completions.create(
-                    model="llama-3.1-70b-versatile",
-                    messages=messages,
-                    max_tokens=max_tokens,
-                    temperature=0.2,
-                    response_format={"type": "json_object"}
-                )
-                return json.loads(response.choices[0].message.content)
-        except Exception as e:
-            if attempt == 2:
-                if is_final_answer:
-                    return {"title": "Error", "content": f"Failed to generate final answer after 3 attempts. Error: {str(e)}"}
-                else:
-                    return {"title": "Error", "content": f"Failed to generate step after 3 attempts. Error: {str(e)}", "next_action": "final_answer"}
-            time.sleep(1)  # Wait for 1 second before retrying
+# Shared response cache consulted by every API call; set to None to always hit the API
+cache = default_cache()
 
-def generate_response(prompt, custom_client=None):
-    messages = [
-        {"role": "system", "content": """You are an expert AI assistant that explains your reasoning step by step. For each step, provide a title that describes what you're doing in that step, along with the content. Decide if you need another step or if you're ready to give the final answer. Respond in JSON format with 'title', 'content', and 'next_action' (either 'continue' or 'final_answer') keys. USE AS MANY REASONING STEPS AS POSSIBLE. AT LEAST 3. BE AWARE OF YOUR LIMITATIONS AS AN LLM AND WHAT YOU CAN AND CANNOT DO. IN YOUR REASONING, INCLUDE EXPLORATION OF ALTERNATIVE ANSWERS. CONSIDER YOU MAY BE WRONG, AND IF YOU ARE WRONG IN YOUR REASONING, WHERE IT WOULD BE. FULLY TEST ALL OTHER POSSIBILITIES. YOU CAN BE WRONG. WHEN YOU SAY YOU ARE RE-EXAMINING, ACTUALLY RE-EXAMINE, AND USE ANOTHER APPROACH TO DO SO. DO NOT JUST SAY YOU ARE RE-EXAMINING. USE AT LEAST 3 METHODS TO DERIVE THE ANSWER. USE BEST PRACTICES.
+# Optional telemetry.Tracer; when set, every chain records spans for its steps, API attempts and retries
+tracer = None
+
+# Chain checkpoints, off unless G1_CHECKPOINTS or G1_CHECKPOINT_DB is set (see checkpoint.py).
+# Chains run with a chain_id are saved after every step, so an interrupted chain resumes where it
+# stopped and a finished one is replayed
+checkpoints = default_checkpoints()
+
+# model_router.ModelRouter sending easy steps to a small, fast model and escalating to the large
+# one; off unless G1_MODEL_CASCADE=on, None sends every call to MODEL
+router = default_router()
+MODEL = LARGE_MODEL
+
+# Finished chains per query_scope, so the same question asked again is answered at once and a
+# similar one starts from the earlier chain; off unless G1_QUERY_CACHE=on, set to None to disable
+query_cache = default_query_cache()
+
+SYSTEM_PROMPT = """You are an expert AI assistant that explains your reasoning step by step. For each step, provide a title that describes what you're doing in that step, along with the content. Decide if you need another step or if you're ready to give the final answer. Respond in JSON format with 'title', 'content', and 'next_action' (either 'continue' or 'final_answer') keys. USE AS MANY REASONING STEPS AS POSSIBLE. AT LEAST 3. BE AWARE OF YOUR LIMITATIONS AS AN LLM AND WHAT YOU CAN AND CANNOT DO. IN YOUR REASONING, INCLUDE EXPLORATION OF ALTERNATIVE ANSWERS. CONSIDER YOU MAY BE WRONG, AND IF YOU ARE WRONG IN YOUR REASONING, WHERE IT WOULD BE. FULLY TEST ALL OTHER POSSIBILITIES. YOU CAN BE WRONG. WHEN YOU SAY YOU ARE RE-EXAMINING, ACTUALLY RE-EXAMINE, AND USE ANOTHER APPROACH TO DO SO. DO NOT JUST SAY YOU ARE RE-EXAMINING. USE AT LEAST 3 METHODS TO DERIVE THE ANSWER. USE BEST PRACTICES.
 
 Example of a valid JSON response:
 ```json
@@ -48,43 +45,437 @@ Example of a valid JSON response:
     "content": "To begin solving this problem, we need to carefully examine the given information and identify the crucial elements that will guide our solution process. This involves...",
     "next_action": "continue"
 }```
-"""},
+"""
+
+FINAL_ANSWER_PROMPT = "Please provide the final answer based solely on your reasoning above. Do not use JSON formatting. Only provide the text response without any titles or preambles. Retain any formatting as instructed by the original prompt, such as exact formatting for free response or multiple choice."
+
+def build_request(messages, max_tokens, is_final_answer=False, sampling=None, model=None, stream=False):
+    # sampling overrides request parameters such as temperature or seed; they are part of the cache key.
+    # Groq's JSON mode cannot be streamed, so streamed steps go without it and rely on
+    # StepStreamParser and step_parser to read and repair the reply.
+    request = {"model": model or MODEL, "messages": messages, "max_tokens": max_tokens, "temperature": 0.2}
+    if sampling:
+        request.update(sampling)
+    if not is_final_answer and not stream:
+        request["response_format"] = {"type": "json_object"}
+    return request
+
+def make_api_call(messages, max_tokens, is_final_answer=False, custom_client=None, span=NULL_SPAN, sampling=None, model=None,
+                  cancel_token=None):
+    # Resolved per call rather than swapped into the module global, so concurrent sessions
+    # (e.g. Gradio users with their own API keys) never send requests with each other's client.
+    # Once cancel_token is cancelled no further attempt is made and a retry wait ends early; the
+    # caller discards the result.
+    api_client = custom_client if custom_client is not None else client
+
+    request = build_request(messages, max_tokens, is_final_answer, sampling, model)
+    key = request_key(**request) if cache is not None else None
+    cached = cache.get(key) if key else None
+    if cached is not None:
+        span.set(cache_hit=True)
+        return cached if is_final_answer else json.loads(cached)
+
+    tokens = estimate_tokens(messages, max_tokens)
+    for attempt in range(scheduler.max_attempts):
+        if cancel_token is not None and cancel_token.cancelled:
+            return {"title": "Error", "content": "Cancelled", "next_action": "final_answer"}
+        queue_time = scheduler.acquire(tokens)
+        attempt_span = span.child("api_attempt", model=request["model"], attempt=attempt, queue_time=queue_time)
+        try:
+            response = api_client.chat.completions.create(**request)
+            content = response.choices[0].message.content
+            if is_final_answer:
+                result = content
+            else:
+                result, content = load_step(content, attempt_span)
+            attempt_span.end(status="ok", **response_usage(response))
+            if key:
+                cache.put(key, content)
+            return result
+        except Exception as e:
+            # JSON mode rejects a malformed step with the model's text attached; repair it if possible
+            recovered = None if is_final_answer else recover_step(e, attempt_span)
+            if recovered is not None:
+                result, content = recovered
+                attempt_span.end(status="repaired")
+                if key:
+                    cache.put(key, content)
+                return result
+            attempt_span.end(status="error", error=str(e))
+            try:
+                scheduler.backoff(attempt, e, cancel_token)
+            except Exception:
+                if is_final_answer:
+                    return {"title": "Error", "content": f"Failed to generate final answer after {attempt + 1} attempts. Error: {str(e)}"}
+                else:
+                    return {"title": "Error", "content": f"Failed to generate step after {attempt + 1} attempts. Error: {str(e)}", "next_action": "final_answer"}
+
+def stream_api_call(messages, max_tokens, is_final_answer=False, custom_client=None, span=NULL_SPAN, sampling=None, model=None,
+                    cancel_token=None):
+    # Streaming variant of make_api_call. Yields the partially parsed step dict (or the final
+    # answer text so far) as chunks arrive; the last value yielded is the complete result.
+    api_client = custom_client if custom_client is not None else client
+
+    request = build_request(messages, max_tokens, is_final_answer, sampling, model, stream=True)
+    key = request_key(**request) if cache is not None else None
+    cached = cache.get(key) if key else None
+    if cached is not None:
+        span.set(cache_hit=True)
+        yield cached if is_final_answer else json.loads(cached)
+        return
+
+    tokens = estimate_tokens(messages, max_tokens)
+    for attempt in range(scheduler.max_attempts):
+        if cancel_token is not None and cancel_token.cancelled:
+            yield {"title": "Error", "content": "Cancelled", "next_action": "final_answer"}
+            return
+        queue_time = scheduler.acquire(tokens)
+        attempt_span = span.child("api_attempt", model=request["model"], attempt=attempt, queue_time=queue_time)
+        try:
+            usage = {}
+            started = time.perf_counter()
+            response = api_client.chat.completions.create(**request, stream=True)
+            if is_final_answer:
+                text = ""
+                for delta in iter_chunk_text(response, usage):
+                    if not text:
+                        attempt_span.set(time_to_first_token=time.perf_counter() - started)
+                    text += delta
+                    yield text
+                result = text
+            else:
+                parser = StepStreamParser()
+                for i, delta in enumerate(iter_chunk_text(response, usage)):
+                    if i == 0:
+                        attempt_span.set(time_to_first_token=time.perf_counter() - started)
+                    yield dict(parser.feed(delta))
+                result, text = load_step(parser.text(), attempt_span)
+                yield result
+            attempt_span.end(status="ok", **usage)
+            if key:
+                cache.put(key, text)
+            return
+        except Exception as e:
+            attempt_span.end(status="error", error=str(e))
+            try:
+                scheduler.backoff(attempt, e, cancel_token)
+            except Exception:
+                if is_final_answer:
+                    yield {"title": "Error", "content": f"Failed to generate final answer after {attempt + 1} attempts. Error: {str(e)}"}
+                else:
+                    yield {"title": "Error", "content": f"Failed to generate step after {attempt + 1} attempts. Error: {str(e)}", "next_action": "final_answer"}
+                return
+
+def generate_response(prompt, custom_client=None, stream=False, compactor=None, sampling=None, controller=None, chain_id=None,
+                      query_scope=None):
+    # With stream=True, partial steps are yielded as tokens arrive and every step tuple carries
+    # a fourth element: the time to its first visible token, in seconds.
+    # Pass a context_window.ContextCompactor to keep the prompt under a token budget, and sampling
+    # (e.g. {"temperature": 0.8, "seed": 3}) to vary the chain, as self_consistency does.
+    # A step_controller.StepController (one per chain) adds a deadline, a token budget and
+    # cancellation; when cancelled, the generator stops without producing a final answer.
+    # With checkpoints enabled, a chain given a chain_id is checkpointed under it and resumes from
+    # its last completed step when run again with the same ID. The ID must be unique to the caller
+    # (a user, session or batch record, see checkpoint.chain_key); chains without one are not saved.
+    # query_scope names who is asking (a user, an API key, a server client): the query cache only
+    # answers from, and warm-starts with, chains finished in the same scope.
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": prompt},
         {"role": "assistant", "content": "Thank you! I will now think step by step following my instructions, starting at the beginning after decomposing the problem."}
     ]
     
+    header_len = len(messages)
+    chain_span = tracer.start("chain", prompt_chars=len(prompt)) if tracer else NULL_SPAN
     steps = []
     step_count = 1
     total_thinking_time = 0
+    controller = controller or StepController()
+    route = router.route() if router is not None else FixedRoute(MODEL)
+    
+    # Pick up where an earlier run of this chain stopped (see checkpoint.py)
+    store = checkpoints if chain_id else None
+    stage = "steps"
+    resumed = store.resume(chain_id, 3, stream, controller) if store is not None else None
+    if resumed:
+        messages, steps, step_count, total_thinking_time, stage = resumed
+        chain_span.set(resumed_from=step_count, resumed_stage=stage)
+        if stage == "done":
+            chain_span.end(steps=step_count, total_thinking_time=total_thinking_time, stop=controller.stop, tokens_used=controller.tokens_used)
+            yield steps, total_thinking_time
+            return
+        yield steps, None
+    elif query_cache is not None and sampling is None:
+        # A question answered before in this scope (see query_cache.py); never for sampled chains,
+        # which self-consistency needs to be independent
+        match = query_cache.lookup(prompt, query_scope)
+        if match and match[0] == "hit":
+            _, entry, score = match
+            steps = [step + ((None,) if stream else ()) for step in entry["steps"]]
+            controller.stop = "query_cache"
+            chain_span.end(query_cache="hit", similarity=score, stop=controller.stop)
+            yield steps, entry["total_thinking_time"]
+            return
+        if match:
+            messages.insert(header_len - 1, warm_start_message(match[1]))
+            header_len += 1
+            chain_span.set(query_cache="warm", similarity=match[2])
     
-    while True:
+    while stage == "steps":
         start_time = time.time()
-        step_data = make_api_call(messages, 300, custom_client=custom_client)
+        prompt_messages = compactor.compact(messages, header_len) if compactor else messages
+        step_span = chain_span.child("step", step=step_count)
+        # A step the router's small model failed or was unsure of is asked again of the large model
+        model = route.choose(step_count, prompt_messages)
+        while model:
+            if stream:
+                first_token_time = None
+                for step_data in stream_api_call(prompt_messages, controller.step_max_tokens(prompt_messages), custom_client=custom_client, span=step_span, sampling=sampling, model=model, cancel_token=controller.cancel_token):
+                    if controller.cancelled:
+                        break
+                    if first_token_time is None and (step_data.get('title') or step_data.get('content')):
+                        first_token_time = time.time() - start_time
+                    yield steps + [(f"Step {step_count}: {step_data.get('title', '')}", step_data.get('content', ''), time.time() - start_time, first_token_time)], None
+            else:
+                step_data = make_api_call(prompt_messages, controller.step_max_tokens(prompt_messages), custom_client=custom_client, span=step_span, sampling=sampling, model=model, cancel_token=controller.cancel_token)
+            next_model = None if controller.cancelled else route.next_model(model, step_data)
+            if next_model:
+                # The call being escalated is charged too; the kept one is recorded below
+                controller.record(prompt_messages, json.dumps(step_data))
+            model = next_model
         end_time = time.time()
         thinking_time = end_time - start_time
         total_thinking_time += thinking_time
+        if controller.cancelled:
+            step_span.end(cancelled=True)
+            chain_span.end(steps=step_count, stop="cancelled")
+            return
         
-        steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time))
+        if stream:
+            steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time, first_token_time))
+        else:
+            steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time))
         
         messages.append({"role": "assistant", "content": json.dumps(step_data)})
+        step_span.end(title=step_data['title'])
+        controller.record(prompt_messages, messages[-1]['content'], thinking_time)
         
-        if step_data['next_action'] == 'final_answer' or step_count > 25: # Maximum of 25 steps to prevent infinite thinking time. Can be adjusted.
+        # Stop when the model is done, or at the step cap, deadline or token budget (see StepController)
+        if controller.should_stop(step_count, step_data, messages):
+            if store is not None and not is_error_step(step_data):
+                store.save(chain_id, "final_answer", messages, steps, step_count, total_thinking_time, controller)
             break
         
+        # Nudge a chain that keeps repeating itself (see repetition.py)
+        steering = controller.steering_message()
+        if steering:
+            messages.append(steering)
+
         step_count += 1
+        if store is not None and not is_error_step(step_data):
+            store.save(chain_id, "steps", messages, steps, step_count, total_thinking_time, controller)
 
         # Yield after each step for Streamlit to update
         yield steps, None  # We're not yielding the total time until the end
 
     # Generate final answer
-    messages.append({"role": "user", "content": "Please provide the final answer based solely on your reasoning above. Do not use JSON formatting. Only provide the text response without any titles or preambles. Retain any formatting as instructed by the original prompt, such as exact formatting for free response or multiple choice."})
+    messages.append({"role": "user", "content": FINAL_ANSWER_PROMPT})
     
     start_time = time.time()
-    final_data = make_api_call(messages, 1200, is_final_answer=True, custom_client=custom_client)
+    prompt_messages = compactor.compact(messages, header_len) if compactor else messages
+    final_span = chain_span.child("final_answer")
+    model = route.choose(step_count, prompt_messages, is_final_answer=True)
+    if stream:
+        first_token_time = None
+        for final_data in stream_api_call(prompt_messages, controller.final_max_tokens(prompt_messages), is_final_answer=True, custom_client=custom_client, span=final_span, sampling=sampling, model=model, cancel_token=controller.cancel_token):
+            if controller.cancelled:
+                break
+            if first_token_time is None and final_data:
+                first_token_time = time.time() - start_time
+            yield steps + [("Final Answer", final_data, time.time() - start_time, first_token_time)], None
+    else:
+        final_data = make_api_call(prompt_messages, controller.final_max_tokens(prompt_messages), is_final_answer=True, custom_client=custom_client, span=final_span, sampling=sampling, model=model, cancel_token=controller.cancel_token)
+    route.next_model(model, final_data)
     end_time = time.time()
     thinking_time = end_time - start_time
     total_thinking_time += thinking_time
+    if controller.cancelled:
+        final_span.end(cancelled=True)
+        chain_span.end(steps=step_count, stop="cancelled")
+        return
     
+    if stream:
+        steps.append(("Final Answer", final_data, thinking_time, first_token_time))
+    else:
+        steps.append(("Final Answer", final_data, thinking_time))
+
+    final_span.end()
+    controller.record(prompt_messages, final_data)
+    if store is not None and not is_error_step(final_data):
+        store.save(chain_id, "done", messages, steps, step_count, total_thinking_time, controller)
+    if query_cache is not None and sampling is None and controller.stop == "final_answer" and not is_error_step(final_data):
+        query_cache.put(prompt, steps, total_thinking_time, query_scope)
+    chain_span.end(steps=step_count, total_thinking_time=total_thinking_time, stop=controller.stop, tokens_used=controller.tokens_used)
+
+    yield steps, total_thinking_time
+
+async def cache_call(method, *args):
+    # The response cache's SQLite tier commits under a process-wide lock; run it on a thread, as
+    # the checkpoint store is, so one chain's disk write never stalls every chain on the loop
+    if cache.persistent:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+async def amake_api_call(messages, max_tokens, is_final_answer=False, custom_client=None, span=NULL_SPAN, sampling=None, model=None):
+    # Async counterpart of make_api_call. The client is resolved per call rather than
+    # swapped into the module global, so many chains can share one event loop safely.
+    api_client = custom_client if custom_client is not None else async_client
+
+    request = build_request(messages, max_tokens, is_final_answer, sampling, model)
+    key = request_key(**request) if cache is not None else None
+    cached = await cache_call(cache.get, key) if key else None
+    if cached is not None:
+        span.set(cache_hit=True)
+        return cached if is_final_answer else json.loads(cached)
+
+    tokens = estimate_tokens(messages, max_tokens)
+    for attempt in range(scheduler.max_attempts):
+        queue_time = await scheduler.aacquire(tokens)
+        attempt_span = span.child("api_attempt", model=request["model"], attempt=attempt, queue_time=queue_time)
+        try:
+            response = await api_client.chat.completions.create(**request)
+            content = response.choices[0].message.content
+            if is_final_answer:
+                result = content
+            else:
+                result, content = load_step(content, attempt_span)
+            attempt_span.end(status="ok", **response_usage(response))
+            if key:
+                await cache_call(cache.put, key, content)
+            return result
+        except Exception as e:
+            # JSON mode rejects a malformed step with the model's text attached; repair it if possible
+            recovered = None if is_final_answer else recover_step(e, attempt_span)
+            if recovered is not None:
+                result, content = recovered
+                attempt_span.end(status="repaired")
+                if key:
+                    await cache_call(cache.put, key, content)
+                return result
+            attempt_span.end(status="error", error=str(e))
+            try:
+                await scheduler.abackoff(attempt, e)
+            except Exception:
+                if is_final_answer:
+                    return {"title": "Error", "content": f"Failed to generate final answer after {attempt + 1} attempts. Error: {str(e)}"}
+                else:
+                    return {"title": "Error", "content": f"Failed to generate step after {attempt + 1} attempts. Error: {str(e)}", "next_action": "final_answer"}
+
+async def agenerate_response(prompt, custom_client=None, compactor=None, sampling=None, controller=None, chain_id=None,
+                             query_scope=None):
+    # Async generator with the same (steps, total_thinking_time) protocol as generate_response,
+    # checkpointed and scoped in the query cache the same way.
+    # custom_client must expose an awaitable chat.completions.create, e.g. groq.AsyncGroq.
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+        {"role": "assistant", "content": "Thank you! I will now think step by step following my instructions, starting at the beginning after decomposing the problem."}
+    ]
+
+    header_len = len(messages)
+    chain_span = tracer.start("chain", prompt_chars=len(prompt)) if tracer else NULL_SPAN
+    steps = []
+    step_count = 1
+    total_thinking_time = 0
+    controller = controller or StepController()
+    route = router.route() if router is not None else FixedRoute(MODEL)
+
+    # Checkpoint reads and writes go to a thread: a file-backed store commits to disk on every save
+    store = checkpoints if chain_id else None
+    stage = "steps"
+    resumed = await asyncio.to_thread(store.resume, chain_id, 3, controller=controller) if store is not None else None
+    if resumed:
+        messages, steps, step_count, total_thinking_time, stage = resumed
+        chain_span.set(resumed_from=step_count, resumed_stage=stage)
+        if stage == "done":
+            chain_span.end(steps=step_count, total_thinking_time=total_thinking_time, stop=controller.stop, tokens_used=controller.tokens_used)
+            yield steps, total_thinking_time
+            return
+        yield steps, None
+    elif query_cache is not None and sampling is None:
+        match = query_cache.lookup(prompt, query_scope)
+        if match and match[0] == "hit":
+            _, entry, score = match
+            controller.stop = "query_cache"
+            chain_span.end(query_cache="hit", similarity=score, stop=controller.stop)
+            yield list(entry["steps"]), entry["total_thinking_time"]
+            return
+        if match:
+            messages.insert(header_len - 1, warm_start_message(match[1]))
+            header_len += 1
+            chain_span.set(query_cache="warm", similarity=match[2])
+
+    while stage == "steps":
+        start_time = time.time()
+        prompt_messages = compactor.compact(messages, header_len) if compactor else messages
+        step_span = chain_span.child("step", step=step_count)
+        model = route.choose(step_count, prompt_messages)
+        while model:
+            step_data = await amake_api_call(prompt_messages, controller.step_max_tokens(prompt_messages), custom_client=custom_client, span=step_span, sampling=sampling, model=model)
+            next_model = None if controller.cancelled else route.next_model(model, step_data)
+            if next_model:
+                # The call being escalated is charged too; the kept one is recorded below
+                controller.record(prompt_messages, json.dumps(step_data))
+            model = next_model
+        end_time = time.time()
+        thinking_time = end_time - start_time
+        total_thinking_time += thinking_time
+        if controller.cancelled:
+            step_span.end(cancelled=True)
+            chain_span.end(steps=step_count, stop="cancelled")
+            return
+
+        steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time))
+
+        messages.append({"role": "assistant", "content": json.dumps(step_data)})
+        step_span.end(title=step_data['title'])
+        controller.record(prompt_messages, messages[-1]['content'], thinking_time)
+
+        if controller.should_stop(step_count, step_data, messages):
+            if store is not None and not is_error_step(step_data):
+                await asyncio.to_thread(store.save, chain_id, "final_answer", messages, steps, step_count, total_thinking_time, controller)
+            break
+
+        steering = controller.steering_message()
+        if steering:
+            messages.append(steering)
+
+        step_count += 1
+        if store is not None and not is_error_step(step_data):
+            await asyncio.to_thread(store.save, chain_id, "steps", messages, steps, step_count, total_thinking_time, controller)
+
+        yield steps, None
+
+    messages.append({"role": "user", "content": FINAL_ANSWER_PROMPT})
+
+    start_time = time.time()
+    prompt_messages = compactor.compact(messages, header_len) if compactor else messages
+    final_span = chain_span.child("final_answer")
+    model = route.choose(step_count, prompt_messages, is_final_answer=True)
+    final_data = await amake_api_call(prompt_messages, controller.final_max_tokens(prompt_messages), is_final_answer=True, custom_client=custom_client, span=final_span, sampling=sampling, model=model)
+    route.next_model(model, final_data)
+    end_time = time.time()
+    thinking_time = end_time - start_time
+    total_thinking_time += thinking_time
+
     steps.append(("Final Answer", final_data, thinking_time))
 
+    final_span.end()
+    controller.record(prompt_messages, final_data)
+    if store is not None and not is_error_step(final_data):
+        await asyncio.to_thread(store.save, chain_id, "done", messages, steps, step_count, total_thinking_time, controller)
+    if query_cache is not None and sampling is None and controller.stop == "final_answer" and not is_error_step(final_data):
+        query_cache.put(prompt, steps, total_thinking_time, query_scope)
+    chain_span.end(steps=step_count, total_thinking_time=total_thinking_time, stop=controller.stop, tokens_used=controller.tokens_used)
+
     yield steps, total_thinking_time
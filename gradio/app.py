@@ -1,52 +1,98 @@
 import gradio as gr
+import hashlib
 import os
 import json
 import time
+import sys
 import groq
-from ..g1 import generate_response
 
-def format_steps(steps, total_time):
-    md_content = ""
-    for title, content, thinking_time in steps:
-        if title == "Final Answer":
-            md_content += f"### {title}\n"
-            md_content += f"{content}\n"
-        else:
-            md_content += f"#### {title}\n"
-            md_content += f"{content}\n"
-            md_content += f"_Thinking time for this step: {thinking_time:.2f} seconds_\n"
-            md_content += "\n---\n"
-    if total_time!=0:
-        md_content += f"\n**Total thinking time: {total_time:.2f} seconds**"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import g1
+from g1 import generate_response
+from self_consistency import generate_self_consistent
+from model_router import describe_models
+from telemetry import tracer_from_env
+
+# Set G1_TRACE_FILE, G1_METRICS_FILE or G1_METRICS_PORT to record telemetry
+g1.tracer = tracer_from_env()
+
+def format_step(step):
+    title, content, thinking_time, first_token_time = step
+    if title == "Final Answer":
+        return f"### {title}\n{content}\n"
+    parts = [f"#### {title}\n", f"{content}\n", f"_Thinking time for this step: {thinking_time:.2f} seconds_\n"]
+    if first_token_time is not None:
+        parts.append(f"_Time to first token: {first_token_time:.2f} seconds_\n")
+    parts.append("\n---\n")
+    return "".join(parts)
+
+class StepFormatter:
+    # Incremental Markdown for one chain. Only the last step of a yield can still be streaming, so
+    # every earlier step is formatted once and appended to `history`; the UI shows history and the
+    # in-progress step in separate components and only resends history when a step completes.
+    def __init__(self):
+        self.history = ""
+        self.completed = 0
+
+    def update(self, steps, total_time):
+        # Returns (history or None when unchanged, markdown of the in-progress step)
+        complete = len(steps) if total_time is not None else len(steps) - 1
+        changed = complete > self.completed
+        if changed:
+            self.history += "".join(format_step(step) for step in steps[self.completed:complete])
+            self.completed = complete
+        current = format_step(steps[-1]) if complete < len(steps) else ""
+        if total_time is not None:
+            current += f"\n**Total thinking time: {total_time:.2f} seconds**"
+        return (self.history if changed else None), current
+
+def format_chains(chains, result, total_time):
+    md_content = "".join(f"- Chain {chain.index + 1} (temperature {chain.sampling['temperature']}): "
+                         f"{chain.status}, {len(chain.steps)} steps\n" for chain in chains)
+    if result is not None:
+        md_content += f"\n### Final Answer\n{result['answer']}\n"
+        md_content += f"\n**Agreement: {result['agreement']:.0%} of {sum(result['votes'].values())} answers**"
+        md_content += f"\n\n**Total time: {total_time:.2f} seconds**"
     return md_content
 
-def main(api_key, user_query):
+def main(api_key, user_query, num_chains=1):
     if not api_key:
-        yield "Please enter your Groq API key to proceed."
+        yield "", "Please enter your Groq API key to proceed."
         return
     
     if not user_query:
-        yield "Please enter a query to get started."
+        yield "", "Please enter a query to get started."
         return
     
     try:
         # Initialize the Groq client with the provided API key
-        client = groq.Groq(api_key=api_key)
+        client = groq.Groq(api_key=api_key, max_retries=0)
     except Exception as e:
-        yield f"Failed to initialize Groq client. Error: {str(e)}"
+        yield "", f"Failed to initialize Groq client. Error: {str(e)}"
         return
     
     try:
-        for steps, total_time in generate_response(user_query, custom_client=client):
-            formatted_steps = format_steps(steps, total_time if total_time is not None else 0)
-            yield formatted_steps
+        if num_chains > 1:
+            # Self-consistency: chains run in parallel and stop once a majority agrees
+            for chains, result, total_time in generate_self_consistent(user_query, n=int(num_chains), quorum=int(num_chains) // 2 + 1, custom_client=client):
+                yield "", format_chains(chains, result, total_time)
+            return
+        formatter = StepFormatter()
+        yield "", ""
+        # Answers are only reused for the same API key, so one user never sees another's chains
+        query_scope = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        for steps, total_time in generate_response(user_query, custom_client=client, stream=True, query_scope=query_scope):
+            history, current = formatter.update(steps, total_time)
+            # gr.update() leaves the completed steps untouched, so each token only resends the current step
+            yield (gr.update() if history is None else history), current
     except Exception as e:
-        yield f"An error occurred during processing. Error: {str(e)}"
+        yield gr.update(), f"An error occurred during processing. Error: {str(e)}"
         return
 
 # Define the Gradio interface
 with gr.Blocks() as demo:
-    gr.Markdown("# 🧠 g1: Using Llama-3.1 70b on Groq to Create O1-like Reasoning Chains")
+    gr.Markdown("# 🧠 g1: Using Llama-3.1 on Groq to Create O1-like Reasoning Chains")
+    gr.Markdown(f"_{describe_models(g1.router, g1.MODEL)}_")
     
     gr.Markdown("""
     This is an early prototype of using prompting to create O1-like reasoning chains to improve output accuracy. It is not perfect and accuracy has yet to be formally evaluated. It is powered by Groq so that the reasoning step is fast!
@@ -66,14 +112,20 @@ with gr.Blocks() as demo:
                 placeholder="e.g., How many 'R's are in the word strawberry?",
                 lines=2
             )
+            chains_input = gr.Slider(1, 9, value=1, step=1, label="Parallel reasoning chains (majority vote)")
             submit_btn = gr.Button("Generate Response")
             gr.Markdown("\n")
     
     with gr.Row():
         with gr.Column():
-            output_md = gr.Markdown()
+            history_md = gr.Markdown()
+            current_md = gr.Markdown()
     
-    submit_btn.click(fn=main, inputs=[api_input, user_input], outputs=output_md)
+    submit_btn.click(fn=main, inputs=[api_input, user_input, chains_input], outputs=[history_md, current_md])
+
+# Each session spends most of its time waiting on the API, so many can stream at once.
+# Set G1_GRADIO_CONCURRENCY to change how many run concurrently.
+demo.queue(default_concurrency_limit=int(os.environ.get("G1_GRADIO_CONCURRENCY", "32")), max_size=256)
 
 # Launch the Gradio app
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+import os
+import re
+import threading
+import time
+
+from context_window import count_tokens
+from repetition import STEERING_PROMPT
+
+# Model cascade for reasoning chains. Most steps, such as restating or decomposing the problem,
+# go to a small, fast model. Some calls go to the large model instead:
+#   - the final answer;
+#   - steps from `large_after_step` on;
+#   - prompts over `max_small_prompt_tokens`;
+#   - steps that read tool results.
+# A small-model step is asked again of the large model when it failed or looks unsure (see
+# low_confidence). After the first such escalation the rest of the chain stays on the large model.
+# Calls, latency, estimated tokens and cost are kept per model.
+
+SMALL_MODEL = "llama-3.1-8b-instant"
+LARGE_MODEL = "llama-3.1-70b-versatile"
+
+# Groq list prices in dollars per million (prompt, completion) tokens; unknown models cost 0
+MODEL_PRICES = {
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "llama-3.1-70b-versatile": (0.59, 0.79),
+}
+
+HEDGES = re.compile(
+    r"\b(not (?:entirely |completely |fully )?(?:sure|certain|confident)|unsure|uncertain|unclear|"
+    r"i (?:might|may|could) be wrong|i (?:made|may have made) (?:a|an) (?:mistake|error)|"
+    r"contradict\w*|cannot (?:determine|be determined)|no way to know)\b",
+    re.I,
+)
+
+def call_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+def low_confidence(step_data, min_content_chars=20, min_confidence=0.5):
+    # Confidence signals in a step: a 'confidence' value below min_confidence (some models add
+    # one), hedging in the content, or content too short to carry any reasoning.
+    # Returns the reason or None.
+    confidence = step_data.get('confidence')
+    if isinstance(confidence, (int, float)) and not isinstance(confidence, bool) and confidence < min_confidence:
+        return "low_confidence"
+    content = str(step_data.get('content') or '')
+    if HEDGES.search(content):
+        return "hedging"
+    if step_data.get('next_action') != 'final_answer' and len(content.strip()) < min_content_chars:
+        return "short_step"
+    return None
+
+def reads_tool_results(messages):
+    # The tool-use variant appends tool output as a system message right after the step that called
+    # it; a steering message (see repetition.py) may come after it
+    for message in reversed(messages):
+        if message.get('content') != STEERING_PROMPT:
+            return message.get('role') == 'system' and str(message.get('content', '')).startswith("Tool result")
+    return False
+
+class ChainRoute:
+    # Routing state of one chain: which models its calls go to and whether it has escalated
+    def __init__(self, router):
+        self.router = router
+        self.escalated = False
+        self._call = None
+
+    def choose(self, step_count, prompt_messages, is_final_answer=False):
+        # Returns the model for the next call
+        router = self.router
+        prompt_tokens = count_tokens(prompt_messages)
+        if is_final_answer:
+            model, reason = router.large_model, "final_answer"
+        elif self.escalated:
+            model, reason = router.large_model, "escalated"
+        elif router.large_after_step is not None and step_count >= router.large_after_step:
+            model, reason = router.large_model, "step_index"
+        elif router.large_for_tools and reads_tool_results(prompt_messages):
+            model, reason = router.large_model, "tool_result"
+        elif prompt_tokens > router.max_small_prompt_tokens:
+            model, reason = router.large_model, "long_prompt"
+        else:
+            model, reason = router.small_model, "default"
+        router.count("routes", reason)
+        self._call = (prompt_tokens, time.perf_counter())
+        return model
+
+    def next_model(self, model, result):
+        # Records the call that returned result and returns the model to ask again, or None
+        # when the result stands
+        prompt_tokens, started = self._call
+        self.router.record(model, time.perf_counter() - started, prompt_tokens, result)
+        if model == self.router.large_model or not isinstance(result, dict):
+            return None
+        reason = "error" if result.get('title') == "Error" else self.router.confidence(result)
+        if reason is None:
+            return None
+        self.router.count("escalations", reason)
+        self.escalated = self.router.sticky
+        self._call = (prompt_tokens, time.perf_counter())
+        return self.router.large_model
+
+class FixedRoute:
+    # Route for a chain without a router: every call goes to the one model
+    def __init__(self, model):
+        self.model = model
+
+    def choose(self, step_count, prompt_messages, is_final_answer=False):
+        return self.model
+
+    def next_model(self, model, result):
+        return None
+
+class ModelRouter:
+    def __init__(self, small_model=SMALL_MODEL, large_model=LARGE_MODEL, large_after_step=None,
+                 max_small_prompt_tokens=6000, large_for_tools=True, sticky=True, confidence=low_confidence):
+        # large_after_step: step index from which every step uses the large model (None: never)
+        # confidence: step dict -> reason to escalate or None
+        self.small_model = small_model
+        self.large_model = large_model
+        self.large_after_step = large_after_step
+        self.max_small_prompt_tokens = max_small_prompt_tokens
+        self.large_for_tools = large_for_tools
+        self.sticky = sticky
+        self.confidence = confidence
+        self.models = {}
+        self.routes = {}
+        self.escalations = {}
+        self._lock = threading.Lock()
+
+    def route(self):
+        return ChainRoute(self)
+
+    def count(self, kind, reason):
+        with self._lock:
+            counts = getattr(self, kind)
+            counts[reason] = counts.get(reason, 0) + 1
+
+    def record(self, model, duration, prompt_tokens, result):
+        # Tokens are estimated the way the step controller does; telemetry has the exact counts
+        completion_tokens = len(str(result)) // 4
+        with self._lock:
+            stats = self.models.setdefault(model, {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+            stats["calls"] += 1
+            stats["seconds"] += duration
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["cost"] += call_cost(model, prompt_tokens, completion_tokens)
+
+    def stats(self):
+        # Per model: calls, mean latency (cache hits included) and estimated tokens and cost
+        with self._lock:
+            models = {
+                model: dict(stats, mean_latency=stats["seconds"] / stats["calls"] if stats["calls"] else 0.0)
+                for model, stats in self.models.items()
+            }
+            calls = sum(stats["calls"] for stats in models.values())
+            return {
+                "models": models,
+                "small_share": models.get(self.small_model, {}).get("calls", 0) / calls if calls else 0.0,
+                "cost": sum(stats["cost"] for stats in models.values()),
+                "routes": dict(self.routes),
+                "escalations": dict(self.escalations),
+            }
+
+def describe_models(router, model):
+    # One line for the UIs saying which models answer
+    if router is None:
+        return f"Every call goes to {model}."
+    return (f"Reasoning steps run on {router.small_model} and move to {router.large_model} when it needs the "
+            f"larger model; the final answer always comes from {router.large_model}.")
+
+def default_router():
+    # Off by default, since it changes which model answers most steps. G1_MODEL_CASCADE=on turns it
+    # on with the default models, as does setting G1_SMALL_MODEL; G1_LARGE_MODEL sets the large model
+    small_model = os.environ.get("G1_SMALL_MODEL")
+    if not small_model and os.environ.get("G1_MODEL_CASCADE", "off").lower() not in ("on", "1", "true"):
+        return None
+    return ModelRouter(small_model or SMALL_MODEL, os.environ.get("G1_LARGE_MODEL", LARGE_MODEL))
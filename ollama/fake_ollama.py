@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fake_client import fake_content
+
+# Local HTTP stand-in for the Ollama API (POST /api/chat, streamed or not, and GET /api/ps), for
+# trying the Ollama backend without a GPU. It behaves like a real server in the ways that matter
+# for latency: the model takes `load_time` to load and is evicted once its keep_alive runs out
+# (default 5m), at most `num_parallel` requests run at once, at most `max_queue` more wait, and
+# the rest get 503.
+#
+#   python ollama/fake_ollama.py --port 11435 --load-time 5
+#   OLLAMA_HOST=http://127.0.0.1:11435 streamlit run ollama/ollama_app.py
+
+DEFAULT_KEEP_ALIVE = 300.0
+
+def parse_keep_alive(value, default=DEFAULT_KEEP_ALIVE):
+    # Seconds to keep the model loaded after a request: "30m", "1h", "45s", a number, or a
+    # negative value for forever
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    value = str(value).strip()
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    for suffix in ("ms", "s", "m", "h"):
+        if value.endswith(suffix):
+            seconds = float(value[:-len(suffix)]) * units[suffix]
+            return float("inf") if seconds < 0 else seconds
+    return parse_keep_alive(float(value))
+
+class FakeOllama:
+    def __init__(self, load_time=2.0, token_time=0.005, tokens_per_chunk=4, num_parallel=1, max_queue=512, steps=3,
+                 default_keep_alive=DEFAULT_KEEP_ALIVE):
+        self.load_time = load_time
+        self.default_keep_alive = default_keep_alive
+        self.token_time = token_time
+        self.tokens_per_chunk = tokens_per_chunk
+        self.steps = steps
+        self.max_queue = max_queue
+        self.loads = 0
+        self.requests = 0
+        self.rejected = 0
+        self.max_running = 0
+        self._running = 0
+        self._queued = 0
+        self._expires = 0.0  # monotonic time at which the loaded model is evicted
+        self._slots = threading.Semaphore(num_parallel)
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def admit(self):
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                return False
+            self._queued += 1
+        self._slots.acquire()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self.requests += 1
+            self.max_running = max(self.max_running, self._running)
+        return True
+
+    def release(self, keep_alive):
+        with self._lock:
+            self._running -= 1
+            self._expires = time.monotonic() + parse_keep_alive(keep_alive, self.default_keep_alive)
+        self._slots.release()
+
+    def ensure_loaded(self):
+        # Returns the seconds spent loading the model for this request
+        with self._load_lock:
+            if time.monotonic() < self._expires:
+                return 0.001
+            time.sleep(self.load_time)
+            self.loads += 1
+            self._expires = float("inf")  # loaded; the timer starts when the request finishes
+            return self.load_time
+
+    def loaded(self):
+        return time.monotonic() < self._expires
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/api/ps":
+                self.send_json(200, {"models": [{"name": "fake"}] if fake.loaded() else []})
+            elif self.path in ("/", "/api/version"):
+                self.send_json(200, {"version": "0.0.0-fake"})
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/api/chat":
+                return self.send_json(404, {"error": "not found"})
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if not fake.admit():
+                return self.send_json(503, {"error": "server busy, please try again.  maximum pending requests exceeded"})
+            try:
+                self.chat(request)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client stopped reading, as Ollama allows
+            finally:
+                fake.release(request.get("keep_alive"))
+
+        def chat(self, request):
+            started = time.monotonic()
+            load_time = fake.ensure_loaded()
+            messages = request.get("messages") or []
+            done = {"model": request.get("model"), "created_at": datetime.now(timezone.utc).isoformat(),
+                    "message": {"role": "assistant", "content": ""}, "done": True, "load_duration": int(load_time * 1e9)}
+            if not messages:
+                return self.send_json(200, dict(done, done_reason="load"))
+            content = fake_content(messages, {"type": "json_object"} if request.get("format") == "json" else None, fake.steps)
+            num_predict = (request.get("options") or {}).get("num_predict")
+            chunk_chars = fake.tokens_per_chunk * 4
+            pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+            if num_predict:
+                pieces = pieces[:max(1, num_predict // fake.tokens_per_chunk)]
+            done.update(done_reason="stop", prompt_eval_count=sum(len(str(m.get("content", ""))) for m in messages) // 4,
+                        eval_count=len(pieces) * fake.tokens_per_chunk)
+            if not request.get("stream", True):
+                time.sleep(fake.token_time * fake.tokens_per_chunk * len(pieces))
+                done.update(message={"role": "assistant", "content": "".join(pieces)},
+                            total_duration=int((time.monotonic() - started) * 1e9))
+                return self.send_json(200, done)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for piece in pieces:
+                time.sleep(fake.token_time * fake.tokens_per_chunk)
+                self.wfile.write(json.dumps({"model": request.get("model"), "created_at": done["created_at"],
+                                             "message": {"role": "assistant", "content": piece}, "done": False}).encode() + b"\n")
+                self.wfile.flush()
+            done["total_duration"] = int((time.monotonic() - started) * 1e9)
+            self.wfile.write(json.dumps(done).encode() + b"\n")
+
+    return Handler
+
+def serve(fake, host="127.0.0.1", port=11435):
+    # Starts the stand-in on a background thread; port 0 picks a free port. Returns the server.
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake Ollama API for local testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--load-time", type=float, default=2.0, help="seconds to load the model")
+    parser.add_argument("--token-time", type=float, default=0.005, help="seconds per generated token")
+    parser.add_argument("--num-parallel", type=int, default=1, help="requests processed at once")
+    parser.add_argument("--max-queue", type=int, default=512, help="requests waiting before 503")
+    args = parser.parse_args(argv)
+    server = serve(FakeOllama(args.load_time, args.token_time, num_parallel=args.num_parallel, max_queue=args.max_queue),
+                   args.host, args.port)
+    print(f"fake Ollama on http://{args.host}:{server.server_address[1]}", file=sys.stderr, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,137 @@
 import streamlit as st
-import ollama
 import os
 import json
 import time
+import sys
 
-def make_api_call(messages, max_tokens, is_final_answer=False):
-    for attempt in range(3):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from response_cache import default_cache, request_key
+from scheduler import scheduler, estimate_tokens
+from telemetry import NULL_SPAN, tracer_from_env
+from step_controller import StepController
+from step_renderer import StepRenderer
+from step_stream import StepStreamParser
+from step_parser import load_step
+from ollama_backend import OllamaBackend
+
+# Shared response cache consulted by every API call; set to None to always hit the API.
+# This file is re-executed on every Streamlit rerun, so the cache lives in st.cache_resource.
+@st.cache_resource
+def get_response_cache():
+    return default_cache()
+
+cache = get_response_cache()
+
+# Optional telemetry.Tracer; when set, every chain records spans for its steps, API attempts and retries.
+# Enabled by setting G1_TRACE_FILE, G1_METRICS_FILE or G1_METRICS_PORT.
+tracer = tracer_from_env()
+
+# Streaming client for the local Ollama server (see ollama_backend.py). One per Streamlit server,
+# so the concurrency limit covers every session; creating it starts loading the model in the
+# background while the user types. Set OLLAMA_HOST, G1_OLLAMA_MODEL, G1_OLLAMA_KEEP_ALIVE or
+# G1_OLLAMA_CONCURRENCY to configure it.
+@st.cache_resource
+def get_backend():
+    backend = OllamaBackend()
+    backend.start_warm_up()
+    return backend
+
+backend = get_backend()
+
+def build_request(messages, max_tokens, is_final_answer):
+    # Steps are JSON objects; the final answer is plain text, which reads better and needs no parsing
+    return {
+        "model": backend.model,
+        "messages": messages,
+        "options": {"temperature": 0.2, "num_predict": max_tokens},
+        "format": None if is_final_answer else "json",
+    }
+
+def make_api_call(messages, max_tokens, is_final_answer=False, span=NULL_SPAN):
+    request = build_request(messages, max_tokens, is_final_answer)
+    key = request_key(**request) if cache is not None else None
+    cached = cache.get(key) if key else None
+    if cached is not None:
+        span.set(cache_hit=True)
+        return cached if is_final_answer else json.loads(cached)
+
+    tokens = estimate_tokens(messages, max_tokens)
+    for attempt in range(scheduler.max_attempts):
+        queue_time = scheduler.acquire(tokens)
+        attempt_span = span.child("api_attempt", model=request["model"], attempt=attempt, queue_time=queue_time)
         try:
-            response = ollama.chat(
-                model="llama3.1:70b",
-                messages=messages,
-                options={"temperature":0.2, "num_predict":max_tokens},
-                format='json',
-            )
-            return json.loads(response['message']['content'])
+            usage = {}
+            content = "".join(backend.stream_chat(**request, usage=usage))
+            if is_final_answer:
+                result = content
+            else:
+                result, content = load_step(content, attempt_span)
+            attempt_span.end(status="ok", **usage)
+            if key:
+                cache.put(key, content)
+            return result
         except Exception as e:
-            if attempt == 2:
+            attempt_span.end(status="error", error=str(e))
+            try:
+                scheduler.backoff(attempt, e)
+            except Exception:
                 if is_final_answer:
-                    return {"title": "Error", "content": f"Failed to generate final answer after 3 attempts. Error: {str(e)}"}
+                    return {"title": "Error", "content": f"Failed to generate final answer after {attempt + 1} attempts. Error: {str(e)}"}
                 else:
-                    return {"title": "Error", "content": f"Failed to generate step after 3 attempts. Error: {str(e)}", "next_action": "final_answer"}
-            time.sleep(1)  # Wait for 1 second before retrying
+                    return {"title": "Error", "content": f"Failed to generate step after {attempt + 1} attempts. Error: {str(e)}", "next_action": "final_answer"}
 
-def generate_response(prompt):
+def stream_api_call(messages, max_tokens, is_final_answer=False, span=NULL_SPAN):
+    # Streaming variant of make_api_call. Yields the partially parsed step dict (or the final
+    # answer text so far) as tokens arrive; the last value yielded is the complete result.
+    request = build_request(messages, max_tokens, is_final_answer)
+    key = request_key(**request) if cache is not None else None
+    cached = cache.get(key) if key else None
+    if cached is not None:
+        span.set(cache_hit=True)
+        yield cached if is_final_answer else json.loads(cached)
+        return
+
+    tokens = estimate_tokens(messages, max_tokens)
+    for attempt in range(scheduler.max_attempts):
+        queue_time = scheduler.acquire(tokens)
+        attempt_span = span.child("api_attempt", model=request["model"], attempt=attempt, queue_time=queue_time)
+        try:
+            usage = {}
+            started = time.perf_counter()
+            if is_final_answer:
+                text = ""
+                for delta in backend.stream_chat(**request, usage=usage):
+                    if not text:
+                        attempt_span.set(time_to_first_token=time.perf_counter() - started)
+                    text += delta
+                    yield text
+                result = text
+            else:
+                parser = StepStreamParser()
+                for i, delta in enumerate(backend.stream_chat(**request, usage=usage)):
+                    if i == 0:
+                        attempt_span.set(time_to_first_token=time.perf_counter() - started)
+                    yield dict(parser.feed(delta))
+                result, text = load_step(parser.text(), attempt_span)
+                yield result
+            attempt_span.end(status="ok", **usage)
+            if key:
+                cache.put(key, text)
+            return
+        except Exception as e:
+            attempt_span.end(status="error", error=str(e))
+            try:
+                scheduler.backoff(attempt, e)
+            except Exception:
+                if is_final_answer:
+                    yield {"title": "Error", "content": f"Failed to generate final answer after {attempt + 1} attempts. Error: {str(e)}"}
+                else:
+                    yield {"title": "Error", "content": f"Failed to generate step after {attempt + 1} attempts. Error: {str(e)}", "next_action": "final_answer"}
+                return
+
+def generate_response(prompt, stream=False, controller=None):
+    # With stream=True, partial steps are yielded as tokens arrive and every step tuple carries
+    # a fourth element: the time to its first visible token, in seconds.
     messages = [
         {"role": "system", "content": """You are an expert AI assistant that explains your reasoning step by step. For each step, provide a title that describes what you're doing in that step, along with the content. Decide if you need another step or if you're ready to give the final answer. Respond in JSON format with 'title', 'content', and 'next_action' (either 'continue' or 'final_answer') keys. USE AS MANY REASONING STEPS AS POSSIBLE. AT LEAST 3. BE AWARE OF YOUR LIMITATIONS AS AN LLM AND WHAT YOU CAN AND CANNOT DO. IN YOUR REASONING, INCLUDE EXPLORATION OF ALTERNATIVE ANSWERS. CONSIDER YOU MAY BE WRONG, AND IF YOU ARE WRONG IN YOUR REASONING, WHERE IT WOULD BE. FULLY TEST ALL OTHER POSSIBILITIES. YOU CAN BE WRONG. WHEN YOU SAY YOU ARE RE-EXAMINING, ACTUALLY RE-EXAMINE, AND USE ANOTHER APPROACH TO DO SO. DO NOT JUST SAY YOU ARE RE-EXAMINING. USE AT LEAST 3 METHODS TO DERIVE THE ANSWER. USE BEST PRACTICES.
 
@@ -38,24 +147,51 @@ Example of a valid JSON response:
         {"role": "assistant", "content": "Thank you! I will now think step by step following my instructions, starting at the beginning after decomposing the problem."}
     ]
     
+    chain_span = tracer.start("chain", prompt_chars=len(prompt)) if tracer else NULL_SPAN
     steps = []
     step_count = 1
     total_thinking_time = 0
+    controller = controller or StepController(final_tokens=200, min_final_tokens=100)
     
     while True:
         start_time = time.time()
-        step_data = make_api_call(messages, 300)
+        step_span = chain_span.child("step", step=step_count)
+        if stream:
+            first_token_time = None
+            for step_data in stream_api_call(messages, controller.step_max_tokens(messages), span=step_span):
+                if controller.cancelled:
+                    break
+                if first_token_time is None and (step_data.get('title') or step_data.get('content')):
+                    first_token_time = time.time() - start_time
+                yield steps + [(f"Step {step_count}: {step_data.get('title', '')}", step_data.get('content', ''), time.time() - start_time, first_token_time)], None
+        else:
+            step_data = make_api_call(messages, controller.step_max_tokens(messages), span=step_span)
         end_time = time.time()
         thinking_time = end_time - start_time
         total_thinking_time += thinking_time
+        if controller.cancelled:
+            step_span.end(cancelled=True)
+            chain_span.end(steps=step_count, stop="cancelled")
+            return
         
-        steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time))
+        if stream:
+            steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time, first_token_time))
+        else:
+            steps.append((f"Step {step_count}: {step_data['title']}", step_data['content'], thinking_time))
         
         messages.append({"role": "assistant", "content": json.dumps(step_data)})
+        step_span.end(title=step_data['title'])
+        controller.record(messages[:-1], messages[-1]['content'], thinking_time)
         
-        if step_data['next_action'] == 'final_answer' or step_count > 25: # Maximum of 25 steps to prevent infinite thinking time. Can be adjusted.
+        # Stop when the model is done, or at the step cap, deadline or token budget (see StepController)
+        if controller.should_stop(step_count, step_data, messages):
             break
         
+        # Nudge a chain that keeps repeating itself (see repetition.py)
+        steering = controller.steering_message()
+        if steering:
+            messages.append(steering)
+
         step_count += 1
 
         # Yield after each step for Streamlit to update
@@ -65,15 +201,49 @@ Example of a valid JSON response:
     messages.append({"role": "user", "content": "Please provide the final answer based on your reasoning above."})
     
     start_time = time.time()
-    final_data = make_api_call(messages, 200, is_final_answer=True)
+    final_span = chain_span.child("final_answer")
+    if stream:
+        first_token_time = None
+        for final_data in stream_api_call(messages, controller.final_max_tokens(messages), is_final_answer=True, span=final_span):
+            if controller.cancelled:
+                break
+            if first_token_time is None and final_data:
+                first_token_time = time.time() - start_time
+            yield steps + [("Final Answer", final_data if isinstance(final_data, str) else final_data['content'], time.time() - start_time, first_token_time)], None
+    else:
+        final_data = make_api_call(messages, controller.final_max_tokens(messages), is_final_answer=True, span=final_span)
     end_time = time.time()
     thinking_time = end_time - start_time
     total_thinking_time += thinking_time
+    if controller.cancelled:
+        final_span.end(cancelled=True)
+        chain_span.end(steps=step_count, stop="cancelled")
+        return
     
-    steps.append(("Final Answer", final_data['content'], thinking_time))
+    # API failures come back as an {"title": "Error", ...} dict rather than text
+    final_answer = final_data if isinstance(final_data, str) else final_data['content']
+    if stream:
+        steps.append(("Final Answer", final_answer, thinking_time, first_token_time))
+    else:
+        steps.append(("Final Answer", final_answer, thinking_time))
+    final_span.end()
+    controller.record(messages, steps[-1][1])
+    chain_span.end(steps=step_count, total_thinking_time=total_thinking_time, stop=controller.stop, tokens_used=controller.tokens_used)
 
     yield steps, total_thinking_time
 
+def render_step(step):
+    # Draws one step into the active container; StepRenderer calls it only when the step changed
+    title, content, thinking_time, *first_token_time = step
+    if title.startswith("Final Answer"):
+        st.markdown(f"### {title}")
+        st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
+    else:
+        with st.expander(title, expanded=True):
+            st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
+    if first_token_time and first_token_time[0] is not None:
+        st.markdown(f"*Time to first token: {first_token_time[0]:.2f} seconds*")
+
 def main():
     st.set_page_config(page_title="g1 prototype", page_icon="🧠", layout="wide")
     
@@ -91,20 +261,14 @@ def main():
     if user_query:
         st.write("Generating response...")
         
-        # Create empty elements to hold the generated text and total time
-        response_container = st.empty()
+        # Each step is drawn into its own placeholder; only steps that change are redrawn
+        response_container = st.container()
+        renderer = StepRenderer(response_container, render_step)
         time_container = st.empty()
         
         # Generate and display the response
-        for steps, total_thinking_time in generate_response(user_query):
-            with response_container.container():
-                for i, (title, content, thinking_time) in enumerate(steps):
-                    if title.startswith("Final Answer"):
-                        st.markdown(f"### {title}")
-                        st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
-                    else:
-                        with st.expander(title, expanded=True):
-                            st.markdown(content.replace('\n', '<br>'), unsafe_allow_html=True)
+        for steps, total_thinking_time in generate_response(user_query, stream=True):
+            renderer.update(steps)
             
             # Only show total time when it's available at the end
             if total_thinking_time is not None:
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import ollama
+
+# Client side of a local Ollama server. Replies are streamed (so long generations never sit
+# behind a read timeout and the UI can show tokens as they come), every request carries an
+# explicit keep_alive so the model stays loaded between the steps of a chain instead of being
+# evicted after Ollama's 5 minute default, and a warm-up call loads the model before the first
+# query. A local server runs only a few requests at once (OLLAMA_NUM_PARALLEL) and queues or
+# rejects the rest, so requests wait here for one of `max_concurrent` slots instead.
+
+MODEL = os.environ.get("G1_OLLAMA_MODEL", "llama3.1:70b")
+KEEP_ALIVE = os.environ.get("G1_OLLAMA_KEEP_ALIVE", "30m")
+COLD_START_SECONDS = 1.0  # a load_duration above this means the model was (re)loaded for the request
+
+def default_concurrency():
+    return int(os.environ.get("G1_OLLAMA_CONCURRENCY") or os.environ.get("OLLAMA_NUM_PARALLEL") or 1)
+
+class OllamaBackend:
+    def __init__(self, model=MODEL, host=None, keep_alive=KEEP_ALIVE, max_concurrent=None, timeout=None):
+        # host: None uses OLLAMA_HOST, else http://localhost:11434
+        self.model = model
+        self.keep_alive = keep_alive
+        self.max_concurrent = max_concurrent or default_concurrency()
+        self.client = ollama.Client(host=host, timeout=timeout)
+        self.requests = 0
+        self.active = 0
+        self.waiting = 0
+        self.slot_wait = 0.0
+        self.cold_starts = 0
+        self.load_time = 0.0
+        self.warm = threading.Event()
+        self.warm_up_error = None
+        self._slots = threading.Semaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        # Holds one of the server's request slots; yields how long it took to get one
+        started = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        self._slots.acquire()
+        waited = time.monotonic() - started
+        with self._lock:
+            self.waiting -= 1
+            self.active += 1
+            self.requests += 1
+            self.slot_wait += waited
+        try:
+            yield waited
+        finally:
+            with self._lock:
+                self.active -= 1
+            self._slots.release()
+
+    def stream_chat(self, model, messages, options=None, format=None, usage=None):
+        # Yields the text of the reply as it is generated. Token counts, load time and slot wait
+        # from the final chunk are copied into the `usage` dict when one is passed.
+        with self.slot() as waited:
+            if usage is not None:
+                usage["slot_wait"] = waited
+            response = self.client.chat(model=model, messages=messages, options=options, format=format,
+                                        stream=True, keep_alive=self.keep_alive)
+            for chunk in response:
+                if chunk.done:
+                    self._record_done(chunk, usage)
+                if chunk.message and chunk.message.content:
+                    yield chunk.message.content
+
+    def warm_up(self):
+        # A chat with no messages loads the model (and restarts its keep-alive timer) without
+        # generating anything. Failures are kept rather than raised: the first real request
+        # reports them properly.
+        started = time.monotonic()
+        try:
+            self._record_done(self.client.chat(model=self.model, messages=[], keep_alive=self.keep_alive))
+            self.warm_up_error = None
+        except Exception as e:
+            self.warm_up_error = e
+        finally:
+            self.warm.set()
+        return time.monotonic() - started
+
+    def start_warm_up(self):
+        thread = threading.Thread(target=self.warm_up, name="g1-ollama-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def _record_done(self, chunk, usage=None):
+        load_time = (chunk.load_duration or 0) / 1e9
+        with self._lock:
+            self.load_time += load_time
+            if load_time > COLD_START_SECONDS:
+                self.cold_starts += 1
+        if usage is not None:
+            usage.update(prompt_tokens=chunk.prompt_eval_count or 0, completion_tokens=chunk.eval_count or 0,
+                         load_time=load_time)
+
+    def stats(self):
+        with self._lock:
+            return {"model": self.model, "keep_alive": self.keep_alive, "max_concurrent": self.max_concurrent,
+                    "requests": self.requests, "active": self.active, "waiting": self.waiting,
+                    "slot_wait": round(self.slot_wait, 3), "cold_starts": self.cold_starts,
+                    "load_time": round(self.load_time, 3), "warm": self.warm.is_set(),
+                    "warm_up_error": str(self.warm_up_error) if self.warm_up_error else None}
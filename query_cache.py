@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Query-level cache of finished reasoning chains, off unless G1_QUERY_CACHE=on. Users ask the same
+# question again, and each time it would start a new chain of 5-25 calls that the response cache
+# cannot help with. A finished chain is served as is only for the same question: the same tokens in
+# the same order after normalization (see question_key), so "10*2" and "10-2", "5 km to miles" and
+# "5 miles to km" or "a mammal" and "not a mammal" never share an answer. A prompt that is merely
+# similar, by cosine similarity of hashed word and character-trigram vectors (one NumPy
+# matrix-vector product), is handed to the new chain as a warm start: a summary of the earlier
+# chain's steps and answer for the model to check and reuse (`warm_threshold`).
+# Entries belong to a scope, the client that asked (a user, an API key, a server client), and are
+# only served or used as warm starts within it, since a warm start shows the earlier prompt and
+# answer to the new chain. Entries are evicted least recently used beyond `max_entries`, and expire
+# after `ttl`.
+
+TOKEN = re.compile(r"\w+")
+QUESTION_TOKEN = re.compile(r"\d*\.\d+|\w+|[^\w\s]")
+IGNORED_PUNCTUATION = set("?!.,;\"'`")
+
+def question_key(prompt):
+    # Lowercased tokens in order. Numbers, one-letter words, "not" and operators all count; only
+    # punctuation that does not change the question is dropped
+    return " ".join(token for token in QUESTION_TOKEN.findall(prompt.lower()) if token not in IGNORED_PUNCTUATION)
+
+def prompt_vector(prompt, dim):
+    # Feature-hashed words and character trigrams (with word boundaries), each with a hashed
+    # sign so collisions cancel out on average; L2-normalized, so a dot product is the cosine
+    words = TOKEN.findall(prompt.lower())
+    features = list(words)
+    for word in words:
+        padded = f" {word} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    vector = np.zeros(dim, dtype=np.float32)
+    if not features:
+        return vector
+    hashes = np.array([zlib.crc32(feature.encode()) for feature in features], dtype=np.uint64)
+    signs = np.where(hashes >> np.uint64(31) & np.uint64(1), -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, (hashes % np.uint64(dim)).astype(np.intp), signs)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def warm_start_message(entry, max_steps=8, max_chars=160):
+    # The earlier chain, condensed into a message placed after the new prompt
+    lines = []
+    for title, content, *_ in entry["steps"][:-1][:max_steps]:
+        gist = str(content).split(". ")[0]
+        if len(gist) > max_chars:
+            gist = gist[:max_chars].rstrip() + "..."
+        lines.append(f"- {title}: {gist}")
+    return {
+        "role": "system",
+        "content": f"A similar question was answered before: {entry['prompt']!r}\n"
+                   "Its reasoning steps were:\n" + "\n".join(lines) +
+                   f"\nIts final answer was: {entry['steps'][-1][1]}\n"
+                   "Check whether this applies to the current question. Reuse what does, do not repeat "
+                   "steps that hold, and correct anything that differs.",
+    }
+
+def scope_id(scope):
+    # Scopes are compared as a NumPy column; the entry's own scope settles a collision
+    return zlib.crc32(repr(scope).encode())
+
+class QueryCache:
+    def __init__(self, warm_threshold=0.7, max_entries=1000, ttl=24 * 3600, dim=2048):
+        # warm_threshold: cosine similarity at which a finished chain is given to a new one as a
+        # warm start (None to turn warm starts off and only serve the same question)
+        self.warm_threshold = warm_threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.dim = dim
+        self.hits = 0
+        self.warm_starts = 0
+        self.misses = 0
+        self.evictions = 0
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._created = np.full(max_entries, -np.inf)  # -inf marks a free slot
+        self._scope_ids = np.zeros(max_entries, dtype=np.int64)
+        self._entries = [None] * max_entries
+        self._slots = OrderedDict()  # (scope, question key) -> slot, least recently used first
+        self._lock = threading.Lock()
+
+    def search(self, prompt, k=5, scope=None):
+        # Up to k (similarity, entry) pairs for unexpired entries of the scope, most similar first
+        vector = prompt_vector(prompt, self.dim)
+        with self._lock:
+            return self._search(vector, k, scope)
+
+    def lookup(self, prompt, scope=None):
+        # Returns ("hit", entry, 1.0) when the same question was answered in this scope, ("warm",
+        # entry, similarity) when a similar one can seed a new chain, or None
+        key = (scope, question_key(prompt))
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is not None and self._live(slot):
+                self._slots.move_to_end(key)
+                self.hits += 1
+                return "hit", self._entries[slot], 1.0
+        if self.warm_threshold is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        vector = prompt_vector(prompt, self.dim)
+        with self._lock:
+            found = self._search(vector, 1, scope)
+            if found and found[0][0] >= self.warm_threshold:
+                score, entry = found[0]
+                self._slots.move_to_end(entry["key"])
+                self.warm_starts += 1
+                return "warm", entry, score
+            self.misses += 1
+            return None
+
+    def put(self, prompt, steps, total_thinking_time, scope=None):
+        # Stores a finished chain: steps as (title, content, thinking_time), the final answer last
+        key = (scope, question_key(prompt))
+        entry = {
+            "key": key,
+            "scope": scope,
+            "prompt": prompt,
+            "steps": [tuple(step[:3]) for step in steps],
+            "total_thinking_time": total_thinking_time,
+        }
+        vector = prompt_vector(prompt, self.dim)
+        with self._lock:
+            slot = self._slots.pop(key, None)
+            if slot is None:
+                slot = self._free_slot()
+            self._vectors[slot] = vector
+            self._created[slot] = time.time()
+            self._scope_ids[slot] = scope_id(scope)
+            self._entries[slot] = entry
+            self._slots[key] = slot
+
+    def clear(self):
+        with self._lock:
+            self._created[:] = -np.inf
+            self._entries = [None] * self.max_entries
+            self._slots.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "warm_starts": self.warm_starts,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._slots),
+            }
+
+    def _live(self, slot):
+        return self._created[slot] > (time.time() - self.ttl if self.ttl is not None else -np.inf)
+
+    def _search(self, vector, k, scope):
+        live = self._created > (time.time() - self.ttl if self.ttl is not None else -np.inf)
+        live &= self._scope_ids == scope_id(scope)
+        if not live.any():
+            return []
+        scores = np.where(live, self._vectors @ vector, -np.inf)
+        k = min(k, int(live.sum()))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[slot]), self._entries[slot]) for slot in top if self._entries[slot]["scope"] == scope]
+
+    def _free_slot(self):
+        # A free or expired slot, else the least recently used entry's
+        free = np.flatnonzero(self._created == -np.inf)
+        if free.size:
+            return int(free[0])
+        if self.ttl is not None:
+            expired = np.flatnonzero(self._created < time.time() - self.ttl)
+            if expired.size:
+                slot = int(expired[0])
+                del self._slots[self._entries[slot]["key"]]
+                self.evictions += 1
+                return slot
+        _, slot = self._slots.popitem(last=False)
+        self.evictions += 1
+        return slot
+
+def default_query_cache():
+    # Off unless G1_QUERY_CACHE is "on"; G1_QUERY_CACHE_WARM_THRESHOLD sets the similarity for warm
+    # starts ("off" to only serve the same question)
+    if os.environ.get("G1_QUERY_CACHE", "off").lower() not in ("on", "1", "true"):
+        return None
+    warm_threshold = os.environ.get("G1_QUERY_CACHE_WARM_THRESHOLD", "0.7")
+    return QueryCache(warm_threshold=None if warm_threshold.lower() in ("off", "") else float(warm_threshold))
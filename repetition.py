@@ -0,0 +1,125 @@
+import bisect
+import re
+import threading
+
+# Loop detection for reasoning chains. Some chains stop making progress and restate the same
+# "re-examining" step until the step cap, and each repeat is a full API call over a longer prompt.
+# Every step's title and content is fingerprinted as a bottom-k MinHash sketch of its word
+# shingles (the `sketch_size` smallest shingle hashes), which estimates the Jaccard similarity
+# between any two steps. A step counts as a repeat when it is at least `threshold` similar to an
+# earlier step. After `patience` repeats in a row the chain has stalled. The detector then either
+# sends the model a steering message once and stops the chain if it stalls again ("steer"), or
+# stops it right away ("final_answer"). In both cases the chain still ends with a final answer.
+
+WORD = re.compile(r"\w+")
+
+STEERING_PROMPT = ("Your last steps repeat earlier ones without new information. Do not re-examine the same "
+                   "points again. Either take a genuinely different approach or, if you are confident, set "
+                   "next_action to 'final_answer'.")
+
+def shingle_hashes(text, size):
+    # Hashes of the text's word `size`-grams. hash() is only stable within a process, which is
+    # all a detector needs: its sketches are never stored or compared across processes.
+    words = WORD.findall(text.lower())
+    if len(words) <= size:
+        return {hash(tuple(words))} if words else set()
+    return {hash(shingle) for shingle in zip(*(words[i:] for i in range(size)))}
+
+def sketch(hashes, size):
+    # The `size` smallest shingle hashes, sorted and as a set
+    smallest = sorted(hashes)[:size]
+    return tuple(smallest), frozenset(smallest)
+
+def similarity(sketch_a, sketch_b, size):
+    # Estimated Jaccard similarity of the two steps' shingle sets
+    (sorted_a, set_a), (sorted_b, set_b) = sketch_a, sketch_b
+    if not sorted_a or not sorted_b:
+        return 0.0
+    if len(sorted_a) < size and len(sorted_b) < size:
+        # Both sketches hold every shingle, so this is exact
+        both = len(set_a & set_b)
+        return both / (len(set_a) + len(set_b) - both)
+    # Hashes up to the lower of the two sketches' largest are a uniform sample of the union
+    if sorted_a[-1] > sorted_b[-1]:
+        sorted_a, set_a, sorted_b = sorted_b, set_b, sorted_a
+    below = sorted_b[:bisect.bisect_right(sorted_b, sorted_a[-1])]
+    both = len(set_a.intersection(below))
+    return both / (len(sorted_a) + len(below) - both)
+
+class RepetitionStats:
+    # Process-wide counts of stalled chains, steering messages sent and steps saved by stopping.
+    # Steps saved assume a stalled chain would have run to its step cap.
+    def __init__(self):
+        self.stalls = 0
+        self.steers = 0
+        self.stops = 0
+        self.steps_saved = 0
+        self._lock = threading.Lock()
+
+    def record_steer(self):
+        with self._lock:
+            self.stalls += 1
+            self.steers += 1
+
+    def record_stop(self, steps_saved, steered):
+        with self._lock:
+            if not steered:
+                self.stalls += 1
+            self.stops += 1
+            self.steps_saved += steps_saved
+
+    def stats(self):
+        with self._lock:
+            return {"stalls": self.stalls, "steers": self.steers, "stops": self.stops, "steps_saved": self.steps_saved}
+
+repetition_stats = RepetitionStats()
+
+class RepetitionDetector:
+    def __init__(self, threshold=0.6, patience=2, action="steer", shingle_size=3, sketch_size=64, window=8, min_steps=3):
+        # threshold: estimated Jaccard similarity at which a step repeats an earlier one
+        # patience: repeats in a row before the chain counts as stalled
+        # action: "steer" (one steering message, then stop) or "final_answer" (stop at once)
+        # window: how many of the latest earlier steps each step is compared with
+        # min_steps: steps always allowed before the detector can act
+        if action not in ("steer", "final_answer"):
+            raise ValueError(f"unknown repetition action: {action}")
+        self.threshold = threshold
+        self.patience = patience
+        self.action = action
+        self.shingle_size = shingle_size
+        self.min_steps = min_steps
+        self.sketch_size = sketch_size
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.sketches = []
+        self.similarities = []
+        self.repeats = 0
+        self.steered = False
+        self.pending_steer = False
+        self.stalled = False
+
+    def observe(self, step_data):
+        # Fingerprints a finished step; returns its highest similarity to an earlier step
+        text = f"{step_data.get('title', '')}\n{step_data.get('content', '')}"
+        fingerprint = sketch(shingle_hashes(text, self.shingle_size), self.sketch_size)
+        score = max((similarity(fingerprint, earlier, self.sketch_size) for earlier in self.sketches[-self.window:]), default=0.0)
+        self.sketches.append(fingerprint)
+        self.similarities.append(score)
+        self.repeats = self.repeats + 1 if score >= self.threshold else 0
+        if self.repeats >= self.patience and len(self.sketches) >= self.min_steps:
+            if self.action == "steer" and not self.steered:
+                self.steered = self.pending_steer = True
+                self.repeats = 0
+                repetition_stats.record_steer()
+            else:
+                self.stalled = True
+        return score
+
+    def steering_message(self):
+        # The steering message to add before the next step, once, or None
+        if not self.pending_steer:
+            return None
+        self.pending_steer = False
+        return {"role": "user", "content": STEERING_PROMPT}
@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+from response_cache import request_key
+
+# Record/replay stand-ins for groq.Groq / groq.AsyncGroq. A RecordingClient wraps a real client
+# and appends every chat completion it makes, request and response with its timings, to a
+# cassette (a JSONL file). A ReplayClient plugs into `custom_client` and answers the same requests
+# from the cassette at the recorded speed, scaled by `latency_scale` (0 = instantly), so chains
+# can be benchmarked and regression-tested without an API key or network noise.
+#
+#   GROQ_API_KEY=gsk... python replay_client.py record -o chains.jsonl "How many Rs are in strawberry?"
+#   python replay_client.py replay chains.jsonl "How many Rs are in strawberry?" --latency-scale 0
+
+class CassetteMiss(LookupError):
+    pass
+
+def interaction_key(request):
+    # Streaming is a transport detail: a streamed and a plain call for the same request match
+    return request_key(**{key: value for key, value in request.items() if key != "stream"})
+
+def chunk(content, usage=None):
+    part = SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+    if usage is not None:
+        part.x_groq = SimpleNamespace(usage=SimpleNamespace(**usage))
+    return part
+
+def completion(content, usage):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                           usage=SimpleNamespace(**usage))
+
+def usage_dict(usage):
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0}
+    return {"prompt_tokens": getattr(usage, 'prompt_tokens', 0) or 0,
+            "completion_tokens": getattr(usage, 'completion_tokens', 0) or 0}
+
+def load_cassette(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class Cassette:
+    # Recorded interactions by request key, each served in recorded order and then cycled, so
+    # a chain that repeats a request (a retry, or the same prompt run many times) still replays
+    def __init__(self, interactions):
+        self.interactions = interactions
+        self.by_key = {}
+        for interaction in interactions:
+            self.by_key.setdefault(interaction["key"], []).append(interaction)
+        self.hits = 0
+        self.misses = 0
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, request):
+        key = interaction_key(request)
+        with self._lock:
+            recorded = self.by_key.get(key)
+            if not recorded:
+                self.misses += 1
+                raise CassetteMiss(f"no recorded response for this request (key {key[:12]}, "
+                                   f"{len(request.get('messages', []))} messages)")
+            index = self._next.get(key, 0)
+            self._next[key] = index + 1
+            self.hits += 1
+            return recorded[index % len(recorded)]
+
+class RecordingClient:
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **request):
+        request = json.loads(json.dumps(request, default=str))  # the caller's message list keeps growing
+        started = time.perf_counter()
+        response = self.client.chat.completions.create(**request)
+        if not request.get("stream"):
+            latency = time.perf_counter() - started
+            self.save(request, response.choices[0].message.content, latency, usage_dict(getattr(response, 'usage', None)))
+            return response
+        return self.record_stream(request, response, started)
+
+    def record_stream(self, request, response, started):
+        # Passes chunks through as they arrive and saves the call once the stream is finished
+        parts = []
+        usage = None
+        for part in response:
+            part_usage = getattr(part, 'usage', None) or getattr(getattr(part, 'x_groq', None), 'usage', None)
+            if part_usage is not None:
+                usage = part_usage
+            if part.choices and part.choices[0].delta.content:
+                parts.append([time.perf_counter() - started, part.choices[0].delta.content])
+            yield part
+        self.save(request, "".join(text for _, text in parts), time.perf_counter() - started, usage_dict(usage), parts)
+
+    def save(self, request, content, latency, usage, chunks=None):
+        interaction = {"key": interaction_key(request), "request": request, "content": content,
+                       "latency": latency, "usage": usage}
+        if chunks is not None:
+            interaction["chunks"] = chunks
+        line = json.dumps(interaction, ensure_ascii=False, default=str)
+        with self._lock:
+            self.calls += 1
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+class AsyncRecordingClient(RecordingClient):
+    async def create(self, **request):
+        request = json.loads(json.dumps(request, default=str))
+        started = time.perf_counter()
+        response = await self.client.chat.completions.create(**request)
+        self.save(request, response.choices[0].message.content, time.perf_counter() - started,
+                  usage_dict(getattr(response, 'usage', None)))
+        return response
+
+class ReplayClient:
+    def __init__(self, cassette, latency_scale=1.0):
+        # cassette: a path or a Cassette; latency_scale: 1 replays at recorded speed, 0.5 twice
+        # as fast, 0 without any delay
+        self.cassette = cassette if isinstance(cassette, Cassette) else Cassette(load_cassette(cassette))
+        self.latency_scale = latency_scale
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **request):
+        self.calls += 1
+        interaction = self.cassette.lookup(request)
+        if request.get("stream"):
+            return self.replay_stream(interaction)
+        if self.latency_scale:
+            time.sleep(interaction["latency"] * self.latency_scale)
+        return completion(interaction["content"], interaction["usage"])
+
+    def replay_stream(self, interaction):
+        chunks = interaction.get("chunks") or [[interaction["latency"], interaction["content"]]]
+        started = time.perf_counter()
+        for offset, text in chunks:
+            if self.latency_scale:
+                delay = offset * self.latency_scale - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            yield chunk(text)
+        yield chunk("", interaction["usage"])
+
+class AsyncReplayClient(ReplayClient):
+    async def create(self, **request):
+        self.calls += 1
+        interaction = self.cassette.lookup(request)
+        await asyncio.sleep(interaction["latency"] * self.latency_scale)
+        return completion(interaction["content"], interaction["usage"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record g1 chains to a cassette, or replay them from one.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="run prompts against the API and record every call")
+    record.add_argument("prompts", nargs="+")
+    record.add_argument("-o", "--output", required=True, help="cassette file (JSONL, appended to)")
+    record.add_argument("--stream", action="store_true", help="record streamed calls, with chunk timings")
+    replay = commands.add_parser("replay", help="run prompts against a cassette")
+    replay.add_argument("cassette")
+    replay.add_argument("prompts", nargs="+")
+    replay.add_argument("--latency-scale", type=float, default=1.0, help="1 = recorded speed, 0 = no delay")
+    replay.add_argument("--stream", action="store_true")
+    args = parser.parse_args(argv)
+
+    import g1
+    g1.cache = None  # every call should reach the client being recorded or replayed
+    g1.checkpoints = None
+    g1.query_cache = None
+    if args.command == "record":
+        if not os.environ.get("GROQ_API_KEY"):
+            parser.error("GROQ_API_KEY is not set")
+        client = RecordingClient(g1.client, args.output)
+    else:
+        client = ReplayClient(args.cassette, args.latency_scale)
+    for prompt in args.prompts:
+        started = time.perf_counter()
+        for steps, total_thinking_time in g1.generate_response(prompt, custom_client=client, stream=args.stream):
+            pass
+        print(f"{prompt[:60]!r}: {len(steps) - 1} steps, {time.perf_counter() - started:.2f} s", file=sys.stderr)
+        print(steps[-1][1])
+    if args.command == "replay":
+        print(f"cassette hits {client.cassette.hits}, misses {client.cassette.misses}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
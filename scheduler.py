@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+from step_parser import StepParseError, error_body
+
+# Process-wide, rate-limit-aware scheduler for API calls. Every chain in the process draws from
+# the same request and token buckets and backs off together when the endpoint pushes back, so
+# load degrades smoothly instead of every thread retrying in lockstep.
+
+RETRYABLE_STATUS = {408, 409, 429}
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "ConnectionError", "Timeout", "ReadTimeout"}
+
+def status_code(exc):
+    code = getattr(exc, 'status_code', None)
+    if code is None:
+        code = getattr(getattr(exc, 'response', None), 'status_code', None)
+    return code if isinstance(code, int) else None
+
+def retry_after(exc):
+    # Seconds the server asked us to wait, from Retry-After (or retry-after-ms) headers
+    headers = getattr(getattr(exc, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return float(headers.get('retry-after-ms')) / 1000
+        if headers.get('retry-after') is not None:
+            return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+def is_parse_error(exc):
+    # The model's output did not parse, as opposed to a ValueError from a bug or a bad request.
+    # JSON mode reports its own parse failures as a 400 with code json_validate_failed.
+    return (isinstance(exc, (StepParseError, json.JSONDecodeError))
+            or error_body(exc).get('code') == 'json_validate_failed')
+
+def is_retryable(exc):
+    code = status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS or code >= 500 or is_parse_error(exc)
+    if type(exc).__name__ in RETRYABLE_ERROR_NAMES or isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    # The model returned something that did not parse; a fresh sample usually does
+    return is_parse_error(exc)
+
+def estimate_tokens(messages, max_tokens):
+    # Rough upper bound for the token bucket: ~4 characters per prompt token plus the completion
+    return sum(len(str(m.get('content', ''))) for m in messages) // 4 + max_tokens
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        # Take `amount` now, going into debt if needed; returns how long the caller must wait.
+        # Reserving under the lock keeps callers in arrival order instead of racing on wake-up.
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+class RetryScheduler:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_attempts=3,
+                 base_delay=0.5, max_delay=30.0):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.throttled_time = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=0):
+        # Seconds to wait before this call may be sent
+        with self._lock:
+            now = time.monotonic()
+            self.calls += 1
+            wait = max(0.0, self._paused_until - now)
+            if self.request_bucket:
+                wait = max(wait, self.request_bucket.reserve(1, now))
+            if self.token_bucket and tokens:
+                wait = max(wait, self.token_bucket.reserve(tokens, now))
+            self.throttled_time += wait
+            return wait
+
+    def retry_delay(self, attempt, exc):
+        # Delay before the next attempt, or re-raise exc when it should not be retried
+        with self._lock:
+            if not is_retryable(exc) or attempt + 1 >= self.max_attempts:
+                self.failures += 1
+                raise exc
+            self.retries += 1
+            delay = retry_after(exc)
+            if status_code(exc) == 429:
+                self.rate_limited += 1
+                if delay is not None:
+                    # The limit is shared, so every chain in the process waits it out
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            if delay is None and is_parse_error(exc):
+                # Output that could not be parsed, not an overloaded server: ask again right away
+                delay = 0.0
+            if delay is None:
+                # Exponential backoff with full jitter
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            return delay
+
+    def acquire(self, tokens=0):
+        # Blocks until the call may be sent; returns the time spent queued
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def backoff(self, attempt, exc, cancel_token=None):
+        # A step_controller.CancellationToken cuts the wait short when its chain is cancelled
+        delay = self.retry_delay(attempt, exc)
+        if cancel_token is not None:
+            cancel_token.wait(delay)
+        else:
+            time.sleep(delay)
+
+    async def aacquire(self, tokens=0):
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+    async def abackoff(self, attempt, exc):
+        await asyncio.sleep(self.retry_delay(attempt, exc))
+
+    def call(self, fn, tokens=0):
+        for attempt in range(self.max_attempts):
+            self.acquire(tokens)
+            try:
+                return fn()
+            except Exception as e:
+                self.backoff(attempt, e)
+
+    async def acall(self, fn, tokens=0):
+        for attempt in range(self.max_attempts):
+            await self.aacquire(tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                await self.abackoff(attempt, e)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "failures": self.failures,
+                "throttled_time": self.throttled_time,
+            }
+
+def env_number(name):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+# Shared by every chain in the process. Limits are off unless G1_REQUESTS_PER_MINUTE or
+# G1_TOKENS_PER_MINUTE are set; backoff and Retry-After handling always apply.
+scheduler = RetryScheduler(
+    requests_per_minute=env_number("G1_REQUESTS_PER_MINUTE"),
+    tokens_per_minute=env_number("G1_TOKENS_PER_MINUTE"),
+)
@@ -0,0 +1,169 @@
+import queue
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from step_controller import CancellationToken, StepController
+
+# Self-consistency: run several independent reasoning chains at once with different sampling
+# settings, then vote on their final answers. Chains share the process-wide scheduler, so they
+# run concurrently within the rate limits and the whole run takes about as long as its slowest
+# chain. With a quorum, the run stops as soon as enough chains agree and the rest are cancelled:
+# every chain's StepController shares one CancellationToken, so a losing chain stops streaming,
+# retrying or starting calls as soon as the vote is decided, not only at its next step.
+
+DEFAULT_TEMPERATURES = (0.2, 0.5, 0.7, 0.9, 1.0)
+
+ANSWER_PATTERNS = [
+    re.compile(r"\\boxed\{([^{}]*)\}"),
+    re.compile(r"(?:final answer|the answer|answer)\s*(?:is|:)\s*(.+?)(?:\.\s|\.$|\n|$)", re.IGNORECASE),
+]
+
+def extract_answer(text):
+    # The part of a free-form final answer that should be compared between chains
+    for pattern in ANSWER_PATTERNS:
+        matches = pattern.findall(text)
+        if matches:
+            return matches[-1]
+    return text
+
+def normalize_answer(text):
+    # Vote key for a final answer: case, markdown, punctuation and number formatting are ignored
+    answer = extract_answer(text).lower()
+    answer = re.sub(r"[*_`#>$]", "", answer)
+    answer = re.sub(r"(?<=\d),(?=\d{3})", "", answer)
+    answer = re.sub(r"\b(\d+)\.0+\b", r"\1", answer)
+    answer = re.sub(r"[^\w\s.%/-]|(?<!\d)\.|\.(?!\d)", " ", answer)
+    return " ".join(answer.split())
+
+def sampling_for(index, temperatures=DEFAULT_TEMPERATURES):
+    # Chain 0 keeps the usual low temperature; the seed keeps every chain's requests (and cache keys) distinct
+    return {"temperature": temperatures[index % len(temperatures)], "seed": index}
+
+class ChainState:
+    def __init__(self, index, sampling):
+        self.index = index
+        self.sampling = sampling
+        self.steps = []
+        self.status = "queued"
+        self.answer = None
+        self.vote = None
+        self.total_thinking_time = None
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "sampling": self.sampling,
+            "status": self.status,
+            "steps": len(self.steps),
+            "answer": self.answer,
+            "vote": self.vote,
+            "total_thinking_time": self.total_thinking_time,
+        }
+
+class Vote:
+    def __init__(self, chains, quorum):
+        self.chains = chains
+        self.quorum = quorum
+        self.counts = Counter()
+        self.answers = {}
+        self.finished = set()
+
+    def add(self, chain):
+        self.finished.add(chain.index)
+        if not isinstance(chain.answer, str) or not chain.answer.strip():
+            return
+        chain.vote = normalize_answer(chain.answer)
+        self.counts[chain.vote] += 1
+        # Keep the first full answer that reached each key as its representative
+        self.answers.setdefault(chain.vote, chain.answer)
+
+    def winner(self):
+        # Most votes; ties go to the answer that was reached first
+        if not self.counts:
+            return None
+        return max(self.counts, key=lambda vote: (self.counts[vote], -list(self.answers).index(vote)))
+
+    def decided(self):
+        pending = sum(1 for chain in self.chains if chain.index not in self.finished and chain.status != "cancelled")
+        if not pending:
+            return True
+        if not self.quorum or not self.counts:
+            return False
+        ranked = self.counts.most_common(2)
+        lead = ranked[0][1] - (ranked[1][1] if len(ranked) > 1 else 0)
+        # Quorum reached, or the leader can no longer be caught by the chains still running
+        return ranked[0][1] >= self.quorum or lead > pending
+
+    def summary(self):
+        winner = self.winner()
+        return {
+            "answer": self.answers.get(winner),
+            "vote": winner,
+            "votes": dict(self.counts),
+            "agreement": self.counts[winner] / sum(self.counts.values()) if winner else 0.0,
+            "chains": [chain.to_dict() for chain in self.chains],
+        }
+
+def run_chain(generate, prompt, chain, cancel, updates, generate_kwargs):
+    if cancel.cancelled:
+        chain.status = "cancelled"
+        updates.put(chain)
+        return
+    chain.status = "running"
+    updates.put(chain)
+    responses = generate(prompt, sampling=chain.sampling, controller=StepController(cancel_token=cancel), **generate_kwargs)
+    try:
+        for steps, total_thinking_time in responses:
+            chain.steps = list(steps)
+            if total_thinking_time is not None:
+                chain.total_thinking_time = total_thinking_time
+                chain.answer = steps[-1][1]
+                chain.status = "done"
+            elif cancel.cancelled:
+                chain.status = "cancelled"
+                break
+            updates.put(chain)
+    except Exception as e:
+        chain.status = "error"
+        chain.answer = {"title": "Error", "content": str(e)}
+    finally:
+        responses.close()
+        updates.put(chain)
+
+def generate_self_consistent(prompt, generate=None, n=5, quorum=None, temperatures=DEFAULT_TEMPERATURES,
+                             max_workers=None, **generate_kwargs):
+    # Runs n chains of `generate` (g1.generate_response by default) on a bounded thread pool and
+    # yields (chains, result, total_time) as they progress. chains holds every chain's ChainState;
+    # result and total_time are None until voting is decided, after which result is the summary
+    # from Vote.summary(). quorum=k stops once k chains agree, e.g. n // 2 + 1 for a majority.
+    # Extra keyword arguments (custom_client, ...) are passed to every chain.
+    if generate is None:
+        from g1 import generate_response as generate
+    start_time = time.time()
+    chains = [ChainState(i, sampling_for(i, temperatures)) for i in range(n)]
+    vote = Vote(chains, quorum)
+    cancel = CancellationToken()
+    updates = queue.Queue()
+    executor = ThreadPoolExecutor(max_workers=max_workers or n, thread_name_prefix="g1-chain")
+    try:
+        for chain in chains:
+            executor.submit(run_chain, generate, prompt, chain, cancel, updates, generate_kwargs)
+        while True:
+            chain = updates.get()
+            if chain.status in ("done", "error") and chain.index not in vote.finished:
+                vote.add(chain)
+            if vote.decided():
+                break
+            yield chains, None, None
+    finally:
+        # Chains still running stop their current call or wait; queued ones never start
+        cancel.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+    for chain in chains:
+        if chain.status in ("done", "error") and chain.index not in vote.finished:
+            vote.add(chain)
+        elif chain.status in ("queued", "running"):
+            chain.status = "cancelled"
+    yield chains, vote.summary(), time.time() - start_time
@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# HTTP API for embedding g1 in other services, served on a single asyncio event loop with only
+# the standard library.
+#
+#   POST /v1/chains  {"prompt": "...", "variant": "g1" | "tool-use",
+#                     "deadline": seconds, "token_budget": tokens, "max_steps": n, "chain_id": "..."}
+#
+# The response is a Server-Sent Events stream: one `step` event per completed reasoning step, then
+# a `final` event with the answer (or an `error` event). Each client (its peer address, or the
+# X-Client-Id header when the request comes through a trusted proxy) may run a limited number of
+# chains at once and gets 429 beyond that; when the server is at capacity, requests wait briefly for a slot and then get 503. A chain is cancelled
+# as soon as its client disconnects, so abandoned requests stop spending tokens. With checkpoints
+# enabled (see checkpoint.py), a request that repeats an earlier request's chain_id resumes that
+# chain; IDs are scoped to the client, and one that is already running gets 409.
+#
+#   python server.py --port 8000        (add --fake to serve a local fake LLM)
+#   python server.py --trusted-proxy 10.0.0.5   (a proxy that sets X-Client-Id per end client)
+
+os.environ.setdefault("GROQ_API_KEY", "")  # g1 builds its default clients at import time
+
+import g1
+from checkpoint import chain_key
+from step_controller import StepController
+from telemetry import tracer_from_env
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+HEARTBEAT_SECONDS = 15
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+           413: "Payload Too Large", 429: "Too Many Requests", 503: "Service Unavailable"}
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+async def read_request(reader):
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.LimitOverrunError:
+        raise HttpError(413, "headers too large")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    length = headers.get("content-length") or "0"
+    # Digits only: int() would also take a sign, spaces or underscores
+    if not (length.isascii() and length.isdigit()):
+        raise HttpError(400, "malformed Content-Length")
+    length = int(length)
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+def response_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode("utf-8")
+
+def step_event(index, step):
+    # Step tuples are (title, content, thinking_time) plus (tool, tool_input, tool_result) for tool-use
+    title, content, thinking_time, *tool = step
+    event = {"index": index, "title": title, "content": content, "thinking_time": thinking_time}
+    if tool and tool[0] is not None:
+        event.update(tool=tool[0], tool_input=tool[1], tool_result=tool[2])
+    return event
+
+class ChainServer:
+    def __init__(self, client=None, tool_client=None, max_chains=256, per_client=4, queue_timeout=10.0, tool_threads=32,
+                 trusted_proxies=()):
+        # client: async client for the g1 variant; tool_client: sync client for tool-use (None = default)
+        # trusted_proxies: peer addresses whose X-Client-Id header identifies the client
+        self.client = client
+        self.tool_client = tool_client
+        self.max_chains = max_chains
+        self.per_client = per_client
+        self.queue_timeout = queue_timeout
+        self.trusted_proxies = set(trusted_proxies)
+        self.slots = None
+        self.active = {}
+        self.running_chain_ids = set()
+        self.stats = {"requests": 0, "completed": 0, "cancelled": 0, "failed": 0, "rejected": 0}
+        # The tool-use chain is synchronous (its tools block), so it runs on threads
+        self.tool_executor = ThreadPoolExecutor(max_workers=tool_threads, thread_name_prefix="g1-tool-chain")
+        self._tool_generate = None
+
+    async def start(self, host="127.0.0.1", port=8000):
+        self.slots = asyncio.Semaphore(self.max_chains)
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                method, path, headers, body = await read_request(reader)
+                if path == "/healthz" and method == "GET":
+                    await self.send_json(writer, 200, {"status": "ok", "active": sum(self.active.values())})
+                elif path == "/stats" and method == "GET":
+                    await self.send_json(writer, 200, dict(self.stats, active=sum(self.active.values())))
+                elif path == "/v1/chains":
+                    if method != "POST":
+                        raise HttpError(405, "use POST")
+                    await self.serve_chain(reader, writer, headers, body)
+                else:
+                    raise HttpError(404, "not found")
+            except HttpError as e:
+                await self.send_json(writer, e.status, {"error": str(e)}, e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def send_json(self, writer, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(response_head(status, {"Content-Type": "application/json", "Content-Length": len(body),
+                                            "Connection": "close", **(headers or {})}) + body)
+        await writer.drain()
+
+    def parse_chain_request(self, body):
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            raise HttpError(400, "body must be JSON")
+        if not isinstance(request, dict) or not isinstance(request.get("prompt"), str) or not request["prompt"].strip():
+            raise HttpError(400, "a non-empty 'prompt' string is required")
+        if request.get("variant", "g1") not in ("g1", "tool-use"):
+            raise HttpError(400, "variant must be 'g1' or 'tool-use'")
+        options = {key: request[key] for key in ("deadline", "token_budget", "max_steps") if request.get(key) is not None}
+        for key, value in options.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                raise HttpError(400, f"'{key}' must be a positive number")
+        chain_id = request.get("chain_id")
+        if chain_id is not None and (not isinstance(chain_id, str) or not chain_id):
+            raise HttpError(400, "'chain_id' must be a non-empty string")
+        return request["prompt"], request.get("variant", "g1"), options, chain_id
+
+    def client_id(self, writer, headers):
+        # Any client can send its own X-Client-Id, so the header only counts from a trusted proxy
+        peer = (writer.get_extra_info("peername") or ("unknown",))[0]
+        if peer in self.trusted_proxies and headers.get("x-client-id"):
+            return "proxied:" + headers["x-client-id"]
+        return peer
+
+    async def serve_chain(self, reader, writer, headers, body):
+        self.stats["requests"] += 1
+        prompt, variant, options, chain_id = self.parse_chain_request(body)
+        client_id = self.client_id(writer, headers)
+        if self.active.get(client_id, 0) >= self.per_client:
+            self.stats["rejected"] += 1
+            raise HttpError(429, f"at most {self.per_client} concurrent chains per client", {"Retry-After": "1"})
+        if chain_id is not None:
+            chain_id = chain_key(prompt, client=client_id, chain_id=chain_id, variant=variant)
+            if chain_id in self.running_chain_ids:
+                raise HttpError(409, "a chain with this chain_id is already running")
+            self.running_chain_ids.add(chain_id)
+        self.active[client_id] = self.active.get(client_id, 0) + 1
+        try:
+            try:
+                await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["rejected"] += 1
+                raise HttpError(503, "server at capacity", {"Retry-After": "5"})
+            try:
+                await self.stream_chain(reader, writer, prompt, variant, StepController(**options), chain_id, client_id)
+            finally:
+                self.slots.release()
+        finally:
+            self.running_chain_ids.discard(chain_id)
+            self.active[client_id] -= 1
+            if not self.active[client_id]:
+                del self.active[client_id]
+
+    async def stream_chain(self, reader, writer, prompt, variant, controller, chain_id=None, client_id=None):
+        writer.write(response_head(200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                         "Connection": "close", "X-Accel-Buffering": "no"}))
+        updates = asyncio.Queue()
+        chain = asyncio.create_task(self.run_chain(prompt, variant, controller, updates, chain_id, client_id))
+        # The request body has been read, so the next read only returns when the client hangs up
+        disconnected = asyncio.create_task(reader.read(1))
+        sent = 0
+        try:
+            while True:
+                update = asyncio.create_task(updates.get())
+                done, _ = await asyncio.wait({update, disconnected}, timeout=HEARTBEAT_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    update.cancel()
+                    raise ConnectionResetError("client disconnected")
+                if not done:
+                    update.cancel()
+                    writer.write(b": keep-alive\n\n")
+                    await writer.drain()
+                    continue
+                item = update.result()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    self.stats["failed"] += 1
+                    writer.write(sse("error", {"error": f"{type(item).__name__}: {item}"}))
+                    await writer.drain()
+                    break
+                steps, total_thinking_time = item
+                finished = total_thinking_time is not None
+                # Send every step that is complete; only the final answer waits for the end
+                for index in range(sent, len(steps) - 1 if finished else len(steps)):
+                    writer.write(sse("step", step_event(index, steps[index])))
+                sent = max(sent, len(steps) - 1 if finished else len(steps))
+                if finished:
+                    final_answer = steps[-1][1]
+                    writer.write(sse("final", {"final_answer": final_answer, "total_thinking_time": total_thinking_time,
+                                               "stop": controller.stop, "tokens_used": controller.tokens_used,
+                                               "error": isinstance(final_answer, dict)}))
+                    self.stats["failed" if isinstance(final_answer, dict) else "completed"] += 1
+                # Waiting for the client to take the data is what keeps slow readers from piling up output
+                await writer.drain()
+        except ConnectionError:
+            self.stats["cancelled"] += 1
+        finally:
+            controller.cancel()
+            chain.cancel()
+            disconnected.cancel()
+
+    async def run_chain(self, prompt, variant, controller, updates, chain_id=None, client_id=None):
+        try:
+            if variant == "g1":
+                async for steps, total_thinking_time in g1.agenerate_response(prompt, custom_client=self.client, controller=controller,
+                                                                              chain_id=chain_id, query_scope=client_id):
+                    updates.put_nowait((list(steps), total_thinking_time))
+            else:
+                await self.run_tool_chain(prompt, controller, updates, chain_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            updates.put_nowait(e)
+        updates.put_nowait(None)
+
+    async def run_tool_chain(self, prompt, controller, updates, chain_id=None):
+        loop = asyncio.get_running_loop()
+        generate = self.tool_generate()
+
+        def run():
+            # Stops at the next step once the controller is cancelled (e.g. the client went away)
+            for steps, total_thinking_time in generate(prompt, custom_client=self.tool_client, controller=controller,
+                                                       chain_id=chain_id):
+                loop.call_soon_threadsafe(updates.put_nowait, (list(steps), total_thinking_time))
+
+        await loop.run_in_executor(self.tool_executor, run)
+
+    def tool_generate(self):
+        # Imported on first use: the tool-use variant needs exa_py and EXA_API_KEY
+        if self._tool_generate is None:
+            sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tool-use'))
+            from g1_experimental import generate_response
+            self._tool_generate = generate_response
+        return self._tool_generate
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve g1 reasoning chains over HTTP with Server-Sent Events.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-chains", type=int, default=256, help="chains running at once across all clients")
+    parser.add_argument("--per-client", type=int, default=4, help="chains running at once per client")
+    parser.add_argument("--queue-timeout", type=float, default=10.0, help="seconds to wait for a free slot before 503")
+    parser.add_argument("--trusted-proxy", action="append", default=[], metavar="ADDRESS",
+                        help="proxy address whose X-Client-Id header is trusted (repeatable)")
+    parser.add_argument("--fake", action="store_true", help="serve a local fake LLM instead of the API")
+    parser.add_argument("--fake-latency", type=float, default=0.05, help="seconds per fake API call")
+    args = parser.parse_args(argv)
+
+    client = tool_client = None
+    if args.fake:
+        from fake_client import FakeAsyncClient, FakeClient
+        client = FakeAsyncClient(latency=args.fake_latency)
+        tool_client = FakeClient(latency=args.fake_latency)
+    elif not os.environ.get("GROQ_API_KEY"):
+        parser.error("GROQ_API_KEY is not set (use --fake to serve a fake LLM)")
+    g1.tracer = tracer_from_env()
+
+    async def serve():
+        chain_server = ChainServer(client, tool_client, args.max_chains, args.per_client, args.queue_timeout,
+                                   trusted_proxies=args.trusted_proxy)
+        server = await chain_server.start(args.host, args.port)
+        print(f"serving on http://{args.host}:{args.port}/v1/chains", file=sys.stderr, flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
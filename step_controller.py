@@ -0,0 +1,129 @@
+import threading
+import time
+from context_window import count_tokens
+from repetition import RepetitionDetector, repetition_stats
+
+# Stopping rules for a reasoning chain. Besides the model asking for its final answer, a chain
+# stops at a step cap, a wall-clock deadline, a total token budget, when it keeps repeating
+# itself (see repetition.py) or on a cancellation request. All but cancellation still end with a
+# final-answer call; cancellation ends the chain immediately.
+# Tokens are the same ~4 characters per token estimate the context compactor uses, counted for
+# every prompt sent plus every completion received.
+
+class CancellationToken:
+    # Thread-safe flag a caller can set to stop a running chain, e.g. when a client disconnects
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout):
+        # Sleeps up to timeout seconds, returning early (True) once cancelled
+        return self._event.wait(timeout)
+
+class StepController:
+    def __init__(self, deadline=None, token_budget=None, max_steps=25, step_tokens=300, final_tokens=1200,
+                 min_step_tokens=100, min_final_tokens=200, cancel_token=None, repetition=None):
+        # deadline: seconds from start() until the final answer should be done
+        # token_budget: total prompt + completion tokens the chain may spend
+        # repetition: a RepetitionDetector (default settings when None), or False to turn it off
+        self.deadline = deadline
+        self.token_budget = token_budget
+        self.max_steps = max_steps
+        self.step_tokens = step_tokens
+        self.final_tokens = final_tokens
+        self.min_step_tokens = min_step_tokens
+        self.min_final_tokens = min_final_tokens
+        self.cancel_token = cancel_token or CancellationToken()
+        self.repetition = RepetitionDetector() if repetition is None else repetition
+        self.start()
+
+    def start(self):
+        self.started = time.monotonic()
+        self.tokens_used = 0
+        self.step_times = []
+        self.stop = None
+        if self.repetition:
+            self.repetition.reset()
+
+    @property
+    def cancelled(self):
+        return self.cancel_token.cancelled
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def record(self, prompt_messages, completion, duration=None):
+        # Charge one API call against the budget; pass its duration for steps
+        self.tokens_used += count_tokens(prompt_messages) + len(str(completion)) // 4
+        if duration is not None:
+            self.step_times.append(duration)
+
+    def remaining_tokens(self):
+        return None if self.token_budget is None else self.token_budget - self.tokens_used
+
+    def step_max_tokens(self, prompt_messages):
+        # Shrink the step's completion so the final-answer call that follows still fits
+        if self.token_budget is None:
+            return self.step_tokens
+        prompt = count_tokens(prompt_messages)
+        available = self.remaining_tokens() - prompt - (prompt + self.min_final_tokens)
+        return max(self.min_step_tokens, min(self.step_tokens, available))
+
+    def final_max_tokens(self, prompt_messages):
+        if self.token_budget is None:
+            return self.final_tokens
+        available = self.remaining_tokens() - count_tokens(prompt_messages)
+        return max(self.min_final_tokens, min(self.final_tokens, available))
+
+    def stop_reason(self, step_count, messages):
+        # Why the chain should go to its final answer instead of taking another step, or None
+        if self.cancelled:
+            return "cancelled"
+        if step_count >= self.max_steps:
+            return "max_steps"
+        if self.repetition and self.repetition.stalled:
+            return "repetition"
+        if self.deadline is not None and self.step_times:
+            # Leave room for one more step and a final answer, which usually takes about as long
+            average = sum(self.step_times) / len(self.step_times)
+            if self.elapsed() + 2 * average > self.deadline:
+                return "deadline"
+        if self.token_budget is not None:
+            # The next step and the final answer each resend at least the current history
+            prompt = count_tokens(messages)
+            if 2 * prompt + self.min_step_tokens + self.min_final_tokens > self.remaining_tokens():
+                return "token_budget"
+        return None
+
+    def should_stop(self, step_count, step_data, messages):
+        # Records and returns the reason the step loop ends after this step, or None to continue
+        if step_data.get('next_action') == 'final_answer':
+            self.stop = "final_answer"
+        else:
+            if self.repetition:
+                self.repetition.observe(step_data)
+            self.stop = self.stop_reason(step_count, messages)
+            if self.stop == "repetition":
+                repetition_stats.record_stop(self.max_steps - step_count, self.repetition.steered)
+        return self.stop
+
+    def steering_message(self):
+        # A message to append before the next step when the chain has started repeating itself
+        return self.repetition.steering_message() if self.repetition else None
+
+    def stats(self):
+        return {
+            "elapsed": self.elapsed(),
+            "tokens_used": self.tokens_used,
+            "steps": len(self.step_times),
+            "stop": self.stop,
+        }
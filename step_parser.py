@@ -0,0 +1,185 @@
+import json
+import re
+import threading
+
+# Tolerant parsing of the {"title", "content", "next_action", ...} step objects. Models sometimes
+# wrap the object in a ```json fence or in prose, run out of max_tokens mid-string, or leave out
+# a key. Those replies are repaired here instead of being thrown away: the JSON is pulled out of
+# fences and surrounding text, unterminated strings, arrays and objects are closed (dropping a
+# dangling key or half-written value), and missing keys get defaults. Only replies with nothing
+# usable in them raise StepParseError, which the API call treats as a reason to ask again.
+
+FENCE = re.compile(r"```[a-zA-Z]*\s*(.*?)(?:```|$)", re.S)
+PARTIAL_ESCAPE = re.compile(r"\\(u[0-9a-fA-F]{0,3})?$")
+TOOL_KEYS = ("tool", "tool_input", "tool_calls", "num_results")
+FINAL_ACTIONS = {"final_answer", "final answer", "final-answer", "finalanswer", "final", "answer", "done", "finish"}
+
+class StepParseError(ValueError):
+    pass
+
+def close_truncated(text):
+    # Candidate completions of a JSON prefix: everything closed as is, then cut back to the last
+    # comma outside a string (which drops a dangling key or an unfinished number or literal)
+    stack = []
+    in_string = False
+    escape = False
+    commas = []
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            if stack:
+                stack.pop()
+        elif ch == ',':
+            commas.append((i, list(stack)))
+    head = text
+    if in_string:
+        head = PARTIAL_ESCAPE.sub('', head) + '"'
+    yield head.rstrip().rstrip(',') + ''.join(reversed(stack))
+    if commas:
+        i, stack = commas[-1]
+        yield text[:i] + ''.join(reversed(stack))
+
+def repair_json(text):
+    # Returns (value, repair) for a reply that is not valid JSON as it stands
+    fenced = FENCE.search(text)
+    candidates = [(fenced.group(1), "fenced")] if fenced else []
+    candidates.append((text, "extracted"))
+    for candidate, repair in candidates:
+        start = candidate.find('{')
+        if start < 0:
+            continue
+        end = candidate.rfind('}')
+        if end > start:
+            try:
+                return json.loads(candidate[start:end + 1]), repair
+            except ValueError:
+                pass
+        for completed in close_truncated(candidate[start:]):
+            try:
+                return json.loads(completed), "truncated"
+            except ValueError:
+                pass
+    raise StepParseError(f"no JSON object in model output: {text[:200]!r}")
+
+def as_text(value):
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+def normalize_step(data):
+    # Returns (step, filled): the step with 'title', 'content' and 'next_action' guaranteed to be
+    # strings, and whether any of them had to be made up or coerced
+    if isinstance(data, list):
+        data = next((item for item in data if isinstance(item, dict)), None)
+    if not isinstance(data, dict):
+        raise StepParseError("model output is not a JSON object")
+    step = dict(data)
+    lowered = {key.lower(): value for key, value in data.items() if isinstance(key, str)}
+    title, content = lowered.get('title'), lowered.get('content')
+    if not title and not content:
+        raise StepParseError("step has neither a title nor content")
+    filled = False
+    if not isinstance(content, str):
+        content = as_text(content)
+        filled = True
+    if not isinstance(title, str) or not title.strip():
+        # Fall back to the start of the first sentence of the content
+        title = re.split(r'(?<=[.!?:])\s|\n', content.strip(), maxsplit=1)[0][:60] or "Reasoning"
+        filled = True
+    action = lowered.get('next_action')
+    next_action = "final_answer" if str(action).strip().lower() in FINAL_ACTIONS else "continue"
+    if action != next_action:
+        filled = True
+    step.update(title=title, content=content, next_action=next_action)
+    return step, filled
+
+class StepParseStats:
+    # Counts of clean, repaired and unusable step replies; every unusable one cost a re-request
+    def __init__(self):
+        self.clean = 0
+        self.repaired = {}
+        self.unrepairable = 0
+        self._lock = threading.Lock()
+
+    def record(self, repair):
+        with self._lock:
+            if repair is None:
+                self.clean += 1
+            else:
+                self.repaired[repair] = self.repaired.get(repair, 0) + 1
+
+    def record_failure(self):
+        with self._lock:
+            self.unrepairable += 1
+
+    def stats(self):
+        with self._lock:
+            return {"clean": self.clean, "repaired": sum(self.repaired.values()),
+                    "repairs": dict(self.repaired), "rerequested": self.unrepairable}
+
+parse_stats = StepParseStats()
+
+def parse_step(text):
+    # Returns (step, repair): repair is None when the reply was a complete, valid step, else what
+    # was fixed ("fenced", "extracted", "truncated" or "defaults"). Raises StepParseError when
+    # nothing usable can be recovered.
+    try:
+        try:
+            data, repair = json.loads(text), None
+        except (TypeError, ValueError):
+            data, repair = repair_json(text or "")
+        step, filled = normalize_step(data)
+    except StepParseError:
+        parse_stats.record_failure()
+        raise
+    if repair == "truncated":
+        # A tool call that was cut off may have lost part of its input; never run it
+        for key in TOOL_KEYS:
+            step.pop(key, None)
+    repair = repair or ("defaults" if filled else None)
+    parse_stats.record(repair)
+    return step, repair
+
+def load_step(text, span=None):
+    # parse_step for API call sites: returns the step and the text to cache for it (the repaired
+    # step re-serialized, so a cache hit never needs repairing again) and notes the repair on span
+    step, repair = parse_step(text)
+    if repair is None:
+        return step, text
+    if span is not None:
+        span.set(repair=repair)
+    return step, json.dumps(step)
+
+def error_body(exc):
+    # The "error" object of an API error response ({"message", "type", "code", ...}), or {}
+    body = getattr(exc, 'body', None)
+    if isinstance(body, dict):
+        return body.get('error') if isinstance(body.get('error'), dict) else body
+    return {}
+
+def failed_generation(exc):
+    # What the model wrote when JSON mode rejected it: a 400 with code json_validate_failed
+    body = error_body(exc)
+    text = body.get('failed_generation') if body.get('code') == 'json_validate_failed' else None
+    return text if isinstance(text, str) else None
+
+def recover_step(exc, span=None):
+    # load_step for the generation JSON mode rejected, when it can be repaired; else None, and
+    # the step is asked for again
+    text = failed_generation(exc)
+    if text is None:
+        return None
+    try:
+        return load_step(text, span)
+    except StepParseError:
+        return None
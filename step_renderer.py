@@ -0,0 +1,31 @@
+# Append-only rendering of a reasoning chain in Streamlit. Each step gets its own placeholder the
+# first time it appears, and a step is only redrawn when its tuple changes, so completed steps are
+# drawn once and only the in-progress step updates while tokens stream in. Rebuilding the whole
+# chain on every yield is O(steps^2) element updates and makes long chains flicker.
+
+class StepRenderer:
+    def __init__(self, container, render_step):
+        # container: a Streamlit container (st.container()), render_step: draws one step tuple
+        # with st.* calls into whatever container is active
+        self.container = container
+        self.render_step = render_step
+        self.placeholders = []
+        self.rendered = []
+        self.redraws = 0
+
+    def update(self, steps):
+        for i, step in enumerate(steps):
+            if i < len(self.rendered):
+                if self.rendered[i] == step:
+                    continue
+                self.rendered[i] = step
+            else:
+                self.placeholders.append(self.container.empty())
+                self.rendered.append(step)
+            with self.placeholders[i].container():
+                self.render_step(step)
+            self.redraws += 1
+        # A step that disappeared (e.g. a cancelled partial step) is cleared rather than left stale
+        while len(self.rendered) > len(steps):
+            self.rendered.pop()
+            self.placeholders.pop().empty()
@@ -0,0 +1,136 @@
+import json
+
+# Incremental parser for the {"title", "content", "next_action", ...} step objects the model
+# streams back. Top-level string fields become visible character by character as chunks arrive;
+# any other value (lists, numbers, nested objects) appears once it is complete.
+
+ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+class StepStreamParser:
+    def __init__(self):
+        self.fields = {}
+        self._raw = []
+        self._state = 'start'
+        self._key = []
+        self._current_key = None
+        self._parts = []
+        self._escape = None
+        self._depth = 0
+        self._nested_in_string = False
+        self._nested_escape = False
+
+    def feed(self, chunk):
+        # Consume a chunk of model output and return the fields parsed so far
+        self._raw.append(chunk)
+        for ch in chunk:
+            self._consume(ch)
+        if self._state == 'string':
+            self.fields[self._current_key] = ''.join(self._parts)
+        return self.fields
+
+    def text(self):
+        return ''.join(self._raw)
+
+    def result(self):
+        # Authoritative parse of everything fed so far; raises ValueError on invalid JSON
+        return json.loads(self.text())
+
+    def _consume(self, ch):
+        state = self._state
+        if state == 'string':
+            if self._escape is not None:
+                self._escape += ch
+                if self._escape[0] != 'u':
+                    self._parts.append(ESCAPES.get(ch, ch))
+                    self._escape = None
+                elif len(self._escape) == 5:
+                    try:
+                        self._parts.append(chr(int(self._escape[1:], 16)))
+                    except ValueError:
+                        pass
+                    self._escape = None
+            elif ch == '\\':
+                self._escape = ''
+            elif ch == '"':
+                self.fields[self._current_key] = ''.join(self._parts)
+                self._state = 'key_or_end'
+            else:
+                self._parts.append(ch)
+        elif state == 'start':
+            if ch == '{':
+                self._state = 'key_or_end'
+        elif state == 'key_or_end':
+            if ch == '"':
+                self._key = []
+                self._state = 'key'
+            elif ch == '}':
+                self._state = 'done'
+        elif state == 'key':
+            if ch == '"' and not (self._key and self._key[-1] == '\\'):
+                self._current_key = ''.join(self._key)
+                self._state = 'colon'
+            else:
+                self._key.append(ch)
+        elif state == 'colon':
+            if ch == ':':
+                self._state = 'value'
+        elif state == 'value':
+            if ch == '"':
+                self._parts = []
+                self.fields[self._current_key] = ''
+                self._state = 'string'
+            elif ch in '{[':
+                self._parts = [ch]
+                self._depth = 1
+                self._nested_in_string = False
+                self._state = 'nested'
+            elif not ch.isspace():
+                self._parts = [ch]
+                self._state = 'scalar'
+        elif state == 'nested':
+            self._parts.append(ch)
+            if self._nested_in_string:
+                if self._nested_escape:
+                    self._nested_escape = False
+                elif ch == '\\':
+                    self._nested_escape = True
+                elif ch == '"':
+                    self._nested_in_string = False
+            elif ch == '"':
+                self._nested_in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value()
+                    self._state = 'key_or_end'
+        elif state == 'scalar':
+            if ch in ',}' or ch.isspace():
+                self._finish_value()
+                self._state = 'done' if ch == '}' else 'key_or_end'
+            else:
+                self._parts.append(ch)
+
+    def _finish_value(self):
+        raw = ''.join(self._parts)
+        try:
+            self.fields[self._current_key] = json.loads(raw)
+        except ValueError:
+            self.fields[self._current_key] = raw
+
+def iter_chunk_text(response, usage=None):
+    # Yield the text deltas of a streamed chat completion, skipping empty keep-alive chunks.
+    # Token usage reported on the final chunk (Groq's x_groq.usage or OpenAI's usage) is copied
+    # into the `usage` dict when one is passed.
+    for chunk in response:
+        if usage is not None:
+            chunk_usage = getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+            if chunk_usage is not None:
+                usage["prompt_tokens"] = getattr(chunk_usage, 'prompt_tokens', 0) or 0
+                usage["completion_tokens"] = getattr(chunk_usage, 'completion_tokens', 0) or 0
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
@@ -0,0 +1,247 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_router import call_cost
+
+# Per-chain telemetry. A chain is a tree of spans (chain > step/final_answer > api_attempt, tool)
+# timed with a monotonic clock. Finished chains can be exported as JSON traces, and aggregate
+# metrics are available in the Prometheus text format as a file or an HTTP endpoint.
+
+class NullSpan:
+    # Stand-in used when telemetry is off, so call sites never need to check
+    def child(self, name, **attrs):
+        return self
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+    def end(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    def __init__(self, tracer, name, trace_id, parent_id, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = dict(attrs)
+        self.start_time = time.time()
+        self.duration = None
+        self._start = time.perf_counter()
+
+    def child(self, name, **attrs):
+        return Span(self.tracer, name, self.trace_id, self.span_id, attrs)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key, amount=1):
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def end(self, **attrs):
+        if self.duration is not None:
+            return
+        self.attrs.update(attrs)
+        self.duration = time.perf_counter() - self._start
+        self.tracer.finish(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "attributes": self.attrs,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.set(error=str(exc))
+        self.end()
+        return False
+
+def response_usage(response):
+    # Token counts from a chat completion (OpenAI/Groq object or Ollama dict), when present
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        return {
+            "prompt_tokens": getattr(usage, 'prompt_tokens', None) or 0,
+            "completion_tokens": getattr(usage, 'completion_tokens', None) or 0,
+        }
+    if isinstance(response, dict) and 'prompt_eval_count' in response:
+        return {"prompt_tokens": response.get('prompt_eval_count') or 0, "completion_tokens": response.get('eval_count') or 0}
+    return {}
+
+class Tracer:
+    def __init__(self, trace_file=None, metrics_file=None, max_spans=20000):
+        self.trace_file = trace_file
+        self.metrics_file = metrics_file
+        self.spans = deque(maxlen=max_spans)
+        self.counters = {}
+        self.summaries = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self, name, **attrs):
+        return Span(self, name, uuid.uuid4().hex, None, attrs)
+
+    def finish(self, span):
+        with self._lock:
+            self.spans.append(span)
+            self._record(span)
+        if span.parent_id is None:
+            self._export_chain(span.trace_id)
+
+    def trace(self, trace_id):
+        with self._lock:
+            return [span.to_dict() for span in self.spans if span.trace_id == trace_id]
+
+    def export_json(self, path):
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        with open(path, 'w') as f:
+            json.dump(spans, f, indent=2)
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            for name in sorted(self.counters):
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(self.counters[name].items()):
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+            for name in sorted(self.summaries):
+                lines.append(f"# TYPE {name} summary")
+                for labels, (total, count) in sorted(self.summaries[name].items()):
+                    lines.append(f"{name}_sum{format_labels(labels)} {total:.6f}")
+                    lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self, path=None):
+        path = path or self.metrics_file
+        text = self.prometheus_text()
+        with open(path + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    def serve_metrics(self, port, host='127.0.0.1'):
+        # Expose /metrics on a background thread; idempotent
+        if self._server is not None:
+            return self._server
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = tracer.prometheus_text().encode()
+                self.send_response(200 if self.path.startswith('/metrics') else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def _count(self, name, amount=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    def _observe(self, name, value, **labels):
+        series = self.summaries.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        total, count = series.get(key, (0.0, 0))
+        series[key] = (total + value, count + 1)
+
+    def _record(self, span):
+        attrs = span.attrs
+        if span.name == 'chain':
+            self._count('g1_chains_total')
+            if attrs.get('stop'):
+                self._count('g1_chain_stops_total', stop=attrs['stop'])
+            if attrs.get('query_cache'):
+                self._count('g1_query_cache_total', result=attrs['query_cache'])
+            self._observe('g1_chain_duration_seconds', span.duration)
+        elif span.name in ('step', 'final_answer'):
+            self._count('g1_steps_total', kind=span.name)
+            self._observe('g1_step_duration_seconds', span.duration, kind=span.name)
+            if attrs.get('cache_hit'):
+                self._count('g1_cache_hits_total')
+        elif span.name == 'api_attempt':
+            model = attrs.get('model', '')
+            self._count('g1_api_attempts_total', model=model, status=attrs.get('status', 'ok'))
+            self._observe('g1_api_latency_seconds', span.duration, model=model)
+            self._count('g1_prompt_tokens_total', attrs.get('prompt_tokens', 0), model=model)
+            self._count('g1_completion_tokens_total', attrs.get('completion_tokens', 0), model=model)
+            self._count('g1_api_cost_dollars_total', call_cost(model, attrs.get('prompt_tokens', 0), attrs.get('completion_tokens', 0)), model=model)
+            if attrs.get('attempt', 0) > 0:
+                self._count('g1_api_retries_total', model=model)
+            if attrs.get('repair'):
+                self._count('g1_step_repairs_total', model=model, repair=attrs['repair'])
+            if attrs.get('queue_time'):
+                self._observe('g1_api_queue_seconds', attrs['queue_time'], model=model)
+            if attrs.get('time_to_first_token') is not None:
+                self._observe('g1_time_to_first_token_seconds', attrs['time_to_first_token'], model=model)
+            if attrs.get('completion_tokens') and span.duration:
+                self._observe('g1_completion_tokens_per_second', attrs['completion_tokens'] / span.duration, model=model)
+        elif span.name == 'tool':
+            self._count('g1_tool_calls_total', tool=str(attrs.get('tool')))
+            self._observe('g1_tool_latency_seconds', span.duration, tool=str(attrs.get('tool')))
+
+    def _export_chain(self, trace_id):
+        if self.trace_file:
+            line = json.dumps({"trace_id": trace_id, "spans": self.trace(trace_id)}, default=str)
+            with self._lock:
+                with open(self.trace_file, 'a') as f:
+                    f.write(line + "\n")
+        if self.metrics_file:
+            self.write_metrics()
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in labels) + "}"
+
+shared_tracer = None
+shared_tracer_lock = threading.Lock()
+
+def tracer_from_env():
+    # Front-end hook: returns the process-wide Tracer when any of G1_TRACE_FILE (JSONL, one chain
+    # per line), G1_METRICS_FILE or G1_METRICS_PORT is set, otherwise None (telemetry off)
+    global shared_tracer
+    trace_file = os.environ.get("G1_TRACE_FILE")
+    metrics_file = os.environ.get("G1_METRICS_FILE")
+    metrics_port = os.environ.get("G1_METRICS_PORT")
+    if not (trace_file or metrics_file or metrics_port):
+        return None
+    with shared_tracer_lock:
+        if shared_tracer is None:
+            shared_tracer = Tracer(trace_file=trace_file, metrics_file=metrics_file)
+            if metrics_port:
+                shared_tracer.serve_metrics(int(metrics_port))
+        return shared_tracer
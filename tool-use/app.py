@@ -1,11 +1,72 @@
 import streamlit as st
+import g1_experimental
 from g1_experimental import generate_response
+from model_router import describe_models
+from telemetry import tracer_from_env
+from step_renderer import StepRenderer
 import json
 
+def render_step(step):
+    # Draws one step into the active container; StepRenderer calls it only when the step changed
+    # Unpack step information, handling both old and new formats
+    first_token_time = None
+    if len(step) == 3:
+        title, content, thinking_time = step
+        tool, tool_input, tool_result = None, None, None
+    elif len(step) == 4:
+        title, content, thinking_time, first_token_time = step
+        tool, tool_input, tool_result = None, None, None
+    elif len(step) == 6:
+        title, content, thinking_time, tool, tool_input, tool_result = step
+    elif len(step) == 7:
+        title, content, thinking_time, tool, tool_input, tool_result, first_token_time = step
+    else:
+        st.error(f"Unexpected step format: {step}")
+        return
+
+    # Ensure content is a string
+    if not isinstance(content, str):
+        content = json.dumps(content)
+
+    if title.startswith("Final Answer"):
+        st.markdown(f"### {title}")
+        if '```' in content:
+            parts = content.split('```')
+            for index, part in enumerate(parts):
+                if index % 2 == 0:
+                    st.markdown(part)
+                else:
+                    if '\n' in part:
+                        lang_line, code = part.split('\n', 1)
+                        lang = lang_line.strip()
+                    else:
+                        lang = ''
+                        code = part
+                    st.code(part, language=lang)
+        else:
+            st.write(content.replace('\n', '<br>'), unsafe_allow_html=True)
+    else:
+        with st.expander(title, expanded=True):
+            st.write(content.replace('\n', '<br>'), unsafe_allow_html=True)
+            if isinstance(tool, list):
+                for call_tool, call_input, call_result in zip(tool, tool_input, tool_result or []):
+                    st.markdown(f"**Tool Used:** {call_tool}")
+                    st.markdown(f"**Tool Input:** `{call_input}`")
+                    st.markdown(f"**Tool Result:** {str(call_result)[:200] + '...' if len(str(call_result)) > 200 else call_result}")
+            elif tool:
+                st.markdown(f"**Tool Used:** {tool}")
+                st.markdown(f"**Tool Input:** `{tool_input}`")
+                st.markdown(f"**Tool Result:** {str(tool_result)[:200] + '...' if len(str(tool_result)) > 200 else tool_result}")
+    st.markdown(f"*Thinking time: {thinking_time:.2f} seconds*")
+    if first_token_time is not None:
+        st.markdown(f"*Time to first token: {first_token_time:.2f} seconds*")
+
 def main():
+    g1_experimental.tracer = tracer_from_env()  # set G1_TRACE_FILE, G1_METRICS_FILE or G1_METRICS_PORT to enable
     st.set_page_config(page_title="g1 prototype", page_icon="🧠", layout="wide")
     
     st.title("g1: Powered by Llama on Groq producing o1-like reasoning chains and tool calling")
+    st.caption(describe_models(g1_experimental.router, g1_experimental.MODEL))
     
     st.markdown("""
     This is an enhanced prototype of using prompting to create o1-like reasoning chains to improve output accuracy. 
@@ -21,53 +82,14 @@ def main():
     if user_query:
         st.write("Generating response...")
         
-        # Create empty elements to hold the generated text and total time
-        response_container = st.empty()
+        # Each step is drawn into its own placeholder; only steps that change are redrawn
+        response_container = st.container()
+        renderer = StepRenderer(response_container, render_step)
         time_container = st.empty()
         
         # Generate and display the response
-        for steps, total_thinking_time in generate_response(user_query):
-            with response_container.container():
-                for step in steps:
-                    # Unpack step information, handling both old and new formats
-                    if len(step) == 3:
-                        title, content, thinking_time = step
-                        tool, tool_input, tool_result = None, None, None
-                    elif len(step) == 6:
-                        title, content, thinking_time, tool, tool_input, tool_result = step
-                    else:
-                        st.error(f"Unexpected step format: {step}")
-                        continue
-
-                    # Ensure content is a string
-                    if not isinstance(content, str):
-                        content = json.dumps(content)
-                    
-                    if title.startswith("Final Answer"):
-                        st.markdown(f"### {title}")
-                        if '```' in content:
-                            parts = content.split('```')
-                            for index, part in enumerate(parts):
-                                if index % 2 == 0:
-                                    st.markdown(part)
-                                else:
-                                    if '\n' in part:
-                                        lang_line, code = part.split('\n', 1)
-                                        lang = lang_line.strip()
-                                    else:
-                                        lang = ''
-                                        code = part
-                                    st.code(part, language=lang)
-                        else:
-                            st.write(content.replace('\n', '<br>'), unsafe_allow_html=True)
-                    else:
-                        with st.expander(title, expanded=True):
-                            st.write(content.replace('\n', '<br>'), unsafe_allow_html=True)
-                            if tool:
-                                st.markdown(f"**Tool Used:** {tool}")
-                                st.markdown(f"**Tool Input:** `{tool_input}`")
-                                st.markdown(f"**Tool Result:** {str(tool_result)[:200] + '...' if len(str(tool_result)) > 200 else tool_result}")
-                    st.markdown(f"*Thinking time: {thinking_time:.2f} seconds*")
+        for steps, total_thinking_time in generate_response(user_query, stream=True):
+            renderer.update(steps)
             
             # Only show total time when it's available at the end
             if total_thinking_time is not None:
@@ -0,0 +1,224 @@
+import ast
+import functools
+import math
+import numbers
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Whitelist compiler for the calculator tool. An expression is parsed once, checked node by node
+# against what arithmetic needs, and compiled to a reusable callable; compiled expressions are
+# kept in an LRU so repeated and related calls skip parsing entirely. With NumPy installed the
+# same callable evaluates element-wise over arrays, so a whole range is one call.
+
+MAX_EXPONENT = 10000
+MAX_DIGITS = 4300  # Python refuses to convert longer integers to str (sys.int_max_str_digits)
+MAX_BITS = MAX_DIGITS * math.log2(10)
+
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.BoolOp, ast.IfExp, ast.Call,
+    ast.Name, ast.Load, ast.Attribute, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.And, ast.Or, ast.Not,
+)
+
+class CalculatorError(ValueError):
+    pass
+
+def check_bits(bits):
+    # Integer results are bounded by size before they are computed: the evaluation holds the GIL,
+    # so the tool timeout cannot interrupt it, and longer results cannot be printed anyway
+    if bits > MAX_BITS:
+        raise CalculatorError(f"Result too large (limit {MAX_DIGITS} digits)")
+
+def log2_factorial(n):
+    try:
+        return math.lgamma(n + 1) / math.log(2)
+    except OverflowError:
+        raise CalculatorError(f"Result too large (limit {MAX_DIGITS} digits)")
+
+def safe_pow(base, exponent):
+    # 9**9**9 or (9**9999)**9999 would otherwise hang the process building an enormous integer
+    if np is not None and isinstance(exponent, np.ndarray):
+        if np.abs(exponent).max(initial=0) > MAX_EXPONENT:
+            raise CalculatorError(f"Exponent too large (limit {MAX_EXPONENT})")
+    elif abs(exponent) > MAX_EXPONENT:
+        raise CalculatorError(f"Exponent too large (limit {MAX_EXPONENT})")
+    elif isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        check_bits(exponent * math.log2(abs(base)))
+    return base ** exponent
+
+def safe_mul(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        check_bits(left.bit_length() + right.bit_length() - 1)
+    return left * right
+
+def safe_factorial(n):
+    if isinstance(n, numbers.Integral) and n > 1:
+        check_bits(log2_factorial(n))
+    return math.factorial(n)
+
+def safe_comb(n, k):
+    if isinstance(n, numbers.Integral) and isinstance(k, numbers.Integral) and 0 < k < n:
+        check_bits(log2_factorial(n) - log2_factorial(k) - log2_factorial(n - k))
+    return math.comb(n, k)
+
+def safe_perm(n, k=None):
+    if isinstance(n, numbers.Integral) and (k is None or isinstance(k, numbers.Integral) and 0 < k <= n):
+        check_bits(log2_factorial(n) - log2_factorial(n - (n if k is None else k)))
+    return math.perm(n, k)
+
+def check_result(value):
+    # Last line of defence for functions such as lcm, whose results can outgrow their arguments
+    if isinstance(value, int) and value.bit_length() > MAX_BITS:
+        raise CalculatorError(f"Result too large (limit {MAX_DIGITS} digits)")
+    return value
+
+def public_names(module):
+    return {name: getattr(module, name) for name in dir(module) if not name.startswith('_')}
+
+MATH_NAMES = public_names(math)
+SCALAR_FUNCTIONS = {**MATH_NAMES, "factorial": safe_factorial, "comb": safe_comb, "perm": safe_perm,
+                    "abs": abs, "round": round, "min": min, "max": max, "int": int, "float": float, "pow": safe_pow}
+
+def vector_functions():
+    # NumPy counterparts of the scalar namespace; math functions without one are vectorized
+    functions = {}
+    for name, value in SCALAR_FUNCTIONS.items():
+        if not callable(value):
+            functions[name] = value
+        elif name == "pow":
+            functions[name] = value
+        elif hasattr(np, name) and callable(getattr(np, name)):
+            functions[name] = getattr(np, name)
+        else:
+            functions[name] = np.vectorize(value)
+    functions.update({"abs": np.abs, "round": np.round, "min": np.minimum, "max": np.maximum,
+                      "int": lambda v: np.asarray(v).astype(int), "float": lambda v: np.asarray(v).astype(float)})
+    return functions
+
+class MathNamespace:
+    # Lets `math.sqrt(x)` resolve to the same function as the bare `sqrt(x)`
+    def __init__(self, functions):
+        self.__dict__.update({name: functions[name] for name in MATH_NAMES})
+
+class RewriteGrowth(ast.NodeTransformer):
+    # ** and * are the operators that can grow an integer past MAX_BITS; route them through the
+    # size checks
+    CHECKED = {ast.Pow: '__pow__', ast.Mult: '__mul__'}
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        name = self.CHECKED.get(type(node.op))
+        if name:
+            call = ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+            return ast.copy_location(call, node)
+        return node
+
+def validate(tree):
+    variables = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise CalculatorError(f"Unsupported syntax: {type(node).__name__}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, complex)):
+            raise CalculatorError("Only numeric constants are allowed")
+        if isinstance(node, ast.Attribute):
+            if not (isinstance(node.value, ast.Name) and node.value.id == 'math' and node.attr in MATH_NAMES):
+                raise CalculatorError(f"Unsupported attribute: {ast.unparse(node)}")
+        if isinstance(node, ast.Call):
+            if node.keywords or not isinstance(node.func, (ast.Name, ast.Attribute)):
+                raise CalculatorError("Only positional calls to math functions are allowed")
+            if isinstance(node.func, ast.Name) and not callable(SCALAR_FUNCTIONS.get(node.func.id)):
+                raise CalculatorError(f"Unknown function: {node.func.id}")
+        if isinstance(node, ast.Name) and node.id != 'math' and node.id not in SCALAR_FUNCTIONS:
+            variables.add(node.id)
+    return variables
+
+class CompiledExpression:
+    def __init__(self, source, code, variables):
+        self.source = source
+        self.code = code
+        self.variables = variables
+
+    def __call__(self, **values):
+        return check_result(self._eval(SCALAR_FUNCTIONS, values))
+
+    def vectorized(self, **arrays):
+        # Evaluate element-wise over NumPy arrays (falls back to a Python loop without NumPy)
+        if np is None:
+            names = list(arrays)
+            return [self(**dict(zip(names, row))) for row in zip(*arrays.values())]
+        with np.errstate(all='ignore'):
+            return np.broadcast_to(self._eval(VECTOR_FUNCTIONS, arrays), np.broadcast(*arrays.values()).shape)
+
+    def _eval(self, functions, values):
+        missing = self.variables - set(values)
+        if missing:
+            raise CalculatorError(f"Unknown name(s): {', '.join(sorted(missing))}")
+        scope = {**functions, "math": MATH_NAMESPACES[id(functions)], "__pow__": safe_pow, "__mul__": safe_mul,
+                 "__builtins__": {}}
+        scope.update(values)
+        return eval(self.code, scope)
+
+VECTOR_FUNCTIONS = vector_functions() if np is not None else SCALAR_FUNCTIONS
+MATH_NAMESPACES = {id(SCALAR_FUNCTIONS): MathNamespace(SCALAR_FUNCTIONS),
+                   id(VECTOR_FUNCTIONS): MathNamespace(VECTOR_FUNCTIONS)}
+
+@functools.lru_cache(maxsize=1024)
+def compile_expression(source):
+    source = source.strip()
+    if len(source) > 2000:
+        raise CalculatorError("Expression too long")
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError as e:
+        raise CalculatorError(f"Invalid expression: {e.msg}")
+    variables = validate(tree)
+    tree = ast.fix_missing_locations(RewriteGrowth().visit(tree))
+    return CompiledExpression(source, compile(tree, '<calculator>', 'eval'), frozenset(variables))
+
+REDUCERS = {
+    "sum": lambda values: sum(values) if np is None else np.sum(values),
+    "min": min if np is None else np.min,
+    "max": max if np is None else np.max,
+    "mean": (lambda values: sum(values) / len(values)) if np is None else np.mean,
+}
+
+def evaluate_range(expression, variable, start, stop, step=1, reduce=None):
+    # Evaluate expression for variable in start..stop (inclusive), optionally reduced to one value
+    compiled = compile_expression(expression)
+    if (stop - start) / step > 10_000_000:
+        raise CalculatorError("Range too large (limit 10,000,000 points)")
+    if np is not None:
+        points = np.arange(start, stop + step / 2 if isinstance(step, float) else stop + 1, step)
+    else:
+        points = range(int(start), int(stop) + 1, int(step))
+    values = compiled.vectorized(**{variable: points})
+    if np is not None and np.issubdtype(values.dtype, np.integer):
+        # int64 wraps silently; redo in float64 when the exact result would not fit
+        approx = compiled.vectorized(**{variable: points.astype(float)})
+        if np.abs(approx).max(initial=0) >= 2 ** 62 or (reduce == "sum" and abs(approx.sum()) >= 2 ** 62):
+            values = approx
+    if reduce:
+        if reduce not in REDUCERS:
+            raise CalculatorError(f"Unknown reduce '{reduce}', use one of {', '.join(REDUCERS)}")
+        return REDUCERS[reduce](values)
+    return values
+
+def calculate(tool_input):
+    # Calculator tool entry point: an expression string, or a dict describing a range evaluation
+    try:
+        if isinstance(tool_input, dict):
+            start, stop, *step = tool_input["range"]
+            result = evaluate_range(tool_input["expression"], tool_input.get("variable", "x"), start, stop,
+                                    step[0] if step else 1, tool_input.get("reduce"))
+            if np is not None and isinstance(result, np.ndarray) or isinstance(result, list):
+                values = list(result)
+                preview = ", ".join(str(v) for v in values[:10])
+                return f"{len(values)} values: [{preview}{', ...' if len(values) > 10 else ''}]"
+            return result.item() if np is not None and isinstance(result, np.generic) else result
+        return compile_expression(str(tool_input))()
+    except Exception as e:
+        return f"Error: {str(e)}"
@@ -2,62 +2,168 @@ import groq
 import time
 import os
 import json
-import math
 import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from exa_py import Exa
 import requests
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from step_stream import StepStreamParser, iter_chunk_text
+from step_parser import load_step, recover_step
+from response_cache import default_cache, request_key
+from scheduler import scheduler, estimate_tokens
+from telemetry import NULL_SPAN, response_usage
+from step_controller import StepController
+from checkpoint import default_checkpoints, is_error_step
+from model_router import FixedRoute, LARGE_MODEL, default_router
+from tool_cache import cached_tool, tool_cache
+from sandbox_pool import SandboxPool
+from calculator import calculate
+
 # Initialize the Groq and Exa clients
-client = groq.Groq()
+client = groq.Groq(max_retries=0)  # retries and backoff are handled by the shared scheduler
 exa = Exa(api_key=os.environ.get("EXA_API_KEY"))
 
-model = "llama-3.1-70b-versatile"
+MODEL = LARGE_MODEL
+
+# Shared response cache consulted by every API call; set to None to always hit the API
+cache = default_cache()
+
+# Optional telemetry.Tracer; when set, every chain records spans for its steps, API attempts,
+# retries and tool calls
+tracer = None
+
+# Chain checkpoints, off unless G1_CHECKPOINTS or G1_CHECKPOINT_DB is set (see checkpoint.py).
+# Chains run with a chain_id are saved after every step, tool results included, so an interrupted
+# chain resumes without calling the model or the tools again. A finished chain's checkpoint is
+# dropped rather than replayed, since its search and tool results go stale
+checkpoints = default_checkpoints()
+
+# model_router.ModelRouter sending easy steps to a small, fast model and escalating to the large
+# one, always for steps that read tool results; off unless G1_MODEL_CASCADE=on, None sends every
+# call to MODEL
+router = default_router()
+
+def build_request(messages, max_tokens, is_final_answer=False, model=None, stream=False):
+    # JSON mode cannot be streamed; streamed steps rely on StepStreamParser and step_parser instead
+    request = {"model": model or MODEL, "messages": messages, "max_tokens": max_tokens, "temperature": 0.2}
+    if not is_final_answer and not stream:
+        request["response_format"] = {"type": "json_object"}
+    return request
 
-def make_api_call(messages, max_tokens, is_final_answer=False, custom_client=None):
-    global client
-    if custom_client is not None:
-        client = custom_client
+def make_api_call(messages, max_tokens, is_final_answer=False, custom_client=None, span=NULL_SPAN, model=None):
+    api_client = custom_client if custom_client is not None else client  # not the global, which concurrent chains share
 
-    for attempt in range(3):
+    request = build_request(messages, max_tokens, is_final_answer, model)
+    key = request_key(**request) if cache is not None else None
+    cached = cache.get(key) if key else None
+    if cached is not None:
+        span.set(cache_hit=True)
+        return cached if is_final_answer else json.loads(cached)
+
+    tokens = estimate_tokens(messages, max_tokens)
+    for attempt in range(scheduler.max_attempts):
+        queue_time = scheduler.acquire(tokens)
+        attempt_span = span.child("api_attempt", model=request["model"], attempt=attempt, queue_time=queue_time)
         try:
+            response = api_client.chat.completions.create(**request)
+            content = response.choices[0].message.content
             if is_final_answer:
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    max_tokens=max_tokens,
-                    temperature=0.2,
-                )
-                return response.choices[0].message.content
+                result = content
             else:
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    max_tokens=max_tokens,
-                    temperature=0.2,
-                    response_format={"type": "json_object"},
-                )
-                return json.loads(response.choices[0].message.content)
+                result, content = load_step(content, attempt_span)
+            attempt_span.end(status="ok", **response_usage(response))
+            if key:
+                cache.put(key, content)
+            return result
         except Exception as e:
-            if attempt == 2:
+            # JSON mode rejects a malformed step with the model's text attached; repair it if possible
+            recovered = None if is_final_answer else recover_step(e, attempt_span)
+            if recovered is not None:
+                result, content = recovered
+                attempt_span.end(status="repaired")
+                if key:
+                    cache.put(key, content)
+                return result
+            attempt_span.end(status="error", error=str(e))
+            try:
+                scheduler.backoff(attempt, e)
+            except Exception:
                 if is_final_answer:
                     return {
                         "title": "Error",
-                        "content": f"Failed to generate final answer after 3 attempts. Error: {str(e)}",
+                        "content": f"Failed to generate final answer after {attempt + 1} attempts. Error: {str(e)}",
                     }
                 else:
                     return {
                         "title": "Error",
-                        "content": f"Failed to generate step after 3 attempts. Error: {str(e)}",
+                        "content": f"Failed to generate step after {attempt + 1} attempts. Error: {str(e)}",
                         "next_action": "final_answer",
                     }
-            time.sleep(1)  # Wait for 1 second before retrying
 
-def calculate(expression):
-    try:
-        return eval(expression, {"__builtins__": None}, {"math": math})
-    except Exception as e:
-        return f"Error: {str(e)}"
+def stream_api_call(messages, max_tokens, is_final_answer=False, custom_client=None, span=NULL_SPAN, model=None):
+    # Streaming variant of make_api_call. Yields the partially parsed step dict (or the final
+    # answer text so far) as chunks arrive; the last value yielded is the complete result.
+    api_client = custom_client if custom_client is not None else client  # not the global, which concurrent chains share
+
+    request = build_request(messages, max_tokens, is_final_answer, model, stream=True)
+    key = request_key(**request) if cache is not None else None
+    cached = cache.get(key) if key else None
+    if cached is not None:
+        span.set(cache_hit=True)
+        yield cached if is_final_answer else json.loads(cached)
+        return
+
+    tokens = estimate_tokens(messages, max_tokens)
+    for attempt in range(scheduler.max_attempts):
+        queue_time = scheduler.acquire(tokens)
+        attempt_span = span.child("api_attempt", model=request["model"], attempt=attempt, queue_time=queue_time)
+        try:
+            usage = {}
+            started = time.perf_counter()
+            response = api_client.chat.completions.create(**request, stream=True)
+            if is_final_answer:
+                text = ""
+                for delta in iter_chunk_text(response, usage):
+                    if not text:
+                        attempt_span.set(time_to_first_token=time.perf_counter() - started)
+                    text += delta
+                    yield text
+                result = text
+            else:
+                parser = StepStreamParser()
+                for i, delta in enumerate(iter_chunk_text(response, usage)):
+                    if i == 0:
+                        attempt_span.set(time_to_first_token=time.perf_counter() - started)
+                    yield dict(parser.feed(delta))
+                result, text = load_step(parser.text(), attempt_span)
+                yield result
+            attempt_span.end(status="ok", **usage)
+            if key:
+                cache.put(key, text)
+            return
+        except Exception as e:
+            attempt_span.end(status="error", error=str(e))
+            try:
+                scheduler.backoff(attempt, e)
+            except Exception:
+                if is_final_answer:
+                    yield {
+                        "title": "Error",
+                        "content": f"Failed to generate final answer after {attempt + 1} attempts. Error: {str(e)}",
+                    }
+                else:
+                    yield {
+                        "title": "Error",
+                        "content": f"Failed to generate step after {attempt + 1} attempts. Error: {str(e)}",
+                        "next_action": "final_answer",
+                    }
+                return
 
+# Tool results are cached per tool for these many seconds; see tool_cache.tool_cache.stats()
+@cached_tool('wolfram_alpha', ttl=24 * 3600)
 def wolfram_alpha_calculate(query):
     app_id = os.environ.get('WOLFRAM_APP_ID')
     if not app_id:
@@ -90,6 +196,7 @@ def wolfram_alpha_calculate(query):
     except Exception as e:
         return f"An error occurred: {str(e)}"
 
+@cached_tool('web_search', ttl=600)
 def web_search(query, num_results=5):
     try:
         # Perform a neural search using Exa and retrieve up to 'num_results'
@@ -117,6 +224,7 @@ def web_search(query, num_results=5):
     except Exception as e:
         return f"An error occurred while using Exa API: {str(e)}"
 
+@cached_tool('fetch_page_content', ttl=3600)
 def fetch_page_content(ids):
     try:
         # Fetch content of the provided IDs using Exa
@@ -133,7 +241,25 @@ def fetch_page_content(ids):
     except Exception as e:
         return f"An error occurred while retrieving page content: {str(e)}"
 
+# Warm worker pool for execute_code, started on first use. Set to False to spawn a fresh
+# interpreter per call instead (also the behaviour on platforms without fork/select).
+sandbox_pool = None if os.name == 'posix' else False
+sandbox_pool_lock = threading.Lock()
+
+def get_sandbox_pool():
+    global sandbox_pool
+    with sandbox_pool_lock:
+        if sandbox_pool is None:
+            sandbox_pool = SandboxPool(size=int(os.environ.get("G1_SANDBOX_WORKERS", 2)))
+        return sandbox_pool
+
 def execute_code(code):
+    pool = get_sandbox_pool()
+    if pool:
+        try:
+            return pool.execute(code, timeout=5)
+        except Exception as e:
+            return f"Error: {str(e)}"
     try:
         # Execute the code in a subprocess for safety
         result = subprocess.run(
@@ -149,19 +275,99 @@ def execute_code(code):
     except Exception as e:
         return f"Error: {str(e)}"
 
+# Per-tool timeouts in seconds. A call that overruns is reported to the model as an error.
+TOOL_TIMEOUTS = {
+    'calculator': 2,
+    'code_executor': 10,
+    'web_search': 15,
+    'fetch_page_content': 20,
+    'wolfram_alpha': 10,
+}
+
+# Bounded pool shared by all chains in the process for running tool calls concurrently
+TOOL_WORKERS = 8
+tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="g1-tool")
+tool_executor_lock = threading.Lock()
+# Timed-out calls still running on tool_executor. A thread cannot be stopped, so such a call keeps
+# its worker until it returns; once they hold half the workers, new calls go to a fresh pool and
+# the old one is left to finish them, so a few hung tools cannot starve every later chain.
+hung_tools = set()
+
+def abandon_tool(future):
+    global tool_executor, hung_tools
+    if future.cancel():
+        return
+    with tool_executor_lock:
+        hung_tools.add(future)
+        future.add_done_callback(hung_tools.discard)
+        if len(hung_tools) >= TOOL_WORKERS // 2:
+            tool_executor.shutdown(wait=False)
+            tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="g1-tool")
+            hung_tools = set()
+
+def submit_tool(call):
+    with tool_executor_lock:
+        return tool_executor.submit(run_tool, call)
 
-def generate_response(prompt, custom_client=None):
+def run_tool(call):
+    if call.get('tool') == 'calculator':
+        return calculate(call.get('tool_input'))
+    elif call.get('tool') == 'code_executor':
+        return execute_code(call.get('tool_input'))
+    elif call.get('tool') == 'web_search':
+        num_results = call.get('num_results', 5)
+        return web_search(call.get('tool_input'), num_results)
+    elif call.get('tool') == 'fetch_page_content':
+        ids = call.get('tool_input')
+        if not isinstance(ids, list):
+            ids = [ids]
+        return fetch_page_content(ids)
+    elif call.get('tool') == 'wolfram_alpha':
+        return wolfram_alpha_calculate(call.get('tool_input'))
+    else:
+        return f"Error: Unknown tool '{call.get('tool')}'"
+
+def run_tools(calls, span=NULL_SPAN):
+    # Run every tool call of a step at once, so the step costs as long as its slowest call
+    start = time.monotonic()
+    tool_spans = [span.child("tool", tool=call.get('tool')) for call in calls]
+    futures = [submit_tool(call) for call in calls]
+    results = []
+    for call, future, tool_span in zip(calls, futures, tool_spans):
+        timeout = TOOL_TIMEOUTS.get(call.get('tool'), 10)
+        try:
+            results.append(future.result(timeout=max(0, start + timeout - time.monotonic())))
+            tool_span.end(status="ok")
+        except FutureTimeoutError:
+            abandon_tool(future)
+            results.append(f"Error: Tool '{call.get('tool')}' timed out after {timeout} seconds")
+            tool_span.end(status="timeout")
+        except Exception as e:
+            results.append(f"Error: {str(e)}")
+            tool_span.end(status="error", error=str(e))
+    return results
+
+
+def generate_response(prompt, custom_client=None, stream=False, compactor=None, controller=None, chain_id=None):
+    # With stream=True, partial steps are yielded as tokens arrive and every step tuple carries
+    # a trailing element: the time to its first visible token, in seconds.
+    # Pass a context_window.ContextCompactor to keep the prompt under a token budget, and a
+    # step_controller.StepController for a deadline, token budget or cancellation.
+    # With checkpoints enabled, a chain given a chain_id is checkpointed under it and resumes from
+    # its last completed step when run again with the same ID; chains without one are not saved.
     messages = [
         {
             "role": "system",
             "content": """You are an expert AI assistant that explains your reasoning step by step. For each step, provide a title that describes what you're doing in that step, along with the content. Decide if you need another step or if you're ready to give the final answer. Respond in JSON format with 'title', 'content', and 'next_action' (either 'continue' or 'final_answer') keys.
 
 You can also use tools by including:
-- A 'tool' key with one of the following values: 'code_executor', 'web_search', 'fetch_page_content', or 'wolfram_alpha'.
+- A 'tool' key with one of the following values: 'calculator', 'code_executor', 'web_search', 'fetch_page_content', or 'wolfram_alpha'.
 - A 'tool_input' key with the expression, code to execute, search query, or list of IDs.
 - For 'web_search', you can specify the number of results (default is 5) by adding a 'num_results' key.
 - For 'fetch_page_content', provide a list of IDs (from previous web search results) in 'tool_input'.
 - When using 'wolfram_alpha', provide your query as 'tool_input'; the assistant will use the Wolfram Alpha API to compute the result.
+- For 'calculator', provide an arithmetic expression (math functions such as sqrt, sin or factorial are available) as 'tool_input'. To evaluate an expression over a whole range in one call, provide an object instead, e.g. {"expression": "x**2 + 1", "variable": "x", "range": [1, 1000000], "reduce": "sum"} ('reduce' is optional: sum, min, max or mean).
+- To use several tools in one step, provide a 'tool_calls' key instead: a list of objects that each have their own 'tool', 'tool_input' and optional 'num_results'. They run in parallel and all results are returned together, so batch independent searches and fetches into a single step.
 
 When using 'web_search', the tool result will include IDs for each result, which you can use with 'fetch_page_content'. If you cannot find information in a website, try another one, up to 5 times.
 CONFIRM ALL PREVIEW HIGHLIGHTS FROM 'web_search' by calling 'fetch_page_content' to get the most up to date information.
@@ -186,38 +392,81 @@ Example of a valid JSON response:
         },
     ]
 
+    header_len = len(messages)
+    chain_span = tracer.start("chain", prompt_chars=len(prompt)) if tracer else NULL_SPAN
     steps = []
     step_count = 1
     total_thinking_time = 0
+    controller = controller or StepController()
+    route = router.route() if router is not None else FixedRoute(MODEL)
+
+    # Pick up where an earlier run of this chain stopped (see checkpoint.py)
+    store = checkpoints if chain_id else None
+    stage = "steps"
+    resumed = store.resume(chain_id, 6, stream, controller) if store is not None else None
+    if resumed and resumed[4] != "done":
+        messages, steps, step_count, total_thinking_time, stage = resumed
+        chain_span.set(resumed_from=step_count, resumed_stage=stage)
+        yield steps, None
 
-    while True:
+    while stage == "steps":
         start_time = time.time()
-        step_data = make_api_call(messages, 300, custom_client=custom_client)
+        prompt_messages = compactor.compact(messages, header_len) if compactor else messages
+        step_span = chain_span.child("step", step=step_count)
+        # A step the router's small model failed or was unsure of is asked again of the large model
+        model = route.choose(step_count, prompt_messages)
+        while model:
+            if stream:
+                first_token_time = None
+                for step_data in stream_api_call(prompt_messages, controller.step_max_tokens(prompt_messages), custom_client=custom_client, span=step_span, model=model):
+                    if controller.cancelled:
+                        break
+                    if first_token_time is None and (step_data.get('title') or step_data.get('content')):
+                        first_token_time = time.time() - start_time
+                    yield steps + [
+                        (
+                            f"Step {step_count}: {step_data.get('title', '')}",
+                            step_data.get('content', ''),
+                            time.time() - start_time,
+                            step_data.get('tool'),
+                            step_data.get('tool_input'),
+                            None,
+                            first_token_time
+                        )
+                    ], None
+            else:
+                step_data = make_api_call(prompt_messages, controller.step_max_tokens(prompt_messages), custom_client=custom_client, span=step_span, model=model)
+            next_model = None if controller.cancelled else route.next_model(model, step_data)
+            if next_model:
+                # The call being escalated is charged too; the kept one is recorded below
+                controller.record(prompt_messages, json.dumps(step_data))
+            model = next_model
         end_time = time.time()
         thinking_time = end_time - start_time
         total_thinking_time += thinking_time
+        if controller.cancelled:
+            step_span.end(cancelled=True)
+            chain_span.end(steps=step_count, stop="cancelled")
+            return
 
-        if 'tool' in step_data:
-            if step_data['tool'] == 'calculator':
-                tool_result = calculate(step_data['tool_input'])
-            elif step_data['tool'] == 'code_executor':
-                tool_result = execute_code(step_data['tool_input'])
-            elif step_data['tool'] == 'web_search':
-                num_results = step_data.get('num_results', 5)
-                tool_result = web_search(step_data['tool_input'], num_results)
-            elif step_data['tool'] == 'fetch_page_content':
-                ids = step_data['tool_input']
-                if not isinstance(ids, list):
-                    ids = [ids]
-                tool_result = fetch_page_content(ids)
-            elif step_data['tool'] == 'wolfram_alpha':
-                tool_result = wolfram_alpha_calculate(step_data['tool_input'])
-            else:
-                tool_result = f"Error: Unknown tool '{step_data['tool']}'"
-            step_data['tool_result'] = tool_result
+        tool_calls = step_data.get('tool_calls')
+        if isinstance(tool_calls, list):
+            tool_calls = [call for call in tool_calls if isinstance(call, dict)]
+            step_data['tool_results'] = run_tools(tool_calls, span=step_span)
+        elif 'tool' in step_data:
+            step_data['tool_result'] = run_tools([step_data], span=step_span)[0]
 
-        steps.append(
-            (
+        if 'tool_results' in step_data:
+            step = (
+                f"Step {step_count}: {step_data['title']}",
+                step_data['content'],
+                thinking_time,
+                [call.get('tool') for call in tool_calls],
+                [call.get('tool_input') for call in tool_calls],
+                step_data['tool_results']
+            )
+        else:
+            step = (
                 f"Step {step_count}: {step_data['title']}",
                 step_data['content'],
                 thinking_time,
@@ -225,18 +474,37 @@ Example of a valid JSON response:
                 step_data.get('tool_input'),
                 step_data.get('tool_result')
             )
-        )
+        steps.append(step + (first_token_time,) if stream else step)
 
         messages.append({"role": "assistant", "content": json.dumps(step_data)})
+        step_span.end(title=step_data['title'])
         if 'tool_result' in step_data:
             messages.append(
                 {"role": "system", "content": f"Tool result: {step_data['tool_result']}"}
             )
+        elif step_data.get('tool_results'):
+            results = "\n\n".join(
+                f"[{i + 1}] {call.get('tool')}: {result}"
+                for i, (call, result) in enumerate(zip(tool_calls, step_data['tool_results']))
+            )
+            messages.append({"role": "system", "content": f"Tool results:\n{results}"})
 
-        if step_data['next_action'] == 'final_answer' or step_count > 25:
+        # Charge the model's own output; tool results are counted when they are sent with the next prompt
+        completion = {key: value for key, value in step_data.items() if key not in ('tool_result', 'tool_results')}
+        controller.record(prompt_messages, json.dumps(completion), thinking_time)
+        if controller.should_stop(step_count, step_data, messages):
+            if store is not None and not is_error_step(step_data):
+                store.save(chain_id, "final_answer", messages, steps, step_count, total_thinking_time, controller)
             break
 
+        # Nudge a chain that keeps repeating itself (see repetition.py)
+        steering = controller.steering_message()
+        if steering:
+            messages.append(steering)
+
         step_count += 1
+        if store is not None and not is_error_step(step_data):
+            store.save(chain_id, "steps", messages, steps, step_count, total_thinking_time, controller)
 
         # Yield after each step if needed
         yield steps, None  # Uncomment if using a generator
@@ -250,12 +518,38 @@ Example of a valid JSON response:
     )
 
     start_time = time.time()
-    final_data = make_api_call(messages, 1200, is_final_answer=True, custom_client=custom_client)
+    prompt_messages = compactor.compact(messages, header_len) if compactor else messages
+    final_span = chain_span.child("final_answer")
+    model = route.choose(step_count, prompt_messages, is_final_answer=True)
+    if stream:
+        first_token_time = None
+        for final_data in stream_api_call(prompt_messages, controller.final_max_tokens(prompt_messages), is_final_answer=True, custom_client=custom_client, span=final_span, model=model):
+            if controller.cancelled:
+                break
+            if first_token_time is None and final_data:
+                first_token_time = time.time() - start_time
+            yield steps + [("Final Answer", final_data, time.time() - start_time, first_token_time)], None
+    else:
+        final_data = make_api_call(prompt_messages, controller.final_max_tokens(prompt_messages), is_final_answer=True, custom_client=custom_client, span=final_span, model=model)
+    route.next_model(model, final_data)
     end_time = time.time()
     thinking_time = end_time - start_time
     total_thinking_time += thinking_time
+    if controller.cancelled:
+        final_span.end(cancelled=True)
+        chain_span.end(steps=step_count, stop="cancelled")
+        return
+
+    if stream:
+        steps.append(("Final Answer", final_data, thinking_time, first_token_time))
+    else:
+        steps.append(("Final Answer", final_data, thinking_time))
 
-    steps.append(("Final Answer", final_data, thinking_time))
+    final_span.end()
+    controller.record(prompt_messages, final_data)
+    if store is not None and not is_error_step(final_data):
+        store.delete(chain_id)  # finished; a rerun should search and call its tools afresh
+    chain_span.end(steps=step_count, total_thinking_time=total_thinking_time, stop=controller.stop, tokens_used=controller.tokens_used)
 
     # Return the steps and total thinking time
     yield steps, total_thinking_time
@@ -0,0 +1,116 @@
+import json
+import os
+import queue
+import select
+import subprocess
+import sys
+import threading
+
+# Pool of pre-started Python workers for execute_code. Each worker has its preloaded modules
+# imported already and forks a child per call (see sandbox_worker.py), so a call costs a pipe round
+# trip and a fork instead of interpreter startup plus imports, and no state carries over from one
+# call to the next. Children run under a memory rlimit and a per-call CPU rlimit; the worker kills
+# a child that overruns its timeout. Workers are replaced after a number of executions or when one
+# stops answering.
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_worker.py')
+
+DEFAULT_PRELOAD = ('math', 'statistics', 'fractions', 'decimal', 'itertools', 'collections', 'numpy', 'sympy')
+
+def limit_memory(memory_mb):
+    # Inherited by every child the worker forks. CPU time is limited per child instead, since
+    # RLIMIT_CPU on the worker would count its whole lifetime.
+    def apply():
+        import resource
+        memory = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    return apply
+
+class SandboxWorker:
+    def __init__(self, preload, max_output, memory_mb, cpu_seconds):
+        self.executions = 0
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, json.dumps(list(preload)), str(max_output), str(cpu_seconds)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            env={"PYTHONPATH": os.getcwd()},
+            preexec_fn=limit_memory(memory_mb),
+        )
+        self.ready = self._read(timeout=60) is not None
+
+    def run(self, code, timeout):
+        # Returns the reply dict, or None if the worker stopped answering or died. The worker
+        # enforces the timeout itself; the extra seconds here only catch a stuck worker.
+        try:
+            self.process.stdin.write(json.dumps({"code": code, "timeout": timeout}) + "\n")
+            self.process.stdin.flush()
+        except OSError:
+            return None
+        self.executions += 1
+        return self._read(timeout + 5)
+
+    def _read(self, timeout):
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            return None
+        line = self.process.stdout.readline()
+        return json.loads(line) if line else None
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.wait(timeout=1)
+        except Exception:
+            pass
+
+class SandboxPool:
+    def __init__(self, size=2, preload=DEFAULT_PRELOAD, max_executions=500, memory_mb=1024,
+                 cpu_seconds=10, max_output=20000):
+        # cpu_seconds: CPU time allowed to each call
+        self.size = size
+        self.preload = preload
+        self.max_executions = max_executions
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.max_output = max_output
+        self.recycled = 0
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._replace()
+
+    def execute(self, code, timeout=5):
+        try:
+            worker = self._idle.get(timeout=30)
+        except queue.Empty:
+            return "Error: No code execution worker available"
+        reply = worker.run(code, timeout)
+        if reply is None:
+            timed_out = worker.process.poll() is None
+            worker.kill()
+            threading.Thread(target=self._replace, daemon=True).start()
+            return "Error: Code execution timed out" if timed_out else "Error: Code execution failed (worker exited)"
+        if worker.executions >= self.max_executions:
+            worker.kill()
+            self.recycled += 1
+            threading.Thread(target=self._replace, daemon=True).start()
+        else:
+            self._idle.put(worker)
+        output = reply["stdout"]
+        if len(output) >= self.max_output:
+            output += "\n[output truncated]"
+        return output if reply["ok"] else f"Error: {reply['stderr']}"
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().kill()
+
+    def _replace(self):
+        # Start a worker and make it available; gives up after three failed starts
+        for _ in range(3):
+            worker = SandboxWorker(self.preload, self.max_output, self.memory_mb, self.cpu_seconds)
+            if worker.ready:
+                self._idle.put(worker)
+                return
+            worker.kill()
@@ -0,0 +1,125 @@
+import contextlib
+import io
+import json
+import os
+import select
+import signal
+import sys
+import time
+import traceback
+
+# Code execution worker started by sandbox_pool.SandboxPool. The worker itself only imports the
+# preloaded modules and never runs submitted code: it reads one JSON request per line on the
+# protocol pipe, forks a child that runs the code in a fresh namespace, and writes one JSON reply
+# per line. The child gets the warm imports through fork, and whatever it changes (module
+# attributes, builtins, sys.modules) dies with it, so every call starts from the same state.
+# argv: JSON list of modules to import up front, max output characters, CPU seconds per call.
+
+def run_child(code, max_output, cpu_seconds, reply_fd):
+    # Runs in the forked child and never returns
+    try:
+        os.setsid()  # so a timeout can kill anything the code started as well
+        import resource
+        # CPU time restarts at zero in a forked child, so this limit applies to this call only
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    except (ImportError, OSError, ValueError):
+        pass
+    stdout, stderr = io.StringIO(), io.StringIO()
+    ok = True
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            exec(compile(code, "<code>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+        except SystemExit as e:
+            ok = e.code in (None, 0)
+        except BaseException:
+            ok = False
+            # Drop this module's frame so the traceback starts at the submitted code
+            error_type, error, tb = sys.exc_info()
+            traceback.print_exception(error_type, error, tb.tb_next)
+    try:
+        reply = json.dumps({
+            "ok": ok,
+            "stdout": stdout.getvalue()[:max_output],
+            "stderr": stderr.getvalue()[-max_output:],
+        }).encode()
+        while reply:
+            reply = reply[os.write(reply_fd, reply):]
+    finally:
+        os._exit(0)
+
+def run_call(code, timeout, max_output, cpu_seconds, protocol_fds):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        for fd in (read_fd, *protocol_fds):
+            os.close(fd)
+        run_child(code, max_output, cpu_seconds, write_fd)
+    os.close(write_fd)
+    chunks = []
+    timed_out = False
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([read_fd], [], [], remaining)[0]:
+                timed_out = True
+                break
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(read_fd)
+        if timed_out:
+            with contextlib.suppress(OSError):
+                os.killpg(pid, signal.SIGKILL)
+            with contextlib.suppress(OSError):
+                os.kill(pid, signal.SIGKILL)
+        _, status = os.waitpid(pid, 0)
+    if timed_out:
+        return {"ok": False, "timeout": True, "stdout": "", "stderr": "Code execution timed out"}
+    try:
+        return json.loads(b"".join(chunks))
+    except ValueError:
+        pass  # no reply, or one cut short
+    if os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGXCPU:
+        return {"ok": False, "stdout": "", "stderr": "CPU time limit exceeded"}
+    return {"ok": False, "stdout": "", "stderr": "Code exited without a result"}
+
+def main():
+    preload = json.loads(sys.argv[1]) if len(sys.argv) > 1 else []
+    max_output = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    cpu_seconds = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    # Keep the real pipes for the protocol and point fds 0/1 at /dev/null, so code writing to the
+    # raw file descriptors (os.write, child processes) cannot corrupt the reply stream. Each
+    # child closes the protocol pipes before any code runs.
+    requests = os.fdopen(os.dup(0), 'r')
+    replies = os.fdopen(os.dup(1), 'w')
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+
+    for name in preload:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+
+    replies.write(json.dumps({"ready": True}) + "\n")
+    replies.flush()
+
+    for line in requests:
+        request = json.loads(line)
+        pid = os.getpid()
+        try:
+            reply = run_call(request["code"], request.get("timeout", 5), max_output, cpu_seconds,
+                             (requests.fileno(), replies.fileno()))
+        finally:
+            if os.getpid() != pid:
+                os._exit(1)  # the child must never get back to the protocol loop
+        replies.write(json.dumps(reply) + "\n")
+        replies.flush()
+
+if __name__ == "__main__":
+    main()
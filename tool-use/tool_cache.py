@@ -0,0 +1,89 @@
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# TTL cache for tool results shared by every chain in the process. Identical calls that arrive
+# while one is already running wait for it instead of issuing their own upstream request.
+
+def is_error_result(result):
+    return isinstance(result, str) and result.startswith(("Error", "An error occurred"))
+
+class ToolCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def call(self, tool, ttl, key, fn):
+        cache_key = (tool, key)
+        leader = False
+        with self._lock:
+            stats = self._stats.setdefault(tool, {"hits": 0, "misses": 0, "coalesced": 0, "calls": 0, "latency": 0.0})
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(cache_key)
+                stats["hits"] += 1
+                return entry[1]
+            future = self._inflight.get(cache_key)
+            if future is not None:
+                stats["coalesced"] += 1
+            else:
+                future = Future()
+                self._inflight[cache_key] = future
+                stats["misses"] += 1
+                leader = True
+        if not leader:
+            return future.result()
+
+        start = time.monotonic()
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[cache_key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            stats["calls"] += 1
+            stats["latency"] += time.monotonic() - start
+            if not is_error_result(result):
+                self._entries[cache_key] = (time.monotonic() + ttl, result)
+                self._entries.move_to_end(cache_key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            del self._inflight[cache_key]
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            report = {}
+            for tool, stats in self._stats.items():
+                lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+                report[tool] = {
+                    **stats,
+                    "hit_rate": (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0,
+                    "avg_latency": stats["latency"] / stats["calls"] if stats["calls"] else 0.0,
+                }
+            return report
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+tool_cache = ToolCache()
+
+def cached_tool(tool, ttl):
+    # Route calls to the decorated tool function through the shared tool_cache
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = json.dumps([args, kwargs], sort_keys=True, default=str)
+            return tool_cache.call(tool, ttl, key, lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator